@@ -0,0 +1,61 @@
+import io
+import os
+import csv
+import time
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from run import Plan
+
+
+
+# Run many project dirs on a process pool. A failing project is recorded in
+# the manifest and does not stop the others.
+
+def run_project(proj_dir, cache=None):
+	""" run a single project in a worker, errors are returned and not raised """
+
+	start_time = time.perf_counter()
+
+	try:
+		with contextlib.redirect_stdout(io.StringIO()):
+			plan = Plan(proj_dir, cache=cache)
+			plan.detailed_month_dir = proj_dir # workers must not share the current dir
+			bank = plan.run()
+	except Exception as error:
+		return [proj_dir, "error", round(time.perf_counter() - start_time, 4), "", f"{type(error).__name__}: {error}"]
+
+	return [proj_dir, "ok", round(time.perf_counter() - start_time, 4), bank, ""]
+
+
+def write_manifest(csv_file_name, results):
+	with open(csv_file_name, 'w', newline='') as csvfile:
+		writer = csv.writer(csvfile)
+		writer.writerow(['PROJECT', 'STATUS', 'WALL_TIME', 'BANK', 'ERROR'])
+		for result in results:
+			writer.writerow(result)
+
+
+def run_batch(proj_dirs, manifest_file_name, jobs=None, cache=None):
+	""" run all the projects, return the number of failed ones """
+
+	jobs = jobs or os.cpu_count()
+	results = dict() # project dir / manifest row
+
+	start_time = time.perf_counter()
+
+	with ProcessPoolExecutor(max_workers=min(jobs, len(proj_dirs))) as executor:
+		futures = {executor.submit(run_project, proj_dir, cache): proj_dir for proj_dir in proj_dirs}
+		for future in as_completed(futures):
+			try:
+				result = future.result()
+			except Exception as error: # the worker itself died
+				result = [futures[future], "error", "", "", f"{type(error).__name__}: {error}"]
+			results[result[0]] = result
+			print (f"{result[1]:5} {result[0]}")
+
+	write_manifest(manifest_file_name, [results[proj_dir] for proj_dir in proj_dirs])
+
+	failed = sum(1 for result in results.values() if result[1] != "ok")
+	print (f"{len(proj_dirs)} projects, {failed} failed, {time.perf_counter() - start_time:.3f}s")
+
+	return failed
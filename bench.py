@@ -0,0 +1,437 @@
+import io
+import csv
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+import subprocess
+import numpy as np
+from datetime import datetime, date, timedelta
+from dateutil.relativedelta import relativedelta
+from run import Plan, get_next_first_of_month
+from cache import Cache
+from child_rules import LEAVE_WEEKS
+from month_calendar import to_ordinal
+
+
+
+# Benchmark of the planning pipeline on synthetic households.
+#
+# Every scenario writes a generated input_files/ tree, runs the phases of
+# Plan.build and write_cash_flow one by one and reports the best time of
+# every phase, the throughput in event-months (ledger cells written by the
+# events) per second and the peak traced memory. Results are appended to a
+# local json history and compared with the last run of the same scenario.
+#
+# With --check the scenarios are not timed but checked: a plan updated after
+# an edit of its inputs against a full build, plans from the cache against
+# an uncached build, and the events of the default child rules against the
+# hand written child passes they replaced.
+
+CATEGORIES = {
+	"income":  ["salary", "bonus", "rent_in", "dividends"],
+	"expense": ["food", "car", "vacation", "insurance", "clothes", "health", "דיור"],
+}
+PERIODS = ['', '1m', '1m', '3m', '6m', '1y', '1y 6m', '2y']
+AGE_EVENTS_HEADER = ['TYPE', 'CATEGORY', 'NAME', 'SUM', 'FROM', 'UNTIL', 'PERIOD', 'MONTH_START', 'IGNORE']
+
+# name / (children, date events, horizon years, mortgage months)
+SCENARIOS = {
+	"small":  (1,   50,  10, 120),
+	"medium": (3,  500,  40, 300),
+	"large":  (6, 5000, 100, 360),
+}
+
+PHASES = ['config', 'date_events', 'persons', 'mortgage', 'maternity', 'child_rules', 'write_cash_flow']
+SLOWER = 1.2 # a phase this much slower than the last run is reported
+
+
+def write_csv(file_name, header, rows):
+	with open(file_name, 'w', newline='') as csv_file:
+		csv_file.write(','.join(header) + '\n')
+		for row in rows:
+			csv_file.write(','.join(str(value) for value in row) + '\n')
+
+
+def generate_project(proj_dir, n_children, n_date_events, horizon_years, mortgage_months, seed=0):
+	""" write a synthetic input_files/ tree of a household """
+
+	rng = random.Random(seed)
+	input_dir = os.path.join(proj_dir, 'input_files')
+	os.makedirs(input_dir, exist_ok=True)
+
+	start_year = 2022
+	end_year = start_year + horizon_years
+
+	with open(os.path.join(input_dir, 'config.ini'), 'w') as config_file:
+		config_file.write(f"[dates]\nstart_date = 01/01/{start_year}\nend_date = 01/01/{end_year}\n\n")
+		config_file.write(f"[money]\ninitail_saving = {rng.randint(0, 300000)}\n")
+
+	def date_str(year):
+		return f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{year}"
+
+	rows = list()
+	for i in range(n_date_events):
+		event_type = "income" if rng.random() < 0.3 else "expense"
+		start_year_of_event = rng.randint(start_year - 5, end_year)
+		start = "today" if rng.random() < 0.2 else date_str(start_year_of_event)
+		end = "never" if rng.random() < 0.2 else date_str(start_year_of_event + rng.randint(0, horizon_years))
+		ignore = "yes" if rng.random() < 0.05 else ""
+		rows.append([event_type, rng.choice(CATEGORIES[event_type]), f"event {i}", rng.randint(50, 20000), start, end, rng.choice(PERIODS), ignore])
+	write_csv(os.path.join(input_dir, 'date_events.csv'), ['TYPE', 'CATEGORY', 'NAME', 'SUM', 'START', 'END', 'PERIOD', 'IGNORE'], rows)
+
+	persons = [["dad", "dad", date_str(start_year - rng.randint(25, 45)), ""], ["mom", "mom", date_str(start_year - rng.randint(25, 42)), ""]]
+	for i in range(n_children):
+		persons.append([f"child {i}", "child", date_str(rng.randint(start_year - 10, start_year + 10)), ""])
+	write_csv(os.path.join(input_dir, 'persons.csv'), ['NAME', 'TYPE', 'BIRTHDAY', 'IGNORE'], persons)
+
+	write_csv(os.path.join(input_dir, 'dad.csv'), AGE_EVENTS_HEADER, [
+		["income", "salary", "work", rng.randint(10000, 30000), 25, 67, "", "", ""],
+		["", "bonus", "yearly bonus", rng.randint(5000, 30000), 30, 67, "1y", "12", ""],
+		["expense", "car", "fuel", rng.randint(500, 1500), 20, 80, "", "", ""],
+		["expense", "health", "pension fees", 300, 67, 100, "", "", ""],
+	])
+	write_csv(os.path.join(input_dir, 'mom.csv'), AGE_EVENTS_HEADER, [
+		["income", "salary", "work", rng.randint(8000, 25000), 24, 67, "", "", ""],
+		["expense", "food", "lunch", 600, 24, 67, "", "", ""],
+		["expense", "clothes", "clothes", 1500, 20, 90, "6m", "3", ""],
+	])
+	write_csv(os.path.join(input_dir, 'child.csv'), AGE_EVENTS_HEADER, [
+		["expense", "food", "food", 900, 0, 18, "", "", ""],
+		["", "vacation", "summer camp", 3000, 6, 16, "1y", "7", ""],
+		["", "clothes", "clothes", 400, 0, 18, "3m", "0", ""],
+		["", "health", "dentist", 250, 3, 18, "6m", "1", ""],
+	])
+
+	write_csv(os.path.join(input_dir, 'mortgage.csv'), ['SUM'], [[round(rng.uniform(3000, 7000), 2)] for __ in range(mortgage_months)])
+
+
+def event_months(ledger):
+	""" ledger cells written by the live events """
+	return int(ledger.occurrence_counts(np.arange(ledger.n_events)).sum())
+
+
+def run_phases(proj_dir):
+	""" seconds of every phase and the built plan """
+
+	times = dict()
+	with contextlib.redirect_stdout(io.StringIO()):
+
+		start_time = time.perf_counter()
+		plan = Plan(proj_dir)
+		plan.detailed_month_dir = proj_dir
+		times['config'] = time.perf_counter() - start_time
+
+		maternity_pays = dict()
+
+		def create_child_events():
+			plan.child_rules = plan.read_child_rules()
+			plan.create_child_events(maternity_pays)
+
+		phases = [
+			('date_events', lambda: plan.load_date_events(plan.input_file('date_events.csv'))),
+			('persons',     lambda: plan.load_persons(plan.input_file('persons.csv'))),
+			('mortgage',    plan.load_mortgage),
+			('maternity',   lambda: maternity_pays.update(plan.apply_maternity_leaves())),
+			('child_rules', create_child_events),
+			('write_cash_flow', lambda: plan.write_cash_flow(os.path.join(proj_dir, 'cash_flow.csv'))),
+		]
+		for phase, function in phases:
+			start_time = time.perf_counter()
+			function()
+			times[phase] = time.perf_counter() - start_time
+
+	return times, plan
+
+
+def bench_scenario(name, proj_dir, repeat):
+	""" best of repeat runs of every phase, throughput and peak memory """
+
+	best = dict()
+	for __ in range(repeat):
+		times, plan = run_phases(proj_dir)
+		for phase, seconds in times.items():
+			best[phase] = min(seconds, best.get(phase, seconds))
+
+	tracemalloc.start()
+	run_phases(proj_dir)
+	__, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	cells = event_months(plan.ledger)
+	total = sum(best.values())
+
+	return {
+		"scenario": name,
+		"months": plan.ledger.n_months,
+		"events": int(plan.ledger.log.live[:plan.ledger.n_events].sum()),
+		"event_months": cells,
+		"phases": {phase: round(best[phase], 6) for phase in PHASES},
+		"total": round(total, 6),
+		"event_months_per_second": round(cells / total),
+		"peak_memory_mb": round(peak / 2**20, 2),
+	}
+
+
+def edit_inputs(proj_dir, rng):
+	""" change a generated project as a user would between two runs: sums, a removed and an added date event, a birthday, the mom salary and a mortgage payment """
+
+	input_dir = os.path.join(proj_dir, 'input_files')
+
+	def edit(file_name, change):
+		with open(os.path.join(input_dir, file_name), newline='') as csv_file:
+			rows = list(csv.reader(csv_file))
+		change(rows)
+		write_csv(os.path.join(input_dir, file_name), rows[0], rows[1:])
+
+	def date_events(rows):
+		for __ in range(3):
+			rows[rng.randrange(1, len(rows))][3] = rng.randint(50, 20000)
+		added = list(rows.pop(rng.randrange(1, len(rows))))
+		added[2] = "added " + added[2]
+		rows.append(added)
+
+	def persons(rows):
+		children = rows[3:]
+		if children:
+			rng.choice(children)[2] = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2015, 2035)}"
+
+	def mom(rows):
+		rows[1][3] = rng.randint(8000, 25000)
+
+	def mortgage(rows):
+		rows[rng.randrange(1, len(rows))][0] = round(rng.uniform(3000, 7000), 2)
+
+	edit('date_events.csv', date_events)
+	edit('persons.csv', persons)
+	edit('mom.csv', mom)
+	edit('mortgage.csv', mortgage)
+
+
+def cash_flow(plan, csv_file_name):
+	""" rows of the cash flow of a built plan, by DATE """
+	plan.write_detailed_month = False
+	plan.write_cash_flow(csv_file_name)
+	with open(csv_file_name, newline='') as csv_file:
+		return {row['DATE']: row for row in csv.DictReader(csv_file)}
+
+
+def cash_flow_difference(rows, other_rows, tolerance=0.0):
+	""" first difference of two cash flows above tolerance, None if they are the same """
+	if rows.keys() != other_rows.keys():
+		return f"{len(rows)} dates and {len(other_rows)} dates"
+	for date_str, row in rows.items():
+		other_row = other_rows[date_str]
+		if row.keys() != other_row.keys():
+			return f"{date_str}: columns {sorted(row.keys() ^ other_row.keys())}"
+		for column, value in row.items():
+			if column != 'DATE' and abs(float(value) - float(other_row[column])) > tolerance:
+				return f"{date_str} {column}: {value} and {other_row[column]}"
+	return None
+
+
+def check_incremental(proj_dir, seed):
+	""" a plan updated after an edit of its inputs against a plan built from the edited inputs """
+
+	with contextlib.redirect_stdout(io.StringIO()):
+		plan = Plan(proj_dir)
+		plan.build()
+		edit_inputs(proj_dir, random.Random(seed))
+		plan.update()
+		full = Plan(proj_dir)
+		full.build()
+
+	# an update adds its events after the others, so a month with non integral
+	# sums (mortgage payments) can be summed in another order than in a build
+	return cash_flow_difference(cash_flow(plan, os.path.join(proj_dir, 'incremental.csv')),
+	                            cash_flow(full, os.path.join(proj_dir, 'full.csv')), tolerance=1e-6)
+
+
+def check_cached(proj_dir):
+	""" a plan taken from the cache and one built from cached tables against a plan built without a cache """
+
+	cache = Cache(os.path.join(proj_dir, 'cache'))
+	with contextlib.redirect_stdout(io.StringIO()):
+		Plan(proj_dir, cache=cache).run()
+		cached = Plan(proj_dir, cache=cache)
+		if not cached.load_cached_result():
+			return "the plan was not cached"
+		from_tables = Plan(proj_dir, cache=cache)
+		from_tables.build()
+		uncached = Plan(proj_dir)
+		uncached.build()
+
+	rows = cash_flow(uncached, os.path.join(proj_dir, 'uncached.csv'))
+	return (cash_flow_difference(cash_flow(cached, os.path.join(proj_dir, 'cached.csv')), rows) or
+	        cash_flow_difference(cash_flow(from_tables, os.path.join(proj_dir, 'cached_tables.csv')), rows))
+
+
+def baseline_child_events(birthdays, maternity_pays):
+	"""
+	(child, category, name, first month, last month, sum) of the children, as
+	the hand written passes the default child rules replaced added them: the
+	birth pass in order of birth, then childcare and tax points
+	"""
+
+	events = list()
+
+	def add(child, category, name, event_sum, start, end):
+		if start <= end: # an event that ends before it starts adds no month
+			events.append((child, category, f"{name}child {child}", to_ordinal(start), to_ordinal(end), event_sum))
+
+	for order, child in enumerate(sorted(range(len(birthdays)), key=lambda child: birthdays[child]), 1):
+		billing = get_next_first_of_month(birthdays[child])
+		add(child, "MATERNITY_PAYS", "maternity pay ", maternity_pays[child], billing, billing)
+		add(child, "MATERNITY_PAYS", "maternity grant ", 1783 if order == 1 else 802 if order == 2 else 535, billing, billing)
+		add(child, "MATERNITY_PAYS", "child allowance ", (152 if order == 1 or order >= 5 else 192) - 50, billing, billing + relativedelta(years=18))
+
+	for child, birthday in enumerate(birthdays):
+		leave_end = birthday + relativedelta(weeks=LEAVE_WEEKS)
+		school_year = leave_end.replace(day=1)
+		while school_year.month != 9:
+			school_year += relativedelta(months=1)
+		stage_starts = [leave_end.replace(day=1)]
+		for age in (3, 6, 9): # KINDERGARDEN_ZAHARON, SCHOOL_ZAHARON and POST_CHILDCARE
+			while relativedelta(school_year.replace(month=12, day=31), birthday).years < age:
+				school_year += relativedelta(years=1)
+			stage_starts.append(school_year)
+		for (category, cost), start, end in zip([("DAYCARE", 3000), ("KINDERGARDEN_ZAHARON", 1000), ("SCHOOL_ZAHARON", 800)], stage_starts, stage_starts[1:]):
+			add(child, category, "childcare pay", cost, start, end - relativedelta(months=1))
+
+	for child, birthday in enumerate(birthdays):
+		year, month = birthday.year, birthday.month
+		add(child, "TAX_POINTS", "tax point ", month*220, date(year, month, 1), date(year, month, 1))
+		if month <= 11:
+			add(child, "TAX_POINTS", "tax point ", 3*220, date(year, month + 1, 1), date(year, 12, 1))
+		add(child, "TAX_POINTS", "tax point ", 5*220, date(year + 1, 1, 1), date(year + 5, 12, 1))
+		add(child, "TAX_POINTS", "tax point ", 1*220, date(year + 6, 1, 1), date(year + 17, 12, 1))
+		add(child, "TAX_POINTS", "tax point ", 0.5*220, date(year + 18, 1, 1), date(year + 18, 12, 1))
+
+	return events
+
+
+def check_child_rules(proj_dir, seed, n_children=500):
+	""" events of the default child rules against the hand written passes, for random birthdays """
+
+	rng = random.Random(seed)
+	birthdays = [date(rng.randint(1950, 2150), rng.randint(1, 12), 1) + timedelta(days=rng.randint(0, 30)) for __ in range(n_children)]
+	birthdays += rng.sample(birthdays, 20) # twins, kept in the order of the rows
+	maternity_pays = [float(rng.randrange(0, 40000, 500)) for __ in birthdays]
+	orders = dict(zip(sorted(range(len(birthdays)), key=lambda child: birthdays[child]), range(1, len(birthdays) + 1)))
+
+	rules = Plan(proj_dir).read_child_rules()
+	children, rule_indices, firsts, lasts, sums = rules.events(birthdays, [orders[child] for child in range(len(birthdays))], maternity_pays)
+	events = [(child, rules.categories[i], rules.names[i].format(name=f"child {child}"), first, last, event_sum)
+	          for child, i, first, last, event_sum in zip(children.tolist(), rule_indices.tolist(), firsts.tolist(), lasts.tolist(), sums)]
+
+	expected = baseline_child_events(birthdays, maternity_pays)
+	if len(events) != len(expected):
+		return f"{len(events)} events and {len(expected)} events"
+	for event, expected_event in zip(events, expected):
+		if event != expected_event or type(event[-1]) != type(expected_event[-1]): # the ledger prints 110 and 110.0 differently
+			return f"{event} and {expected_event}"
+	return None
+
+
+def check_scenario(name, proj_dir, seed):
+	""" print the checks of a scenario, True if all of them passed """
+
+	checks = [
+		('incremental == full',    lambda: check_incremental(proj_dir, seed)),
+		('cached == uncached',     lambda: check_cached(proj_dir)),
+		('child rules == baseline', lambda: check_child_rules(proj_dir, seed)),
+	]
+	passed = True
+	for check, function in checks:
+		difference = function()
+		print (f"{name:8} {check:24} {'ok' if difference is None else 'FAILED  ' + difference}")
+		passed = passed and difference is None
+	return passed
+
+
+def git_commit():
+	try:
+		return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+	except OSError:
+		return ""
+
+
+def load_history(history_file_name):
+	if not os.path.exists(history_file_name):
+		return list()
+	with open(history_file_name) as history_file:
+		return json.load(history_file)
+
+
+def report(result, previous):
+	""" print a scenario and the phases that got slower than in the previous run """
+
+	print (f"{result['scenario']:8} {result['months']:5} months {result['events']:6} events "
+	       f"{result['total']*1000:9.1f} ms {result['event_months_per_second']:12,} event-months/s {result['peak_memory_mb']:8.1f} MB")
+
+	for phase in PHASES:
+		seconds = result['phases'][phase]
+		line = f"    {phase:16} {seconds*1000:9.2f} ms"
+		if previous and previous['phases'].get(phase):
+			ratio = seconds / previous['phases'][phase]
+			line += f"  x{ratio:.2f}"
+			if ratio > SLOWER:
+				line += "  SLOWER"
+		print (line)
+
+
+def run():
+
+	parser = argparse.ArgumentParser(description="Benchmark of the planning pipeline")
+	parser.add_argument('--scenarios', default=",".join(SCENARIOS), help="comma separated, of " + ", ".join(SCENARIOS))
+	parser.add_argument('--repeat', type=int, default=3, help="runs per scenario, the best time is kept")
+	parser.add_argument('--history', default='bench_history.json', help="json file the results are appended to")
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--check', action='store_true', help="check the equivalences of the scenarios instead of timing them")
+	args = parser.parse_args()
+
+	if args.check:
+		passed = True
+		with tempfile.TemporaryDirectory() as temp_dir:
+			for name in args.scenarios.split(','):
+				proj_dir = os.path.join(temp_dir, name)
+				generate_project(proj_dir, *SCENARIOS[name], seed=args.seed)
+				passed = check_scenario(name, proj_dir, args.seed) and passed
+		if not passed:
+			exit(1)
+		return
+
+	history = load_history(args.history)
+	last_results = dict() # scenario / its result in the last run
+	for entry in history:
+		for result in entry['results']:
+			last_results[result['scenario']] = result
+
+	results = list()
+	with tempfile.TemporaryDirectory() as temp_dir:
+		for name in args.scenarios.split(','):
+			proj_dir = os.path.join(temp_dir, name)
+			generate_project(proj_dir, *SCENARIOS[name], seed=args.seed)
+			result = bench_scenario(name, proj_dir, args.repeat)
+			report(result, last_results.get(name))
+			results.append(result)
+
+	history.append({
+		"time": datetime.now().isoformat(timespec='seconds'),
+		"commit": git_commit(),
+		"python": platform.python_version(),
+		"seed": args.seed,
+		"results": results,
+	})
+	with open(args.history, 'w') as history_file:
+		json.dump(history, history_file, indent=1)
+
+
+
+if __name__ == '__main__':
+	run()
@@ -0,0 +1,100 @@
+import os
+import glob
+import pickle
+import hashlib
+
+
+
+# Content addressed cache of parsed input tables and built plans.
+#
+# An entry is a pickle file named by the sha256 of everything it was made
+# from: the engine sources, the project window and the bytes of the input
+# files. Reading an entry marks it as recently used (its mtime), and writing
+# one evicts the least recently used entries above the size limit. Entries
+# are written to a temporary file and renamed, so batch workers can share a
+# cache dir.
+
+DEFAULT_MAX_BYTES = 512*1024*1024
+ENTRY_SUFFIX = '.pickle'
+
+
+def engine_version():
+	""" digest of the engine sources, a code change invalidates the cache """
+	digest = hashlib.sha256()
+	for file_name in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))):
+		with open(file_name, 'rb') as source_file:
+			digest.update(source_file.read())
+	return digest.hexdigest()
+
+
+def file_digest(file_name):
+	with open(file_name, 'rb') as input_file:
+		return hashlib.sha256(input_file.read()).hexdigest()
+
+
+class Cache:
+
+	def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		self.engine = engine_version()
+		os.makedirs(cache_dir, exist_ok=True)
+
+	def key(self, *parts):
+		""" entry key of the engine and the given parts """
+		digest = hashlib.sha256(self.engine.encode())
+		for part in parts:
+			digest.update(repr(part).encode())
+		return digest.hexdigest()
+
+	def entry_file(self, key):
+		return os.path.join(self.cache_dir, key + ENTRY_SUFFIX)
+
+	def get(self, key):
+		""" cached object, None on a miss """
+		file_name = self.entry_file(key)
+		try:
+			with open(file_name, 'rb') as entry_file:
+				value = pickle.load(entry_file)
+			os.utime(file_name)
+		except (OSError, pickle.UnpicklingError, AttributeError, EOFError):
+			return None
+		return value
+
+	def put(self, key, value):
+		file_name = self.entry_file(key)
+		temp_file_name = f'{file_name}.{os.getpid()}.tmp'
+		with open(temp_file_name, 'wb') as entry_file:
+			pickle.dump(value, entry_file, pickle.HIGHEST_PROTOCOL)
+		os.replace(temp_file_name, file_name)
+		self.evict()
+
+	def table(self, reader_name, csv_file_name, config, read):
+		""" read(), cached by the name and the content of the file it reads """
+		key = self.key(reader_name, os.path.basename(csv_file_name), config.start_date, config.end_date, file_digest(csv_file_name))
+		value = self.get(key)
+		if value is None:
+			value = read()
+			self.put(key, value)
+		return value
+
+	def evict(self):
+		""" remove the least recently used entries until the cache fits """
+		entries = list()
+		for entry in os.scandir(self.cache_dir):
+			if entry.name.endswith(ENTRY_SUFFIX):
+				try:
+					stat = entry.stat()
+				except OSError: # evicted by another worker
+					continue
+				entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+		total = sum(size for __, size, __ in entries)
+		for __, size, path in sorted(entries):
+			if total <= self.max_bytes:
+				break
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+			total -= size
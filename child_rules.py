@@ -0,0 +1,185 @@
+import re
+import numpy as np
+from month_calendar import school_year_months, stage_calendar
+
+
+
+# Rules of the events derived for every child.
+#
+# A row of the table is an event of every child: its TYPE, CATEGORY, NAME
+# ({name} is the name of the child), SUM and the months FROM and UNTIL, an
+# anchor of the child and an offset like the periods (+18y, -1m, +1y 6m).
+# The table is compiled once into arrays and evaluated for all the children
+# together, a (rules x children) array per column, so another rule is another
+# row of the arrays and not another loop. A project replaces the default
+# table with input_files/child_rules.csv.
+#
+#   anchors          birth          the month of the birth
+#                    billing        the first 1st of month on or after the birth
+#                    leave_end      the month the maternity leave ends
+#                    january:N      January of the year the child turns N
+#                    school_year:N  September of the year the child turns N
+#
+#   sums             3000, 110.0    the same for every child
+#                    1783|802|535   by order of birth, the last one for the later children
+#                    220*birth_month  times the month of the birth, 1 to 12
+#                    maternity_pay  of the mom salary before the birth, see Plan.apply_maternity_leaves
+#
+# The school_year anchors are read from the school year table of
+# month_calendar, and the ages of the school_year anchors of the childcare
+# pass are the stage ages of the shared StageCalendar of the rules.
+#
+# An event that ends before it starts is not added. The events of a PASS are
+# added child by child (the birth pass in order of birth) and the passes one
+# after the other, the order the ledger sums the months with fractions in.
+
+LEAVE_WEEKS = 26
+PASSES = ("birth", "childcare", "tax_points")
+ANCHORS = ("birth", "billing", "leave_end", "january", "school_year")
+YEAR_ANCHORS = ("january", "school_year") # take the age N
+SUM_KINDS = ("fixed", "by_order", "birth_month", "maternity_pay")
+
+DEFAULT_RULES = """PASS,TYPE,CATEGORY,NAME,SUM,FROM,UNTIL,IGNORE
+birth,income,MATERNITY_PAYS,maternity pay {name},maternity_pay,billing,billing,
+birth,income,MATERNITY_PAYS,maternity grant {name},1783|802|535,billing,billing,
+birth,income,MATERNITY_PAYS,child allowance {name},102|142|142|142|102,billing,billing+18y,
+childcare,expense,DAYCARE,childcare pay{name},3000,leave_end,school_year:3-1m,
+childcare,expense,KINDERGARDEN_ZAHARON,childcare pay{name},1000,school_year:3,school_year:6-1m,
+childcare,expense,SCHOOL_ZAHARON,childcare pay{name},800,school_year:6,school_year:9-1m,
+tax_points,income,TAX_POINTS,tax point {name},220*birth_month,birth,birth,
+tax_points,income,TAX_POINTS,tax point {name},660,birth+1m,january:1-1m,
+tax_points,income,TAX_POINTS,tax point {name},1100,january:1,january:6-1m,
+tax_points,income,TAX_POINTS,tax point {name},220,january:6,january:18-1m,
+tax_points,income,TAX_POINTS,tax point {name},110.0,january:18,january:19-1m,
+"""
+
+anchor_pattern = re.compile(r'^([a-z_]+)(?::(\d+))?(?:([+-])(.+))?$')
+
+
+def parse_number(cell):
+	""" int, or float when it has a fraction part, as the sums of the ledger """
+	return float(cell) if '.' in cell else int(cell)
+
+
+def parse_anchor(cell, period_months):
+	""" (anchor, age, offset months) of a FROM or UNTIL cell """
+	match = anchor_pattern.match(cell.strip())
+	if not match or match.group(1) not in ANCHORS or (match.group(2) is None) == (match.group(1) in YEAR_ANCHORS):
+		raise ValueError(cell)
+	anchor, age, sign, offset = match.groups()
+	months = period_months(offset.strip()) if offset else 0
+	return ANCHORS.index(anchor), int(age or 0), -months if sign == '-' else months
+
+
+def parse_sum(cell):
+	""" (kind, values) of a SUM cell """
+	if cell == 'maternity_pay':
+		return SUM_KINDS.index("maternity_pay"), (0.0,)
+	if cell.endswith('*birth_month'):
+		return SUM_KINDS.index("birth_month"), (parse_number(cell[:-len('*birth_month')]),)
+	if '|' in cell:
+		return SUM_KINDS.index("by_order"), tuple(parse_number(value) for value in cell.split('|'))
+	return SUM_KINDS.index("fixed"), (parse_number(cell),)
+
+
+class ChildRules:
+	""" a rule table compiled to arrays, one entry per rule """
+
+	def __init__(self, passes, types, categories, names, sums, froms, untils):
+		self.passes = np.array([PASSES.index(rule_pass) for rule_pass in passes], dtype=int)
+		self.types = list(types)
+		self.categories = list(categories)
+		self.names = list(names)
+
+		# sums, a row of by order values per rule, the last one repeated
+		self.sum_kinds = np.array([kind for kind, __ in sums], dtype=int)
+		width = max([len(values) for __, values in sums] + [1])
+		self.sum_values = np.array([values + values[-1:] * (width - len(values)) for __, values in sums], dtype=float).reshape(len(sums), width)
+		self.is_float = np.array([any(isinstance(value, float) for value in values) for __, values in sums], dtype=bool) | (self.sum_kinds == SUM_KINDS.index("maternity_pay"))
+
+		self.from_anchors, self.from_ages, self.from_offsets = np.array(froms, dtype=int).reshape(len(froms), 3).T
+		self.until_anchors, self.until_ages, self.until_offsets = np.array(untils, dtype=int).reshape(len(untils), 3).T
+
+		# stages of the childcare pass, from its school years
+		childcare = self.passes == PASSES.index("childcare")
+		school_year = ANCHORS.index("school_year")
+		stage_ages = set(self.from_ages[childcare & (self.from_anchors == school_year)].tolist()) | set(self.until_ages[childcare & (self.until_anchors == school_year)].tolist())
+		self.calendar = stage_calendar(tuple(sorted(stage_ages)))
+
+	def __len__(self):
+		return len(self.types)
+
+	def __eq__(self, other):
+		return isinstance(other, ChildRules) and self.key() == other.key()
+
+	def key(self):
+		return (self.passes.tolist(), self.types, self.categories, self.names, self.sum_kinds.tolist(), self.sum_values.tolist(), self.is_float.tolist(),
+		        self.from_anchors.tolist(), self.from_ages.tolist(), self.from_offsets.tolist(), self.until_anchors.tolist(), self.until_ages.tolist(), self.until_offsets.tolist())
+
+	def categories_of(self, rule_pass):
+		return [category for category, i in zip(self.categories, self.passes.tolist()) if i == PASSES.index(rule_pass)]
+
+	def category_sum(self, category):
+		""" fixed sum of the first rule of a category """
+		i = self.categories.index(category)
+		value = self.sum_values[i, 0].item()
+		return value if self.is_float[i] else int(value)
+
+	@staticmethod
+	def months(anchors, ages, offsets, anchor_months, birth_years):
+		""" (rules x children) months of FROM or UNTIL """
+		months = anchor_months[anchors] + (12*ages + offsets)[:, None]
+		school = anchors == ANCHORS.index("school_year")
+		months[school] = school_year_months(birth_years[None, :], ages[school][:, None]) + offsets[school][:, None]
+		return months
+
+	def events(self, birthdays, orders, maternity_pays, category_sums=None):
+		"""
+		events of the children in order: child index, rule index, first month
+		and last month arrays and the list of sums, of the birthdays, orders of
+		birth and maternity pays of the children. category_sums replace the
+		sums of the rules of their categories
+		"""
+
+		birthdays = np.asarray(birthdays, dtype='datetime64[D]')
+		n_rules, n_children = len(self), len(birthdays)
+
+		birth_months = birthdays.astype('datetime64[M]')
+		birth_years = birth_months.astype('datetime64[Y]').astype(np.int64) + 1970
+		birth = birth_months.astype(np.int64) + 1970*12 + 1 # month ordinals
+		billing = birth + (birthdays != birth_months.astype('datetime64[D]'))
+		leave_end = (birthdays + np.timedelta64(LEAVE_WEEKS*7, 'D')).astype('datetime64[M]').astype(np.int64) + 1970*12 + 1
+		anchor_months = np.stack([birth, billing, leave_end, birth_years*12 + 1, school_year_months(birth_years, 0)]).reshape(len(ANCHORS), n_children)
+
+		firsts = self.months(self.from_anchors, self.from_ages, self.from_offsets, anchor_months, birth_years)
+		lasts = self.months(self.until_anchors, self.until_ages, self.until_offsets, anchor_months, birth_years)
+
+		# sums of every kind, then the one of the rule
+		sum_values, is_float = self.sum_values, self.is_float
+		if category_sums:
+			sum_values, is_float = sum_values.copy(), is_float.copy()
+			for i, category in enumerate(self.categories):
+				if category in category_sums:
+					sum_values[i] = category_sums[category]
+					is_float[i] = isinstance(category_sums[category], float)
+		orders = np.minimum(np.asarray(orders, dtype=int), sum_values.shape[1]) - 1
+		by_kind = np.stack([
+			np.broadcast_to(sum_values[:, :1], (n_rules, n_children)),
+			sum_values[:, orders],
+			sum_values[:, :1] * (birth - birth_years*12)[None, :],
+			np.broadcast_to(np.asarray(maternity_pays, dtype=float), (n_rules, n_children)),
+		])
+		sums = by_kind[self.sum_kinds, np.arange(n_rules)]
+
+		# child by child in a pass, the birth pass in order of birth
+		positions = np.tile(np.arange(n_children), (len(PASSES), 1))
+		positions[PASSES.index("birth"), np.argsort(birthdays, kind='stable')] = np.arange(n_children)
+		rule_positions = positions[self.passes]
+
+		rules, children = np.nonzero(lasts >= firsts)
+		order = np.lexsort((rules, rule_positions[rules, children], self.passes[rules]))
+		rules, children = rules[order], children[order]
+
+		# int sums unless the rule has float ones, as the ledger prints them
+		sums = [value if rule_float else int(value) for value, rule_float in zip(sums[rules, children].tolist(), is_float[rules].tolist())]
+		return children, rules, firsts[rules, children], lasts[rules, children], sums
@@ -0,0 +1,67 @@
+import os
+import json
+import numpy as np
+
+
+
+# Columnar binary twin of cash_flow.csv, read back with numpy.memmap.
+#
+#   magic       8 bytes  b'FFPCOLS1'
+#   n_rows      uint32
+#   n_columns   uint32
+#   names_len   uint32
+#   padding     uint32
+#   names       names_len bytes, json list of the column names (utf-8),
+#               zero padded to a multiple of 8
+#   months      int64[n_rows], month ordinals (year*12 + month)
+#   columns     float64[n_columns][n_rows], one column after the other
+#
+# Every column is contiguous, so a column is a view into the mapped file.
+
+MAGIC = b'FFPCOLS1'
+HEADER = np.dtype([('magic', 'S8'), ('n_rows', '<u4'), ('n_columns', '<u4'), ('names_len', '<u4'), ('padding', '<u4')])
+
+
+def columns_bytes(months, names, columns):
+	""" month ordinals and the named float columns (n_columns x n_rows) in the file format """
+
+	columns = np.asarray(columns, dtype='<f8').reshape(len(names), len(months))
+	names_bytes = json.dumps(names, ensure_ascii=False).encode()
+	names_bytes += b'\0' * (-len(names_bytes) % 8)
+
+	header = np.array([(MAGIC, len(months), len(names), len(names_bytes), 0)], dtype=HEADER)
+
+	return header.tobytes() + names_bytes + np.asarray(months, dtype='<i8').tobytes() + columns.tobytes()
+
+
+def write_columns(file_name, months, names, columns):
+	""" write month ordinals and the named float columns (n_columns x n_rows), replacing the file at once """
+	temp_file_name = f'{file_name}.{os.getpid()}.tmp'
+	with open(temp_file_name, 'wb') as bin_file:
+		bin_file.write(columns_bytes(months, names, columns))
+	os.replace(temp_file_name, file_name)
+
+
+def read_columns(file_name):
+	""" month ordinals and a dict of name / column, views into the mapped file """
+
+	header = np.fromfile(file_name, dtype=HEADER, count=1)
+	if len(header) == 0 or header['magic'][0] != MAGIC:
+		raise ValueError(f"Not a columnar cash flow file: {file_name}")
+
+	n_rows = int(header['n_rows'][0])
+	n_columns = int(header['n_columns'][0])
+	names_len = int(header['names_len'][0])
+
+	with open(file_name, 'rb') as bin_file:
+		bin_file.seek(HEADER.itemsize)
+		names = json.loads(bin_file.read(names_len).rstrip(b'\0').decode())
+
+	if n_rows == 0: # nothing to map
+		return np.empty(0, dtype='<i8'), dict(zip(names, np.empty((n_columns, 0))))
+
+	data = np.memmap(file_name, dtype='<i8', mode='r', offset=HEADER.itemsize + names_len, shape=(n_rows*(n_columns + 1),))
+	months = data[:n_rows]
+	values = data[n_rows:].view('<f8').reshape(n_columns, n_rows)
+
+	return months, dict(zip(names, values))
@@ -0,0 +1,2 @@
+class PlanError(Exception):
+	""" invalid input data, stops the run of a single project """
@@ -1,9 +1,12 @@
-import sys
+import os
 import csv
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime, date
-from dateutil.relativedelta import relativedelta
+from concurrent.futures import ProcessPoolExecutor
+from columnar import read_columns
+from month_calendar import to_ordinal
 
 
 
@@ -26,43 +29,163 @@ def example():
 
 
 format_str = '%Y-%m-%d'
-birth_gil = datetime.strptime("1983-07-14", format_str).date()
+persons_format_str = '%d/%m/%Y'
 
-def create_single_plot(ax, project_dir):
-	dates = list()
-	bank = list()
-	with open(project_dir + "/cash_flow.csv") as csv_file:
+MAX_POINTS = 2000 # per line, longer series are downsampled
+
+def read_birthday(project_dir, name=None):
+	""" birthday of the named person in persons.csv, the first adult by default """
+	with open(project_dir + "/input_files/persons.csv") as csv_file:
 		reader = csv.DictReader(csv_file)
 		for row in reader:
+			if row['IGNORE'] == 'yes':
+				continue
+			if (name is None and row['TYPE'] != "child") or row['NAME'] == name:
+				return datetime.strptime(row['BIRTHDAY'], persons_format_str).date()
 
-			d = datetime.strptime(row['DATE'], format_str).date()
-			# print(relativedelta(d,birth_gil))
+	raise ValueError(f"No person {name or 'adult'} in {project_dir}/input_files/persons.csv")
 
-			# dates.append(datetime.strptime(row['DATE'], format_str).date())
+def read_bank(project_dir):
+	""" month ordinals and BANK, from cash_flow.bin when there is one """
 
-			gil_age_delta = relativedelta(d,birth_gil)
-			gil_age = gil_age_delta.years + gil_age_delta.months/12.0 + gil_age_delta.days/365.0
-			# print(gil_age)
-			dates.append(gil_age)
+	bin_file_name = project_dir + "/cash_flow.bin"
+	if os.path.exists(bin_file_name):
+		months, columns = read_columns(bin_file_name)
+		return months, columns['BANK']
 
+	# no columnar output, parse the csv
+	with open(project_dir + "/cash_flow.csv") as csv_file:
+		reader = csv.reader(csv_file)
+		header = next(reader)
+		date_column = header.index('DATE')
+		bank_column = header.index('BANK')
+		rows = [(row[date_column], row[bank_column]) for row in reader]
+
+	months = np.array([int(d[:4])*12 + int(d[5:7]) for d, __ in rows], dtype=int)
+	bank = np.array([b for __, b in rows], dtype=float)
+	return months, bank
+
+def ages_in_years(birthday, months):
+	""" age on the first of every month ordinal, as relativedelta years + months/12 + days/365 """
+	first_days = (np.asarray(months) - to_ordinal(date(1970, 1, 1))).astype('datetime64[M]').astype('datetime64[D]')
+	prev_days = (first_days.astype('datetime64[M]') - 1).astype('datetime64[D]')
+	days_in_prev_month = (first_days - prev_days).astype(int)
+
+	full_months = np.asarray(months) - to_ordinal(birthday)
+	days = np.zeros(len(full_months))
+	if birthday.day > 1:
+		full_months = full_months - 1
+		days = days_in_prev_month - np.minimum(birthday.day, days_in_prev_month) + 1
+
+	return full_months // 12 + (full_months % 12)/12.0 + days/365.0
+
+def downsample(x, y, max_points=MAX_POINTS):
+	""" min and max of y in every bucket of x, keeps the peaks and the dips of a long series """
+	if len(x) <= max_points:
+		return x, y
+
+	bucket = -(-2*len(x) // max_points)
+	n_buckets = len(x) // bucket
+	buckets = np.asarray(y[:n_buckets*bucket]).reshape(n_buckets, bucket)
+	starts = np.arange(n_buckets)*bucket
+
+	indices = np.concatenate([starts + buckets.argmin(axis=1), starts + buckets.argmax(axis=1), np.arange(n_buckets*bucket, len(x))])
+	indices = np.unique(indices) # sorted
+	return x[indices], y[indices]
+
+def create_single_plot(ax, project_dir, name=None):
+	months, bank = read_bank(project_dir)
+	ages = ages_in_years(read_birthday(project_dir, name), months)
+	bank_line, = ax.plot(*downsample(ages, bank), label=project_dir)
+	return bank_line
+
+def output_stamp(project_dir):
+	""" modification time of the output of a project, None before the first run """
+	for file_name in ("/cash_flow.bin", "/cash_flow.csv"):
+		if os.path.exists(project_dir + file_name):
+			return os.stat(project_dir + file_name).st_mtime_ns
+	return None
+
+def follow_projects(fig, ax, lines, project_dirs, name=None):
+	""" redraw the line of a project in place when its output is replaced (run.py --watch) """
+
+	stamps = [output_stamp(project_dir) for project_dir in project_dirs]
+
+	def refresh():
+		changed = False
+		for i, project_dir in enumerate(project_dirs):
+			stamp = output_stamp(project_dir)
+			if stamp == stamps[i]:
+				continue
+			stamps[i] = stamp
+			try:
+				months, bank = read_bank(project_dir)
+				ages = ages_in_years(read_birthday(project_dir, name), months)
+			except (OSError, ValueError, KeyError): # persons.csv in the middle of a save
+				continue
+			lines[i].set_data(*downsample(ages, bank))
+			changed = True
+		if changed:
+			ax.relim()
+			ax.autoscale_view()
+			fig.canvas.draw_idle()
+
+	timer = fig.canvas.new_timer(interval=500)
+	timer.add_callback(refresh)
+	timer.start()
+	return timer # the timer stops when it is collected
+
+def plot_multiple_graphs(project_dirs, name=None, follow=False):
 
-			# dates.append(relativedelta(d,birth_gil))
-			bank.append(float(row['BANK']))
+	fig, ax = plt.subplots()
+	ax.grid(axis='y')
 
-	bank_line, = ax.plot(dates, bank, label=project_dir)
+	lines = [create_single_plot(ax, project_dir, name) for project_dir in project_dirs]
 
+	if follow:
+		timer = follow_projects(fig, ax, lines, project_dirs, name)
 
-def plot_multiple_graphs(project_dirs):
+	ax.legend()
+	plt.title('Total')
+	plt.show()
+
+def render_project(project_dir, out_file_name, name=None):
+	""" plot a single project into a file, runs in a worker """
+	plt.switch_backend('Agg')
 
 	fig, ax = plt.subplots()
 	ax.grid(axis='y')
+	create_single_plot(ax, project_dir, name)
+	ax.legend()
+	ax.set_title(project_dir)
+	fig.savefig(out_file_name)
+	plt.close(fig)
 
-	for project_dir in project_dirs:
-		 create_single_plot(ax, project_dir)
+	return out_file_name
 
-	ax.legend()
-	plt.title('Total')
-	plt.show()
+def render_projects(project_dirs, out_dir, file_format='png', jobs=None, name=None):
+	""" one file per project on a process pool, and all of them in total.<file_format> """
+
+	plt.switch_backend('Agg')
+	os.makedirs(out_dir, exist_ok=True)
+
+	out_file_names = [os.path.join(out_dir, os.path.normpath(project_dir).strip(os.sep).replace(os.sep, '_') + '.' + file_format) for project_dir in project_dirs]
+
+	with ProcessPoolExecutor(max_workers=min(jobs or os.cpu_count(), len(project_dirs))) as executor:
+		for out_file_name in executor.map(render_project, project_dirs, out_file_names, [name]*len(project_dirs)):
+			print (out_file_name)
+
+	fig, ax = plt.subplots()
+	ax.grid(axis='y')
+	for project_dir in project_dirs:
+		create_single_plot(ax, project_dir, name)
+	if len(project_dirs) <= 20: # a legend of more would hide the lines
+		ax.legend()
+	ax.set_title('Total')
+	total_file_name = os.path.join(out_dir, 'total.' + file_format)
+	fig.savefig(total_file_name)
+	plt.close(fig)
+	print (total_file_name)
 
 def plot_incomes_expenses():
 	dates = list()
@@ -96,4 +219,16 @@ if __name__ == '__main__':
 	# plot_incomes_expenses()
 	# plot_total()
 
-	plot_multiple_graphs(sys.argv[1:])
\ No newline at end of file
+	parser = argparse.ArgumentParser(description="Plot BANK of projects by age")
+	parser.add_argument('project_dirs', nargs='+')
+	parser.add_argument('--person', default=None, help="name in persons.csv of the age axis (default: the first adult)")
+	parser.add_argument('--out', metavar='DIR', default=None, help="render files into DIR instead of showing a window")
+	parser.add_argument('--format', default='png', choices=['png', 'svg'])
+	parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: all cores)")
+	parser.add_argument('--follow', action='store_true', help="redraw the lines when the projects are run again (run.py --watch)")
+	args = parser.parse_args()
+
+	if args.out:
+		render_projects(args.project_dirs, args.out, args.format, args.jobs, args.person)
+	else:
+		plot_multiple_graphs(args.project_dirs, args.person, args.follow)
\ No newline at end of file
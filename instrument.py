@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import tracemalloc
+import contextlib
+import numpy as np
+
+
+
+# Per phase instrumentation of a plan run.
+#
+# A Profiler records for every phase its wall time, CPU time, the memory
+# blocks and bytes it left allocated and its peak (tracemalloc) and its
+# counters: rows parsed, events split, months touched (ledger cells written
+# by the new events) and MonthEvents created. A plan without a profiler only
+# pays an attribute test per phase and per counted batch.
+
+COUNTERS = ['rows_parsed', 'events_split', 'months_touched', 'month_events']
+
+
+def event_cells(ledger, first_event, last_event):
+	""" ledger cells written by the events in [first_event, last_event) """
+	return int(ledger.occurrence_counts(np.arange(first_event, last_event)).sum())
+
+
+class Profiler:
+
+	def __init__(self, name=""):
+		self.name = name
+		self.phases = list()
+		self.counters = None # of the running phase
+		self.started_tracing = False
+		self.origin = time.perf_counter()
+
+	def start(self):
+		if not tracemalloc.is_tracing():
+			tracemalloc.start()
+			self.started_tracing = True
+
+	def stop(self):
+		if self.started_tracing:
+			tracemalloc.stop()
+			self.started_tracing = False
+
+	def count(self, counter, n=1):
+		if self.counters is not None:
+			self.counters[counter] += n
+
+	@contextlib.contextmanager
+	def phase(self, name, ledger=None):
+		""" record a phase, events split and months touched are taken from the ledger """
+
+		parent_counters = self.counters
+		self.counters = dict.fromkeys(COUNTERS, 0)
+		first_event = ledger.n_events if ledger is not None else 0
+
+		tracemalloc.reset_peak()
+		start_snapshot = tracemalloc.take_snapshot()
+		start_current = tracemalloc.get_traced_memory()[0]
+		start_wall = time.perf_counter()
+		start_cpu = time.process_time()
+
+		try:
+			yield
+		finally:
+			wall = time.perf_counter() - start_wall
+			cpu = time.process_time() - start_cpu
+			current, peak = tracemalloc.get_traced_memory()
+			blocks = sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(start_snapshot, 'filename'))
+
+			if ledger is not None:
+				last_event = ledger.n_events
+				self.counters['events_split'] += last_event - first_event
+				self.counters['months_touched'] += event_cells(ledger, first_event, last_event)
+
+			self.phases.append({
+				"name": name,
+				"start": start_wall - self.origin,
+				"wall": wall,
+				"cpu": cpu,
+				"allocated_blocks": blocks,
+				"allocated_bytes": current - start_current,
+				"peak_bytes": peak - start_current,
+				"counters": self.counters,
+			})
+
+			if parent_counters is not None: # nested phases add up
+				for counter, n in self.counters.items():
+					parent_counters[counter] += n
+			self.counters = parent_counters
+
+	def report(self):
+		return {
+			"name": self.name,
+			"wall": sum(phase['wall'] for phase in self.phases),
+			"cpu": sum(phase['cpu'] for phase in self.phases),
+			"phases": self.phases,
+		}
+
+	def write_json(self, file_name):
+		with open(file_name, 'w') as json_file:
+			json.dump(self.report(), json_file, indent=1)
+
+	def write_chrome_trace(self, file_name):
+		""" trace event format, opens in chrome://tracing and speedscope """
+		events = list()
+		for phase in self.phases:
+			events.append({
+				"name": phase['name'],
+				"cat": "phase",
+				"ph": "X",
+				"ts": round(phase['start']*1e6, 3),
+				"dur": round(phase['wall']*1e6, 3),
+				"pid": os.getpid(),
+				"tid": 1,
+				"args": dict(phase['counters'], cpu=phase['cpu'], allocated_blocks=phase['allocated_blocks'], allocated_bytes=phase['allocated_bytes'], peak_bytes=phase['peak_bytes']),
+			})
+		with open(file_name, 'w') as json_file:
+			json.dump({"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"name": self.name}}, json_file)
+
+	def print_summary(self):
+		print (f"{'phase':34} {'wall ms':>10} {'cpu ms':>10} {'blocks':>9} {'peak KB':>9} " + " ".join(f"{counter:>14}" for counter in COUNTERS))
+		for phase in self.phases:
+			print (f"{phase['name']:34} {phase['wall']*1000:10.2f} {phase['cpu']*1000:10.2f} {phase['allocated_blocks']:9} {phase['peak_bytes']/1024:9.1f} "
+			       + " ".join(f"{phase['counters'][counter]:14}" for counter in COUNTERS))
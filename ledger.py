@@ -0,0 +1,861 @@
+import numpy as np
+
+
+
+class MonthEvent:
+
+	__slots__ = ['type', 'category', 'name', 'sum', 'person_type']
+
+	def __init__(self, event_type, category, name, event_sum, person_type=""):
+		self.type     = event_type
+		self.category = category
+		self.name     = name
+		self.sum      = event_sum
+		self.person_type = person_type
+
+	@staticmethod
+	def generate_header_row():
+		return ["TYPE","CATEGORY","NAME","SUM"]
+
+	def generate_row(self):
+		return [self.type, self.category, self.name, self.sum]
+
+
+class Month:
+	""" view of a single ledger row """
+
+	__slots__ = ['ledger', 'row']
+
+	def __init__(self, ledger, row):
+		self.ledger = ledger
+		self.row = row
+
+	@property
+	def month_events(self):
+		""" events of the 1st of the month """
+		ledger = self.ledger
+		month_events = list()
+		for i, event_sum in ledger.row_events(self.row, ledger.row_hits(self.row, 1)):
+			event_type, category, name, person_type = ledger.event_strings(i)
+			month_events.append(MonthEvent(event_type, category, name, event_sum, person_type))
+		return month_events
+
+	@property
+	def agg_sums(self):
+		return self.ledger.row_type_sums(self.row)
+
+	@property
+	def agg_categories(self):
+		return self.ledger.row_categories(self.row)
+
+	def find_event(self, category, person_type):
+		""" index and sum of the first event of the month that matches """
+		return self.ledger.find_event(self.row, category, person_type)
+
+	def get_mom_salary(self):
+		__, mom_salary = self.find_event("salary", "mom")
+		return mom_salary
+
+	def update_mom_salary(self, salary_percentage):
+		""" scale the mom salary, return what restore_event_sum needs to undo it """
+
+		month = self.ledger.first_month + self.row
+		changes = self.ledger.scale_events("salary", "mom", month, month + 1, salary_percentage, 500)
+		if not changes:
+			return None
+
+		return changes[0]
+
+
+def round_by_factor(num, factor):
+	return (num//factor)*factor
+
+
+class StringTable:
+	""" interned strings, a string is stored once and referred to by its id """
+
+	__slots__ = ['strings', 'ids']
+
+	def __init__(self):
+		self.strings = []
+		self.ids = dict()
+
+	def id(self, string):
+		string_id = self.ids.get(string)
+		if string_id is None:
+			string_id = self.ids[string] = len(self.strings)
+			self.strings.append(string)
+		return string_id
+
+
+class EventLog:
+	"""
+	Events of a ledger as a struct of arrays, one typed array per field, grown
+	by doubling. Strings are ids into the tables of the ledger.
+	"""
+
+	fields = {
+		'firsts':       np.int64,   # first row, unclipped
+		'lasts':        np.int64,   # last row, unclipped
+		'periods':      np.int64,
+		'categories':   np.int32,   # category column
+		'types':        np.int8,    # type column
+		'person_types': np.int32,
+		'names':        np.int32,
+		'sums':         np.float64,
+		'days':         np.int8,    # day of month of the occurrences
+		'is_float':     np.bool_,   # the sum is a python float
+		'live':         np.bool_,   # False once removed
+	}
+
+	__slots__ = ['n'] + list(fields)
+
+	def __init__(self, capacity=64):
+		self.n = 0
+		for field, dtype in EventLog.fields.items():
+			setattr(self, field, np.zeros(capacity, dtype=dtype))
+
+	def append(self, first, last, period, category, event_type, person_type, name, event_sum, day=1):
+
+		if self.n == len(self.firsts):
+			for field in EventLog.fields:
+				column = getattr(self, field)
+				setattr(self, field, np.concatenate([column, np.zeros_like(column)]))
+
+		i = self.n
+		self.firsts[i] = first
+		self.lasts[i] = last
+		self.periods[i] = period
+		self.categories[i] = category
+		self.types[i] = event_type
+		self.person_types[i] = person_type
+		self.names[i] = name
+		self.sums[i] = event_sum
+		self.days[i] = day
+		self.is_float[i] = isinstance(event_sum, float)
+		self.live[i] = True
+		self.n += 1
+
+		return i
+
+	def extend(self, firsts, lasts, periods, category, event_type, person_type, names, sums, days=1):
+		""" append events of arrays (a single value is the same for all of them), return their ids """
+
+		n = len(firsts)
+		if self.n + n > len(self.firsts):
+			capacity = max(2*len(self.firsts), self.n + n)
+			for field in EventLog.fields:
+				column = getattr(self, field)
+				grown = np.zeros(capacity, dtype=column.dtype)
+				grown[:self.n] = column[:self.n]
+				setattr(self, field, grown)
+
+		ids = np.arange(self.n, self.n + n)
+		self.firsts[ids] = firsts
+		self.lasts[ids] = lasts
+		self.periods[ids] = periods
+		self.categories[ids] = category
+		self.types[ids] = event_type
+		self.person_types[ids] = person_type
+		self.names[ids] = names
+		self.sums[ids] = sums
+		self.days[ids] = days
+		self.is_float[ids] = [isinstance(event_sum, float) for event_sum in sums]
+		self.live[ids] = True
+		self.n += n
+
+		return ids
+
+	def sum(self, i):
+		return as_number(self.sums[i], self.is_float[i])
+
+
+class Ledger:
+	"""
+	Dense month x category matrix of event sums.
+
+	Row i is the month ordinal first_month+i, there is one column per category
+	name and the per-type totals are kept aside. Events are recorded in an
+	EventLog as intervals (first row, last row, period) and written into the
+	matrix only when it is read, either one strided slice per event or, in
+	"difference" expansion, one difference array per period followed by a
+	strided cumulative sum, so the cost follows the number of events and not
+	the number of event-months. Removing an event writes the same intervals
+	with the opposite sign.
+
+	Cells that received a float sum are counted, so the output keeps printing
+	integers as integers. Months that received a non integral sum are summed
+	again in insertion order, so the float rounding is the same as adding
+	event by event.
+
+	An event falls on a day of the month, the 1st for most of them. The
+	window starts and ends on a day too, so the occurrences before the first
+	day or after the last one are clipped. A month holds the events of all
+	its days, only date_rows splits it into a row per day, and the mom salary
+	lookups see the events of the 1st only.
+	"""
+
+	expansions = ("strided", "difference")
+	rows_per_sum = 256 # exact rows looked up together, bounds the (rows x events) hit mask
+
+	def __init__(self, first_month, last_month, event_types, expansion="difference", first_day=1, last_day=31):
+
+		if expansion not in self.expansions:
+			raise ValueError(f"Unknown expansion: {expansion}")
+
+		self.expansion = expansion
+		self.first_month = first_month
+		self.n_months = max(last_month - first_month + 1, 0)
+		self.first_day = first_day
+		self.last_day = last_day
+		self.event_types = list(event_types)
+		self.type_columns = {event_type: i for i, event_type in enumerate(self.event_types)}
+
+		self.categories = dict() # event type / set of categories
+		for event_type in self.event_types:
+			self.categories[event_type] = set()
+		self.category_columns = dict() # category name / column
+		self.category_names = []       # column / category name
+
+		self.values = np.zeros((self.n_months, 8))
+		self.float_counts = np.zeros((self.n_months, 8), dtype=np.int32)
+		self.type_sums = np.zeros((self.n_months, len(self.event_types)))
+		self.type_float_counts = np.zeros((self.n_months, len(self.event_types)), dtype=np.int32)
+		self.touch_counts = np.zeros(self.n_months, dtype=np.int32)
+
+		self.log = EventLog()   # events in insertion order
+		self.names = StringTable()
+		self.person_types = StringTable()
+		self.overrides = dict() # row / {event id / sum of its occurrence in that row}
+		self.event_index = dict() # (category column, person type id) / ids of the events of the 1st in insertion order
+		self.index_arrays = dict() # same as arrays, rebuilt when the list grew
+		self.expanded = 0   # events already written into the matrices
+		self.exact_rows = set() # rows summed again in insertion order
+		self.exact_hits = np.zeros(0, dtype=np.int64) # row << 32 | event id of the events in the exact rows, sorted
+		self.hit_rows = set()   # exact rows in exact_hits
+		self.hit_events = 0     # events looked up in exact_hits
+		self.removals = 0       # remove calls, and the count exact_hits was last filtered at
+		self.hit_removals = 0
+		self.dirty_from = 0 # first row changed since the last mark_clean
+
+	@property
+	def touched(self):
+		self.expand()
+		return self.touch_counts > 0
+
+	@property
+	def n_events(self):
+		return self.log.n
+
+	def month(self, ordinal):
+		""" Month view of a month ordinal, None if no event falls in that month """
+		self.expand()
+		row = ordinal - self.first_month
+		if row < 0 or row >= self.n_months or not self.touch_counts[row]:
+			return None
+		return Month(self, row)
+
+	def category_column(self, category):
+
+		column = self.category_columns.get(category)
+		if column is not None:
+			return column
+
+		column = len(self.category_columns)
+		if column == self.values.shape[1]:
+			self.expand() # pending events use the current width
+			self.values = np.hstack([self.values, np.zeros_like(self.values)])
+			self.float_counts = np.hstack([self.float_counts, np.zeros_like(self.float_counts)])
+
+		self.category_columns[category] = column
+		self.category_names.append(category)
+		return column
+
+	def occurrences(self, first, last, period):
+		""" slice of the rows inside the ledger hit by an interval """
+
+		if first < 0:
+			first %= period # first occurrence inside
+		last = min(last, self.n_months - 1)
+
+		return slice(first, last + 1, period)
+
+	def occurrence_counts(self, event_ids):
+		""" number of months inside the ledger hit by every event, 0 once removed """
+
+		log = self.log
+		firsts, lasts, periods = log.firsts[event_ids], log.lasts[event_ids], log.periods[event_ids]
+		firsts = np.where(firsts < 0, firsts % periods, firsts)
+		counts = (np.minimum(lasts, self.n_months - 1) - firsts) // periods + 1
+		return np.maximum(counts, 0)
+
+	def mark_dirty(self, row):
+		self.dirty_from = min(self.dirty_from, max(row, 0))
+
+	def mark_clean(self):
+		self.dirty_from = self.n_months
+
+	def clip_days(self, firsts, lasts, periods, days, end_days):
+		"""
+		(first rows, last rows) of events on a day of month, without the
+		occurrences before the first day of the window, after its last day or
+		after the end day of the event, and the mask of the events that
+		overlap the window at all
+		"""
+
+		n = self.n_months
+		inside = (lasts >= 0) & (firsts < n) & ~((lasts == 0) & (end_days < self.first_day)) & ~((firsts == n - 1) & (days > self.last_day))
+
+		lasts = lasts - (days > end_days)
+		lasts = np.where(days > self.last_day, np.minimum(lasts, n - 2), lasts)
+		firsts = np.where((days < self.first_day) & (firsts <= 0), firsts + ((-firsts) // periods + 1)*periods, firsts)
+
+		return firsts, lasts, inside
+
+	def add(self, date_event):
+		""" record a date event, it is written on the next expansion. Return its id """
+
+		first = date_event.start - self.first_month
+		last = date_event.end - self.first_month
+		day = date_event.day
+
+		if date_event.day > min(date_event.end_day, self.last_day) or min(day, date_event.end_day) < self.first_day:
+			firsts, lasts, inside = self.clip_days(np.array([first]), np.array([last]), date_event.period, day, date_event.end_day)
+			if not inside[0]:
+				return None
+			first, last = int(firsts[0]), int(lasts[0])
+
+		elif last < 0 or first >= self.n_months:
+			return None
+
+		self.categories[date_event.type].add(date_event.category)
+		column = self.category_column(date_event.category)
+
+		person_type_id = self.person_types.id(date_event.person_type)
+		event_id = self.log.append(first, last, date_event.period, column, self.type_columns[date_event.type],
+		                           person_type_id, self.names.id(date_event.name), date_event.sum, day)
+		if day == 1:
+			self.event_index.setdefault((column, person_type_id), []).append(event_id)
+		self.mark_dirty(first)
+
+		return event_id
+
+	def add_events(self, firsts, lasts, periods, event_types, categories, names, sums, person_types, days=1, end_days=31):
+		""" record events at once, as add one after the other. Return their ids, None for the ones outside """
+
+		firsts = np.asarray(firsts, dtype=np.int64) - self.first_month
+		lasts = np.asarray(lasts, dtype=np.int64) - self.first_month
+		periods = np.asarray(periods, dtype=np.int64)
+		days = np.broadcast_to(np.asarray(days, dtype=np.int64), firsts.shape)
+		firsts, lasts, inside = self.clip_days(firsts, lasts, periods, days, np.asarray(end_days, dtype=np.int64))
+
+		event_ids = [None] * len(firsts)
+		selected = np.flatnonzero(inside).tolist()
+		if not selected:
+			return event_ids
+
+		# the strings in the order add would meet them
+		columns = list()
+		person_type_ids = list()
+		for i in selected:
+			self.categories[event_types[i]].add(categories[i])
+			columns.append(self.category_column(categories[i]))
+			person_type_ids.append(self.person_types.id(person_types[i]))
+
+		ids = self.log.extend(firsts[inside], lasts[inside], periods[inside], columns, [self.type_columns[event_types[i]] for i in selected],
+		                      person_type_ids, [self.names.id(names[i]) for i in selected], [sums[i] for i in selected], days[inside])
+		for event_id, column, person_type_id, day in zip(ids.tolist(), columns, person_type_ids, days[inside].tolist()):
+			if day == 1:
+				self.event_index.setdefault((column, person_type_id), []).append(event_id)
+		self.mark_dirty(int(firsts[inside].min()))
+
+		for i, event_id in zip(selected, ids.tolist()):
+			event_ids[i] = event_id
+		return event_ids
+
+	def remove(self, event_ids):
+		""" take events out of the matrices, with their overridden occurrences """
+
+		log = self.log
+		event_ids = [event_id for event_id in event_ids if log.live[event_id]]
+		if not event_ids:
+			return
+
+		self.expand()
+
+		# occurrences that were overridden hold the override, take the difference out first
+		removed = set(event_ids)
+		for row, row_overrides in list(self.overrides.items()):
+			for event_id in removed.intersection(row_overrides):
+				self.set_event_sum(event_id, row, log.sum(event_id), sum_exact=False)
+				del row_overrides[event_id]
+			if not row_overrides:
+				del self.overrides[row]
+
+		if self.expansion == "difference":
+			changed = self.expand_differences(event_ids, -1)
+		else:
+			changed = self.expand_strided(event_ids, -1)
+
+		for event_id in event_ids:
+			self.mark_dirty(int(log.firsts[event_id]))
+		log.live[event_ids] = False
+		self.removals += 1
+		log.firsts[event_ids] = 0 # never hit
+		log.lasts[event_ids] = -1
+		log.periods[event_ids] = 1
+
+		self.sum_exact_rows(changed)
+
+		# categories of the events left, added in the order they first occur
+		live = log.live[:log.n]
+		pairs = log.types[:log.n][live].astype(np.int64) * len(self.category_names) + log.categories[:log.n][live]
+		__, first_positions = np.unique(pairs, return_index=True)
+		for event_type in self.event_types:
+			self.categories[event_type] = set()
+		for pair in pairs[np.sort(first_positions)].tolist():
+			type_column, column = divmod(pair, len(self.category_names))
+			self.categories[self.event_types[type_column]].add(self.category_names[column])
+
+	def expand(self):
+		""" write the events added since the last expansion into the matrices """
+
+		if self.expanded == self.log.n:
+			return
+
+		new_events = range(self.expanded, self.log.n)
+		self.expanded = self.log.n
+
+		if self.expansion == "difference":
+			changed = self.expand_differences(new_events)
+		else:
+			changed = self.expand_strided(new_events)
+
+		self.sum_exact_rows(changed)
+
+	def expand_strided(self, event_ids, sign=1):
+		""" write all the occurrences of every event as one strided slice, return the rows changed """
+
+		log = self.log
+		changed = np.zeros(self.n_months, dtype=bool)
+
+		for event_id in event_ids:
+			column, type_column = log.categories[event_id], log.types[event_id]
+			event_sum = log.sum(event_id)
+			rows = self.occurrences(int(log.firsts[event_id]), int(log.lasts[event_id]), int(log.periods[event_id]))
+
+			self.values[rows, column] += sign*event_sum
+			self.type_sums[rows, type_column] += sign*event_sum
+			self.touch_counts[rows] += sign
+			changed[rows] = True
+
+			if isinstance(event_sum, float):
+				self.float_counts[rows, column] += sign
+				self.type_float_counts[rows, type_column] += sign
+				if event_sum != int(event_sum):
+					self.exact_rows.update(range(self.n_months)[rows])
+
+		return changed
+
+	def expand_differences(self, event_ids, sign=1):
+		"""
+		write events with one difference array per period and a strided
+		cumulative sum, return the rows changed
+		"""
+
+		n_categories = self.values.shape[1]
+		n_types = len(self.event_types)
+		width = 2*(n_categories + n_types) + 1 # sums, float counts, touched count
+
+		log = self.log
+		event_ids = np.asarray(event_ids, dtype=int)
+		firsts, lasts, periods = log.firsts[event_ids], log.lasts[event_ids], log.periods[event_ids]
+		category_columns, type_columns = log.categories[event_ids], log.types[event_ids].astype(int)
+		sums = sign*log.sums[event_ids]
+		floats = sign*log.is_float[event_ids].astype(float)
+
+		# first occurrence inside, number of occurrences inside and the row
+		# one period after the last occurrence
+		firsts = np.where(firsts < 0, firsts % periods, firsts)
+		counts = (np.minimum(lasts, self.n_months - 1) - firsts) // periods + 1
+		inside = counts > 0
+		ends = firsts + counts*periods
+
+		# a cumulative sum of integers is exact, anything else is summed again
+		exact = inside & (sums != np.floor(sums))
+		integral_sums = np.where(exact, 0, sums)
+		changed = np.zeros(self.n_months, dtype=bool)
+
+		for period in np.unique(periods[inside]).tolist():
+
+			selected = np.flatnonzero(inside & (periods == period))
+			length = -(-(self.n_months + period) // period) * period
+			differences = np.zeros((length, width))
+
+			for column_ids, weights in (
+					(category_columns[selected], integral_sums[selected]),
+					(n_categories + type_columns[selected], integral_sums[selected]),
+					(n_categories + n_types + category_columns[selected], floats[selected]),
+					(2*n_categories + n_types + type_columns[selected], floats[selected]),
+					(width - 1, sign)):
+				np.add.at(differences, (firsts[selected], column_ids), weights)
+				np.add.at(differences, (ends[selected], column_ids), -weights)
+
+			# cumulative sum along every period-th row
+			totals = differences.reshape(-1, period, width).cumsum(axis=0).reshape(length, width)[:self.n_months]
+			counts_total = totals[:, n_categories + n_types:].round().astype(np.int32)
+
+			self.values += totals[:, :n_categories]
+			self.type_sums += totals[:, n_categories:n_categories + n_types]
+			self.float_counts += counts_total[:, :n_categories]
+			self.type_float_counts += counts_total[:, n_categories:n_categories + n_types]
+			self.touch_counts += counts_total[:, -1]
+			changed |= counts_total[:, -1] != 0
+
+		for i in np.flatnonzero(exact).tolist():
+			self.exact_rows.update(range(firsts[i], ends[i], periods[i]))
+
+		return changed
+
+	def sum_exact_rows(self, changed):
+		""" sum again the exact rows among the changed ones """
+		rows = np.fromiter(self.exact_rows, dtype=int, count=len(self.exact_rows))
+		self.sum_rows(np.sort(rows[changed[rows]]))
+
+	def sum_exact(self, rows):
+		""" sum again the exact rows among the given ones """
+		self.sum_rows(np.array(sorted(self.exact_rows.intersection(rows)), dtype=int))
+
+	def hit_keys(self, rows, first_event, last_event):
+		""" row << 32 | event id of the events in [first_event, last_event) in the rows, sorted """
+
+		log = self.log
+		firsts, lasts, periods = log.firsts[first_event:last_event], log.lasts[first_event:last_event], log.periods[first_event:last_event]
+		keys = list()
+		for start in range(0, len(rows), Ledger.rows_per_sum):
+			row_column = rows[start:start + Ledger.rows_per_sum, None]
+			hit_rows, hits = np.nonzero((firsts <= row_column) & (row_column <= lasts) & ((row_column - firsts) % periods == 0))
+			keys.append((row_column[hit_rows, 0] << 32) | (first_event + hits))
+		return np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+
+	def update_exact_hits(self):
+		""" take the removed events out of exact_hits, add the new events and the new exact rows """
+
+		log = self.log
+		hits = self.exact_hits
+		if self.hit_removals != self.removals:
+			hits = hits[log.live[hits & 0xffffffff]]
+			self.hit_removals = self.removals
+
+		old_rows = np.array(sorted(self.hit_rows), dtype=np.int64)
+		if self.hit_events < log.n and len(old_rows):
+			new_hits = self.hit_keys(old_rows, self.hit_events, log.n)
+			hits = np.insert(hits, np.searchsorted(hits, new_hits), new_hits)
+
+		new_rows = np.array(sorted(self.exact_rows - self.hit_rows), dtype=np.int64)
+		if len(new_rows):
+			new_hits = self.hit_keys(new_rows, 0, log.n)
+			hits = np.insert(hits, np.searchsorted(hits, new_hits), new_hits)
+
+		self.exact_hits = hits
+		self.hit_rows.update(new_rows.tolist())
+		self.hit_events = log.n
+
+	def sum_rows(self, rows):
+		""" sum exact months again event by event, in insertion order """
+		if len(rows):
+			self.values[rows], self.type_sums[rows] = self.exact_sums(rows)
+
+	def exact_sums(self, rows, day=None):
+		"""
+		category and type sums of exact months, or of a day of them, event by
+		event in insertion order. bincount adds its weights one after the
+		other, as python would, and the hits are sorted by row and then by
+		event id
+		"""
+
+		self.update_exact_hits()
+
+		# the hits of every row are a slice of the sorted hits
+		log = self.log
+		bounds = np.searchsorted(self.exact_hits, np.stack([rows, rows + 1], axis=1) << 32)
+		counts = bounds[:, 1] - bounds[:, 0]
+		positions = np.repeat(np.arange(len(rows)), counts)
+		keys = self.exact_hits[np.repeat(bounds[:, 0] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+		hits = keys & 0xffffffff
+		sums = log.sums[hits]
+
+		override_keys = [(row << 32) | event_id for row in rows.tolist() for event_id in self.overrides.get(row, ())]
+		if override_keys:
+			sums[np.searchsorted(keys, override_keys)] = [event_sum for row in rows.tolist() for event_sum in self.overrides.get(row, {}).values()]
+
+		if day is not None:
+			on_day = log.days[hits] == day
+			positions, hits, sums = positions[on_day], hits[on_day], sums[on_day]
+
+		n_columns, n_types = self.values.shape[1], len(self.event_types)
+		return (np.bincount(positions*n_columns + log.categories[hits], weights=sums, minlength=len(rows)*n_columns).reshape(len(rows), n_columns),
+		        np.bincount(positions*n_types + log.types[hits], weights=sums, minlength=len(rows)*n_types).reshape(len(rows), n_types))
+
+	def row_hits(self, row, day=None):
+		""" ids of the events in a month, or on a day of it, in insertion order """
+		log = self.log
+		firsts, lasts, periods = log.firsts[:log.n], log.lasts[:log.n], log.periods[:log.n]
+		hits = (firsts <= row) & (row <= lasts) & ((row - firsts) % periods == 0)
+		if day is not None:
+			hits &= log.days[:log.n] == day
+		return np.flatnonzero(hits)
+
+	def row_events(self, row, hits=None):
+		""" (event id, sum) of every event in a month, in insertion order """
+
+		if hits is None:
+			hits = self.row_hits(row)
+		event_ids = hits.tolist()
+		sums = list(map(as_number, self.log.sums[hits].tolist(), self.log.is_float[hits].tolist()))
+
+		row_overrides = self.overrides.get(row)
+		if row_overrides:
+			sums = [row_overrides.get(i, event_sum) for i, event_sum in zip(event_ids, sums)]
+
+		return list(zip(event_ids, sums))
+
+	def indexed_events(self, category, person_type):
+		""" ids of the events with a category and person type, in insertion order """
+
+		key = (self.category_columns.get(category), self.person_types.ids.get(person_type))
+		event_ids = self.event_index.get(key, [])
+
+		array = self.index_arrays.get(key)
+		if array is None or len(array) != len(event_ids):
+			array = self.index_arrays[key] = np.array(event_ids, dtype=int)
+		return array
+
+	def first_events(self, category, person_type, first_month, end_month):
+		"""
+		id of the first event with a category and person type in every month
+		of [first_month, end_month), -1 where there is none
+		"""
+
+		rows = np.arange(first_month, end_month) - self.first_month
+		event_ids = np.full(len(rows), -1)
+		candidates = self.indexed_events(category, person_type)
+		if len(candidates) == 0 or len(rows) == 0:
+			return event_ids
+
+		log = self.log
+		firsts, lasts, periods = (log.firsts[candidates, None], log.lasts[candidates, None], log.periods[candidates, None])
+		hits = (firsts <= rows) & (rows <= lasts) & ((rows - firsts) % periods == 0) & (rows >= 0) & (rows < self.n_months)
+
+		found = hits.any(axis=0)
+		event_ids[found] = candidates[hits.argmax(axis=0)[found]]
+		return event_ids
+
+	def event_sum(self, event_id, row):
+		""" sum of an occurrence of an event, with its override """
+		return self.overrides.get(row, {}).get(event_id, self.log.sum(event_id))
+
+	def first_event_sums(self, category, person_type, first_month, end_month):
+		""" sum of the first matching event in every month of [first_month, end_month), 0 where there is none """
+
+		event_ids = self.first_events(category, person_type, first_month, end_month).tolist()
+		return [self.event_sum(event_id, month - self.first_month) if event_id >= 0 else 0 for month, event_id in zip(range(first_month, end_month), event_ids)]
+
+	def find_event(self, row, category, person_type):
+		""" id and sum of the first event of a month with the category and person type """
+
+		month = self.first_month + row
+		event_id = int(self.first_events(category, person_type, month, month + 1)[0])
+		if event_id < 0:
+			return None, 0
+
+		return event_id, self.event_sum(event_id, row)
+
+	def scale_events(self, category, person_type, first_month, end_month, factors, round_to=None, sum_exact=True):
+		"""
+		scale the first event with a category and person type in every month
+		of [first_month, end_month) by a factor, or by one factor per month,
+		rounded down to a multiple of round_to. Return the (event id, row,
+		previous override) of every change, for restore_event_sum.
+		sum_exact=False leaves summing the exact rows again to the caller
+		"""
+
+		self.expand()
+
+		if not isinstance(factors, (list, tuple, np.ndarray)):
+			factors = [factors] * (end_month - first_month)
+
+		event_ids = self.first_events(category, person_type, first_month, end_month)
+		found = np.flatnonzero(event_ids >= 0).tolist()
+		if not found:
+			return []
+
+		rows = [first_month - self.first_month + i for i in found]
+		curr_sums = [self.event_sum(int(event_ids[i]), row) for i, row in zip(found, rows)]
+		found_factors = [factors[i] for i in found]
+
+		new_sums = np.array(curr_sums, dtype=float) * np.array(found_factors, dtype=float)
+		if round_to:
+			new_sums = np.floor_divide(new_sums, round_to) * round_to
+
+		changes = list()
+		for i, row, new_sum, curr_sum, factor in zip(found, rows, new_sums.tolist(), curr_sums, found_factors):
+			is_float = isinstance(curr_sum, float) or isinstance(factor, float)
+			event_id = int(event_ids[i])
+			changes.append((event_id, row, self.set_event_sum(event_id, row, as_number(new_sum, is_float), sum_exact=False)))
+		if sum_exact:
+			self.sum_exact(rows)
+
+		return changes
+
+	def event_strings(self, event_id):
+		""" type, category, name and person type of an event """
+		log = self.log
+		return (self.event_types[log.types[event_id]], self.category_names[log.categories[event_id]],
+		        self.names.strings[log.names[event_id]], self.person_types.strings[log.person_types[event_id]])
+
+	def is_event_of(self, event_id, category, person_type):
+		event_type, event_category, name, event_person_type = self.event_strings(event_id)
+		return event_category == category and event_person_type == person_type
+
+	def event_months(self, event_id):
+		""" first and last month ordinal of an event, unclipped """
+		return self.first_month + int(self.log.firsts[event_id]), self.first_month + int(self.log.lasts[event_id])
+
+	def set_event_sum(self, event_id, row, new_sum, sum_exact=True):
+		"""
+		change the sum of a single occurrence of an event, return the previous
+		override. sum_exact=False leaves summing an exact row again to the caller
+		"""
+
+		self.expand()
+
+		previous = self.overrides.get(row, {}).get(event_id)
+		curr_sum = self.log.sum(event_id) if previous is None else previous
+		column, type_column = self.log.categories[event_id], self.log.types[event_id]
+
+		self.overrides.setdefault(row, {})[event_id] = new_sum
+
+		self.values[row, column] = float(self.values[row, column]) - curr_sum + new_sum
+		self.type_sums[row, type_column] = float(self.type_sums[row, type_column]) - curr_sum + new_sum
+
+		float_change = isinstance(new_sum, float) - isinstance(curr_sum, float)
+		self.float_counts[row, column] += float_change
+		self.type_float_counts[row, type_column] += float_change
+
+		if sum_exact and row in self.exact_rows:
+			self.sum_rows(np.array([row]))
+
+		self.mark_dirty(row)
+
+		return previous
+
+	def restore_event_sum(self, event_id, row, previous, sum_exact=True):
+		""" undo set_event_sum with the override it returned """
+
+		if not self.log.live[event_id]:
+			return
+
+		if previous is None:
+			self.set_event_sum(event_id, row, self.log.sum(event_id), sum_exact)
+			del self.overrides[row][event_id]
+			if not self.overrides[row]:
+				del self.overrides[row]
+		else:
+			self.set_event_sum(event_id, row, previous, sum_exact)
+
+	def restore_event_sums(self, changes):
+		""" restore_event_sum of the changes in their order, the exact rows are summed again once """
+		rows = set()
+		for event_id, row, previous in changes:
+			self.restore_event_sum(event_id, row, previous, sum_exact=False)
+			rows.add(row)
+		self.sum_exact(rows)
+
+	def row_type_sums(self, row):
+		return {event_type: self.type_sum(row, event_type) for event_type in self.event_types}
+
+	def row_categories(self, row):
+		return {category: self.category_sum(row, category) for category in self.category_columns}
+
+	def type_sum(self, row, event_type):
+		self.expand()
+		column = self.type_columns[event_type]
+		return as_number(self.type_sums[row, column], self.type_float_counts[row, column])
+
+	def category_sum(self, row, category):
+		self.expand()
+		column = self.category_columns[category]
+		return as_number(self.values[row, column], self.float_counts[row, column])
+
+	def type_series(self, event_type):
+		""" sums of an event type for every month of the ledger """
+		self.expand()
+		return self.type_sums[:, self.type_columns[event_type]]
+
+	def touched_rows(self):
+		self.expand()
+		return np.flatnonzero(self.touch_counts)
+
+	def date_rows(self):
+		"""
+		(rows, days, category sums, category float counts, type sums, type
+		float counts) of every date with events, in date order. A month with
+		events on other days than the 1st is split into a row per day: the
+		occurrences of those events are summed by day in insertion order, and
+		the 1st keeps the rest of the month
+		"""
+
+		rows = self.touched_rows()
+		log = self.log
+		parts = [self.values[rows], self.float_counts[rows], self.type_sums[rows], self.type_float_counts[rows], self.touch_counts[rows]]
+
+		day_events = np.flatnonzero(log.live[:log.n] & (log.days[:log.n] != 1))
+		counts = self.occurrence_counts(day_events)
+		day_events, counts = day_events[counts > 0], counts[counts > 0]
+		if not len(day_events):
+			return (rows, np.ones(len(rows), dtype=int)) + tuple(parts[:4])
+
+		# every occurrence of the events, by event and then by row
+		hits = np.repeat(day_events, counts)
+		periods = log.periods[day_events]
+		firsts = log.firsts[day_events]
+		firsts = np.where(firsts < 0, firsts % periods, firsts)
+		steps = np.arange(len(hits)) - np.repeat(np.cumsum(counts) - counts, counts)
+		hit_rows = np.repeat(firsts, counts) + steps*np.repeat(periods, counts)
+
+		# bincount adds the occurrences of a (row, day) one after the other
+		keys, positions = np.unique(hit_rows*32 + log.days[hits], return_inverse=True)
+		day_parts = list()
+		for values, columns, weights in ((parts[0], log.categories[hits], log.sums[hits]), (parts[1], log.categories[hits], log.is_float[hits]),
+		                                 (parts[2], log.types[hits], log.sums[hits]), (parts[3], log.types[hits], log.is_float[hits])):
+			width = values.shape[1]
+			day_part = np.bincount(positions*width + columns, weights=weights, minlength=len(keys)*width).reshape(len(keys), width)
+			day_parts.append(day_part.astype(values.dtype))
+		day_parts.append(np.bincount(positions, minlength=len(keys)))
+
+		# the 1st is the month without its other days, summed again in the exact rows
+		split = np.searchsorted(rows, keys // 32)
+		for part, day_part in zip(parts, day_parts):
+			np.subtract.at(part, split, day_part)
+		split = np.unique(split)
+		exact = split[np.isin(rows[split], list(self.exact_rows))]
+		if len(exact):
+			parts[0][exact], parts[2][exact] = self.exact_sums(rows[exact], 1)
+
+		first_days = parts[4] > 0
+		order = np.argsort(np.concatenate([rows[first_days]*32 + 1, keys]), kind='stable')
+		rows = np.concatenate([rows[first_days], keys // 32])[order]
+		days = np.concatenate([np.ones(first_days.sum(), dtype=int), keys % 32])[order]
+		return (rows, days) + tuple(np.concatenate([part[first_days], day_part])[order] for part, day_part in zip(parts[:4], day_parts[:4]))
+
+
+def as_number(value, is_float):
+	""" python number as it would have been summed with python numbers """
+	if is_float:
+		return float(value)
+	return int(value)
+
+def as_numbers(values, float_counts):
+	""" as_number of every cell of a matrix, as lists of rows """
+	return np.where(float_counts > 0, values.astype(object), values.astype(np.int64).astype(object)).tolist()
@@ -0,0 +1,126 @@
+import csv
+import time
+import numpy as np
+from month_calendar import to_date
+
+
+
+# BANK under random investment returns and inflation.
+#
+# The planner sums are in today's money. On every path each month the bank
+# grows by a random return and then gets the month balance grown by the
+# random price index so far:
+#
+#   bank[t] = bank[t-1]*growth[t] + balance[t]*cpi[t]
+#
+# which is, with G[t] the product of growth[1..t],
+#
+#   bank[t] = G[t]*(bank[0] + sum(balance[k]*cpi[k]/G[k] for k <= t))
+#
+# so a block of months is a cumulative product and a cumulative sum over a
+# (months x paths) array. The reported bands are in today's money
+# (bank[t]/cpi[t]).
+
+BLOCK_MONTHS = 24 # months simulated at once, bounds the memory to paths*BLOCK_MONTHS
+PERCENTILES = [5, 50, 95]
+
+
+def monthly_log_rates(yearly_mean, yearly_std):
+	""" mean and std of a monthly log growth with the given yearly mean and std """
+	std = yearly_std / np.sqrt(12)
+	mean = np.log1p(yearly_mean) / 12 - std*std/2
+	return mean, std
+
+
+def random_walk(rng, n_months, paths, mean, std):
+	""" cumulative sum of normal monthly steps, drawn in float32 """
+	steps = rng.standard_normal((n_months, paths), dtype=np.float32)
+	steps *= np.float32(std)
+	steps += np.float32(mean)
+	return steps.cumsum(axis=0, dtype=float)
+
+
+def percentiles(block_bank):
+	""" PERCENTILES of every month (row), nearest rank """
+	paths = block_bank.shape[1]
+	ranks = [(paths - 1)*p // 100 for p in PERCENTILES]
+	return np.partition(block_bank, ranks, axis=1)[:, ranks].T
+
+
+def simulate(balances, initial_saving, paths, return_mean, return_std, inflation_mean, inflation_std, seed=None):
+	"""
+	Simulate BANK per month for a number of paths.
+
+	Return the p5/p50/p95 bands of BANK per month (3 x months), the
+	probability of BANK below zero per month and the probability of BANK
+	going below zero at least once.
+	"""
+
+	rng = np.random.default_rng(seed)
+	n_months = len(balances)
+
+	return_log_mean, return_log_std = monthly_log_rates(return_mean, return_std)
+	inflation_log_mean, inflation_log_std = monthly_log_rates(inflation_mean, inflation_std)
+
+	bands = np.empty((len(PERCENTILES), n_months))
+	negative = np.empty(n_months)
+
+	bank = np.full(paths, float(initial_saving))
+	log_cpi = np.zeros(paths)
+	ruined = np.zeros(paths, dtype=bool)
+
+	# arrays are (months x paths), a month is a contiguous row
+	for block_start in range(0, n_months, BLOCK_MONTHS):
+
+		block = slice(block_start, min(block_start + BLOCK_MONTHS, n_months))
+		block_len = block.stop - block.start
+
+		growth = np.exp(random_walk(rng, block_len, paths, return_log_mean, return_log_std))
+		block_log_cpi = random_walk(rng, block_len, paths, inflation_log_mean, inflation_log_std)
+		block_log_cpi += log_cpi
+		cpi = np.exp(block_log_cpi)
+
+		block_bank = cpi * balances[block, None]
+		block_bank /= growth
+		np.cumsum(block_bank, axis=0, out=block_bank)
+		block_bank += bank
+		block_bank *= growth
+
+		bank = block_bank[-1].copy()
+		log_cpi = block_log_cpi[-1]
+
+		block_bank /= cpi # today's money
+
+		bands[:, block] = percentiles(block_bank)
+		below = block_bank < 0
+		negative[block] = below.mean(axis=1)
+		ruined |= below.any(axis=0)
+
+	return bands, negative, ruined.mean()
+
+
+def write_montecarlo(csv_file_name, first_month, bands, negative):
+	with open(csv_file_name, 'w', newline='') as csvfile:
+		writer = csv.writer(csvfile)
+		writer.writerow(['DATE'] + [f'BANK_P{p}' for p in PERCENTILES] + ['P_NEGATIVE'])
+		for row, (band, p_negative) in enumerate(zip(bands.T.round(2).tolist(), negative.tolist())):
+			writer.writerow([to_date(first_month + row)] + band + [p_negative])
+
+
+def run_montecarlo(plan, paths, seed=None):
+	""" simulate a built plan and write montecarlo.csv next to cash_flow.csv """
+
+	config = plan.config
+	balances = plan.ledger.type_series("income") - plan.ledger.type_series("expense")
+
+	start_time = time.perf_counter()
+	bands, negative, p_ruin = simulate(balances, config.initial_saving, paths,
+	                                   config.return_mean, config.return_std,
+	                                   config.inflation_mean, config.inflation_std, seed)
+
+	write_montecarlo(config.proj_dir + '/montecarlo.csv', plan.ledger.first_month, bands, negative)
+
+	print (f"{paths} paths, {len(balances)} months, {time.perf_counter() - start_time:.2f}s")
+	print (f"probability of BANK below zero: {p_ruin:.4f}")
+
+	return p_ruin
@@ -0,0 +1,142 @@
+import functools
+import numpy as np
+from datetime import date
+from calendar import monthrange
+
+
+
+# Month ordinals: a month is the integer year*12 + month, so adding n months
+# is adding n and the distance between two months is a subtraction.
+# Dates are converted back only when something is written out.
+
+SCHOOL_YEAR_MONTH = 9
+
+TABLE_FIRST_YEAR = 1900
+TABLE_LAST_YEAR  = 2200
+TABLE_FIRST = TABLE_FIRST_YEAR*12 + 1
+TABLE_LAST  = TABLE_LAST_YEAR*12 + 12
+
+class ChildcareType:
+	DAYCARE=1
+	KINDERGARDEN_ZAHARON=2
+	SCHOOL_ZAHARON=3
+	POST_CHILDCARE=4
+
+# age at the end of the civil year a school year starts in, from which the
+# child is in KINDERGARDEN_ZAHARON, SCHOOL_ZAHARON and POST_CHILDCARE, as in
+# the default child rules (child_rules.py)
+EDUCATION_AGES = (3, 6, 9)
+
+def to_ordinal(given_date):
+	""" month ordinal of a date, the day is ignored """
+	return given_date.year*12 + given_date.month
+
+def month_ordinal(year, month):
+	return year*12 + month
+
+def to_date(ordinal, day=1):
+	""" date of a month ordinal, the first of the month by default """
+	year, month = divmod(ordinal - 1, 12)
+	return date(year=year, month=month + 1, day=day)
+
+def year_of(ordinal):
+	return (ordinal - 1) // 12
+
+def month_of(ordinal):
+	return (ordinal - 1) % 12 + 1
+
+def next_first_of_month(given_date):
+	""" ordinal of the first 1st of month on or after a date """
+	if given_date.day == 1:
+		return to_ordinal(given_date)
+	return to_ordinal(given_date) + 1
+
+def next_month_of(ordinal, month):
+	""" first ordinal on or after the given one that falls in month """
+	return ordinal + (month - month_of(ordinal)) % 12
+
+# days in month and next school year start, one entry per month ordinal
+days_in_month_table = [monthrange(year_of(o), month_of(o))[1] for o in range(TABLE_FIRST, TABLE_LAST + 1)]
+school_year_table = [next_month_of(o, SCHOOL_YEAR_MONTH) for o in range(TABLE_FIRST, TABLE_LAST + 1)]
+
+def days_in_month(ordinal):
+	if TABLE_FIRST <= ordinal <= TABLE_LAST:
+		return days_in_month_table[ordinal - TABLE_FIRST]
+	return monthrange(year_of(ordinal), month_of(ordinal))[1]
+
+def month_days(ordinals):
+	""" days in month of an array of month ordinals """
+	firsts = (np.asarray(ordinals, dtype=np.int64) - month_ordinal(1970, 1)).astype('datetime64[M]')
+	return ((firsts + 1).astype('datetime64[D]') - firsts.astype('datetime64[D]')).astype(np.int64)
+
+def occurrence_days(first_month, day, period, count):
+	"""
+	day of the first count occurrences of a date every period months. The
+	months are added one after the other, as relativedelta does, so a day
+	clipped to the end of a shorter month stays clipped
+	"""
+	return np.minimum(day, np.minimum.accumulate(month_days(first_month + period*np.arange(count))))
+
+def school_year_start(ordinal):
+	""" ordinal of the first September on or after the given month """
+	if TABLE_FIRST <= ordinal <= TABLE_LAST:
+		return school_year_table[ordinal - TABLE_FIRST]
+	return next_month_of(ordinal, SCHOOL_YEAR_MONTH)
+
+def age_in_months(birthday, ordinal):
+	""" full months of age on the first of the given month """
+	months = ordinal - to_ordinal(birthday)
+	if birthday.day > 1:
+		months -= 1
+	return months
+
+def age_at_end_of_year(birthday, ordinal):
+	""" full years of age on December 31 of the year of the given month """
+	return year_of(ordinal) - birthday.year
+
+# Education stages: the stage of a school year depends only on the age at the
+# end of the civil year it starts in, the year of the school year less the
+# birth year. The first month of the school year of every birth year and age
+# is a table, and a StageCalendar adds the stage of every age for its stage
+# ages and the first months of the stages of every birth year. A calendar is
+# made once per stage ages and shared by every child and plan of the process,
+# so the school years and stage periods of a child are lookups.
+SCHOOL_AGES = 120
+school_year_by_age_table = np.add.outer(np.arange(TABLE_FIRST_YEAR, TABLE_LAST_YEAR + 1)*12 + SCHOOL_YEAR_MONTH, np.arange(SCHOOL_AGES + 1)*12)
+
+def school_year_months(birth_years, ages):
+	""" first months of the school years starting in the years the children of birth_years turn ages, broadcast """
+	birth_years, ages = np.broadcast_arrays(np.asarray(birth_years, dtype=np.int64), np.asarray(ages, dtype=np.int64))
+	inside = (birth_years >= TABLE_FIRST_YEAR) & (birth_years <= TABLE_LAST_YEAR) & (ages >= 0) & (ages <= SCHOOL_AGES)
+	months = (birth_years + ages)*12 + SCHOOL_YEAR_MONTH
+	months[inside] = school_year_by_age_table[birth_years[inside] - TABLE_FIRST_YEAR, ages[inside]]
+	return months
+
+class StageCalendar:
+	""" stages of the school years of a child, DAYCARE and one more from every stage age on """
+
+	def __init__(self, stage_ages):
+		self.stage_ages = tuple(stage_ages)
+		ages = np.arange(SCHOOL_AGES + 1)
+		self.stage_by_age = ChildcareType.DAYCARE + np.searchsorted(self.stage_ages, ages, side='right')
+		self.stage_starts_table = np.add.outer(np.arange(TABLE_FIRST_YEAR, TABLE_LAST_YEAR + 1)*12 + SCHOOL_YEAR_MONTH, np.array(self.stage_ages, dtype=np.int64)*12)
+
+	def stage(self, birth_ordinals, ordinals):
+		""" stage of the school year of the given months, of children born in birth_ordinals, broadcast """
+		ordinals = np.asarray(ordinals, dtype=np.int64)
+		school_years = year_of(ordinals) - (month_of(ordinals) < SCHOOL_YEAR_MONTH)
+		ages = np.clip(school_years - year_of(np.asarray(birth_ordinals, dtype=np.int64)), 0, SCHOOL_AGES)
+		return self.stage_by_age[ages]
+
+	def stage_starts(self, birth_ordinals):
+		""" (children x stage ages) first months of the stages after DAYCARE """
+		birth_years = year_of(np.asarray(birth_ordinals, dtype=np.int64)).reshape(-1)
+		inside = (birth_years >= TABLE_FIRST_YEAR) & (birth_years <= TABLE_LAST_YEAR)
+		starts = np.add.outer(birth_years*12 + SCHOOL_YEAR_MONTH, np.array(self.stage_ages, dtype=np.int64)*12)
+		starts[inside] = self.stage_starts_table[birth_years[inside] - TABLE_FIRST_YEAR]
+		return starts
+
+@functools.lru_cache(maxsize=None)
+def stage_calendar(stage_ages=EDUCATION_AGES):
+	""" the shared calendar of the stage ages """
+	return StageCalendar(stage_ages)
@@ -0,0 +1,268 @@
+import io
+import csv
+import argparse
+import contextlib
+import numpy as np
+from datetime import datetime
+from month_calendar import to_ordinal, to_date, month_of
+
+
+
+# Mortgage amortization.
+#
+# A loan is made of tracks, each with its principal, yearly rate, term,
+# method (spitzer: a fixed payment, equal_principal: the same part of the
+# principal every month) and optional CPI linkage (the balance and the
+# payments grow with the index every month). The schedule of a track is a
+# list of segments, one from the first payment and one from every change
+# (an early repayment or a refinance to a new rate and/or term). Inside a
+# segment every month is in closed form:
+#
+#   spitzer          payment  B*r / (1 - (1+r)^-n)
+#                    balance  B*(1+r)^k - payment*((1+r)^k - 1)/r
+#   equal_principal  payment  B/n + r*(B - (k-1)*B/n)
+#                    balance  B - k*B/n
+#
+# for the balance B at its start, the monthly rate r and the n months left,
+# times (1+g)^k for the monthly CPI growth g, so a segment is computed with
+# numpy at once. A schedule made from another one of the same track keeps
+# the segments before the first change that differs, only the tail is
+# computed again. In the ledger a schedule is a few events: the runs of the
+# same payment, split every January so that a change replaces the payments
+# of its year on and not the ones before.
+
+METHODS = ("spitzer", "equal_principal")
+INDEXES = ("fixed", "cpi")
+REPAY = "repay"
+REFINANCE = "refinance"
+
+
+class Track:
+	""" a loan track, rate and cpi are yearly fractions, term in months from the first payment month """
+
+	def __init__(self, name, principal, rate, term, first_month, method="spitzer", cpi=0.0):
+		self.name = name
+		self.principal = principal
+		self.rate = rate
+		self.term = term
+		self.first_month = first_month
+		self.method = method
+		self.cpi = cpi
+
+	def key(self):
+		return (self.name, self.principal, self.rate, self.term, self.first_month, self.method, self.cpi)
+
+
+class Change:
+	"""
+	an early repayment (amount, None repays all of it) or a refinance (rate
+	and/or term, in months from its month), from the payment of its month on
+	"""
+
+	def __init__(self, month, kind, amount=None, rate=None, term=None):
+		self.month = month
+		self.kind = kind
+		self.amount = amount
+		self.rate = rate
+		self.term = term
+
+	def key(self):
+		return (self.month, self.kind, self.amount, self.rate, self.term)
+
+
+class Segment:
+	""" the payments from a month on, and the state the segment started with """
+
+	def __init__(self, first_month, balance, rate, last_month, repayment, payments, balances):
+		self.first_month = first_month
+		self.balance = balance       # before the repayment of its change
+		self.rate = rate
+		self.last_month = last_month # of the loan, as of this segment
+		self.repayment = repayment   # paid in first_month on top of the payment
+		self.payments = payments
+		self.balances = balances     # after every payment
+
+
+def segment_payments(balance, rate, n_months, method, growth, count):
+	""" payments and balances of the first count months of a balance paid over n_months """
+
+	k = np.arange(1, count + 1)
+	index = (1 + growth) ** k
+	r = rate / 12
+
+	if method == "spitzer":
+		if r == 0:
+			payment = balance / n_months
+			real_balances = balance - payment*k
+		else:
+			payment = balance * r / (1 - (1 + r) ** -n_months)
+			real_balances = balance*(1 + r)**k - payment*((1 + r)**k - 1)/r
+		payments = payment * index
+	else:
+		principal = balance / n_months
+		payments = (principal + r*(balance - (k - 1)*principal)) * index
+		real_balances = balance - k*principal
+
+	return payments, np.maximum(real_balances, 0) * index
+
+
+class Schedule:
+
+	def __init__(self, track, changes=(), base=None):
+		self.track = track
+		self.changes = sorted(changes, key=lambda change: change.month)
+		self.growth = (1 + track.cpi) ** (1/12) - 1
+		self.segments = list()
+
+		# segment i ends before change i, the ones before the first change that differs are the same
+		if base is not None and base.track.key() == track.key():
+			same = 0
+			while same < min(len(self.changes), len(base.changes)) and self.changes[same].key() == base.changes[same].key():
+				same += 1
+			self.segments = base.segments[:same]
+
+		self.compute()
+
+	def compute(self):
+		""" the segments after the kept ones """
+
+		track = self.track
+		if not self.segments:
+			self.add_segment(track.first_month, track.principal, track.rate, track.first_month + track.term - 1, 0)
+
+		for change in self.changes[len(self.segments) - 1:]:
+			last = self.segments[-1]
+			balance = last.balances[-1] if len(last.payments) else last.balance - last.repayment
+			if change.month > last.last_month or balance <= 0:
+				break
+
+			repayment, rate, last_month = 0, last.rate, last.last_month
+			month = max(change.month, last.first_month)
+			if change.kind == REPAY:
+				repayment = balance if change.amount is None else min(change.amount, balance)
+			else:
+				rate = rate if change.rate is None else change.rate
+				last_month = last_month if change.term is None else month + change.term - 1
+			self.add_segment(month, balance, rate, last_month, repayment)
+
+	def add_segment(self, month, balance, rate, last_month, repayment):
+		""" the payments from month until the next change or the end of the loan """
+		i = len(self.segments)
+		next_month = self.changes[i].month if i < len(self.changes) else last_month + 1
+		left = balance - repayment
+		count = max(min(next_month, last_month + 1) - month, 0) if left > 0 else 0
+		payments, balances = segment_payments(left, rate, max(last_month - month + 1, 1), self.track.method, self.growth, count)
+		self.segments.append(Segment(month, balance, rate, last_month, repayment, payments, balances))
+
+	def payments(self):
+		""" (months, payments) of every month with a payment, repayments included """
+		months = [np.zeros(0, dtype=int)]
+		payments = [np.zeros(0)]
+		for segment in self.segments:
+			paid = segment.payments
+			if segment.repayment:
+				paid = paid.copy() if len(paid) else np.zeros(1)
+				paid[0] += segment.repayment
+			months.append(segment.first_month + np.arange(len(paid)))
+			payments.append(paid)
+		return np.concatenate(months), np.concatenate(payments)
+
+	def runs(self):
+		"""
+		(kind, first month, last month, sum) of the payments rounded to agorot:
+		the runs of the same payment split every January, and the repayments
+		"""
+
+		months = np.concatenate([segment.first_month + np.arange(len(segment.payments)) for segment in self.segments] or [np.zeros(0, dtype=int)])
+		payments = np.round(np.concatenate([segment.payments for segment in self.segments] or [np.zeros(0)]), 2)
+
+		starts = np.flatnonzero(np.concatenate([[True], (payments[1:] != payments[:-1]) | (month_of(months[1:]) == 1)])) if len(months) else np.zeros(0, dtype=int)
+		ends = np.append(starts[1:], len(months)) - 1
+
+		runs = [("payment", first, last, payment) for first, last, payment in zip(months[starts].tolist(), months[ends].tolist(), payments[starts].tolist())]
+		runs += [("repayment", segment.first_month, segment.first_month, round(float(segment.repayment), 2)) for segment in self.segments if segment.repayment]
+		return sorted(runs, key=lambda run: (run[1], run[0]))
+
+	def total_paid(self):
+		return float(sum(segment.payments.sum() + segment.repayment for segment in self.segments))
+
+	def last_month(self):
+		""" month of the last payment, None if there is none """
+		months, __ = self.payments()
+		return int(months[-1]) if len(months) else None
+
+
+def parse_change(kind, spec, format_str):
+	""" (track name, Change) of NAME=DATE[:SUM] (repay) or NAME=DATE:RATE[:TERM_MONTHS] (refinance), RATE in percent """
+	name, __, rest = spec.partition('=')
+	parts = rest.split(':')
+	month = to_ordinal(datetime.strptime(parts[0], format_str))
+	if kind == REPAY:
+		return name, Change(month, REPAY, amount=float(parts[1]) if len(parts) > 1 else None)
+	return name, Change(month, REFINANCE, rate=float(parts[1])/100 if len(parts) > 1 and parts[1] else None, term=int(parts[2]) if len(parts) > 2 else None)
+
+
+def write_schedules(csv_file_name, schedules, format_str):
+	""" the payment of every track in every month and their total """
+	paid = dict()
+	for name, schedule in schedules.items():
+		for month, payment in zip(*schedule.payments()):
+			paid.setdefault(int(month), dict())[name] = payment
+
+	with open(csv_file_name, 'w', newline='') as csv_file:
+		writer = csv.writer(csv_file)
+		writer.writerow(['DATE'] + list(schedules) + ['TOTAL'])
+		for month in sorted(paid):
+			payments = [round(paid[month].get(name, 0), 2) for name in schedules]
+			writer.writerow([to_date(month).strftime(format_str)] + payments + [round(sum(payments), 2)])
+
+
+def run():
+	from run import Plan, PlanError, Config
+
+	parser = argparse.ArgumentParser(description="Amortization schedule of the mortgage tracks of a project, with what ifs")
+	parser.add_argument('proj_dir')
+	parser.add_argument('--repay', nargs='*', default=[], metavar='NAME=DATE[:SUM]', help="early repayment of a track, all of it without SUM")
+	parser.add_argument('--refinance', nargs='*', default=[], metavar='NAME=DATE:RATE[:MONTHS]', help="new yearly rate (percent) and/or term of a track")
+	parser.add_argument('--out', help="csv of the monthly payments (default <proj_dir>/mortgage_schedule.csv)")
+	args = parser.parse_args()
+
+	try:
+		with contextlib.redirect_stdout(io.StringIO()):
+			plan = Plan(args.proj_dir)
+		tracks, changes = plan.read_mortgage_tracks()
+		what_ifs = [parse_change(REPAY, spec, Config.format_str) for spec in args.repay]
+		what_ifs += [parse_change(REFINANCE, spec, Config.format_str) for spec in args.refinance]
+	except (PlanError, ValueError, IndexError) as error:
+		print (error)
+		exit(1)
+
+	if not tracks:
+		print ("No mortgage tracks in input_files/mortgage_tracks.csv")
+		exit(1)
+
+	schedules = dict()
+	for track in tracks:
+		base = Schedule(track, changes.get(track.name, []))
+		schedule = base
+		extra = [change for name, change in what_ifs if name == track.name]
+		if extra:
+			schedule = Schedule(track, changes.get(track.name, []) + extra, base)
+		schedules[track.name] = schedule
+
+		first = to_date(track.first_month)
+		line = f"{track.name}: {track.principal:.0f} at {track.rate*100:g}% {track.method} {'cpi' if track.cpi else 'fixed'}, from {first}, paid {base.total_paid():.2f} until {to_date(base.last_month())}"
+		if extra:
+			line += f", what if: paid {schedule.total_paid():.2f} until {to_date(schedule.last_month())} ({schedule.total_paid() - base.total_paid():+.2f})"
+		print (line)
+
+	for name, __ in what_ifs:
+		if name not in schedules:
+			print (f"No track {name}")
+
+	write_schedules(args.out or args.proj_dir + '/mortgage_schedule.csv', schedules, Config.format_str)
+
+
+
+if __name__ == '__main__':
+	run()
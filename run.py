@@ -2,10 +2,27 @@ import os
 import sys
 import copy
 import csv
+import glob
+import pickle
+import bisect
+import functools
+import contextlib
+import argparse
 from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
-from calendar import monthrange
 from configparser import ConfigParser
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from cache import Cache, file_digest, engine_version
+from columnar import write_columns
+from instrument import Profiler
+from ledger import Ledger, MonthEvent, as_number, as_numbers, round_by_factor
+from errors import PlanError
+from table import Table, TableErrors, parse_distinct, parse_ints, parse_floats, parse_dates
+from mortgage import Track, Change, Schedule, METHODS, INDEXES, REPAY, REFINANCE
+from child_rules import ChildRules, DEFAULT_RULES, LEAVE_WEEKS, PASSES, parse_anchor, parse_sum
+from month_calendar import to_ordinal, to_date, month_ordinal, month_of, next_first_of_month, days_in_month, occurrence_days, school_year_start, age_in_months, stage_calendar
+
 
 
 
@@ -28,8 +45,7 @@ def parse_period(period_str):
 				between_numbers = True
 				continue
 			else:
-				print(f"Invalid number: {temp}")
-				exit()
+				raise PlanError(f"Invalid number: {temp}")
 
 
 		if between_numbers and element == ' ':
@@ -40,6 +56,12 @@ def parse_period(period_str):
 
 	return years, months
 
+@functools.lru_cache(maxsize=None)
+def period_months(period_str):
+	""" months of a PERIOD, a plan has a handful of distinct ones """
+	years, months = parse_period(period_str)
+	return years*12 + months
+
 class Period: 
 	def __init__(self, start=None, end=None, weeks=None):
 		
@@ -82,25 +104,34 @@ class Period:
 
 		return (self.end - self.start).days
 
+	def pay_month_weights(self):
+		"""
+		first pay month of the period and the part of a monthly salary left in
+		every pay month up to the last one, the edges are paid by the day
+		"""
 
+		first_pay_month = next_first_of_month(self.start)
+		last_pay_month = next_first_of_month(self.end)
 
-def get_next_first_of_month(given_date):
-	
-	if given_date.day == 1:
-		return given_date
+		weights = [0] * (last_pay_month - first_pay_month + 1)
+
+		weights[0] = self.start.day / days_in_month(to_ordinal(self.start))
+
+		curr_days_in_month = days_in_month(to_ordinal(self.end))
+		weights[-1] = (curr_days_in_month - self.end.day) / curr_days_in_month
+
+		return first_pay_month, weights
 
-	return (given_date + relativedelta(months=1)).replace(day=1)
 
-def get_next_school_year_start(given_date):
-	curr_date = given_date.replace(day=1)
+
+def get_next_first_of_month(given_date):
 	
-	while curr_date.month != 9:
-		curr_date += relativedelta(months=1)
+	return to_date(next_first_of_month(given_date))
 
-	return curr_date
+null_phase = contextlib.nullcontext()
 
 write_detailed_month = True
-detailed_month = datetime(day=1, month=1, year=2022).date()
+detailed_month = month_ordinal(2022, 1)
 
 
 class Config:
@@ -112,66 +143,52 @@ class Config:
 	# end_date = datetime(day=1, month=8, year=2050).date() # when I'm 67
 	# end_date = datetime(day=1, month=7, year=2021).date() 
 
-	@staticmethod
-	def read_file():
+	def __init__(self, proj_dir):
+		self.proj_dir = proj_dir
+		self.read_file()
+
+	def read_file(self):
 		parser = ConfigParser()
-		parser.read(Config.proj_dir + '/input_files/config.ini')
+		parser.read(self.proj_dir + '/input_files/config.ini')
 
 		ini_start_date = parser.get('dates','start_date')
 		if ini_start_date == 'today':
-			Config.start_date = get_next_first_of_month(date.today())
+			self.start_date = get_next_first_of_month(date.today())
 		else:
-			Config.start_date = datetime.strptime(ini_start_date, Config.format_str).date()
+			self.start_date = datetime.strptime(ini_start_date, Config.format_str).date()
 
 		ini_end_date = parser.get('dates','end_date')
-		Config.end_date = datetime.strptime(ini_end_date, Config.format_str).date()
-
-		Config.project_period = Period(start=Config.start_date, end=Config.end_date)
-
-		Config.initial_saving = parser.getint('money','initail_saving')
-
-
-class RowFiller:
-	
-	def __init__(self):
-		self.prev_data = dict()
-		self.default_data = dict()
-
-	def update(self, row):
-
-		if not self.prev_data:
-			self.prev_data = copy.deepcopy(row)
-		else:
-			for key in self.prev_data.keys():
-				if row[key] == "":
-					row[key] = self.prev_data[key]
-				else:
-					self.prev_data[key] = row[key]
-
-		for key in self.default_data.keys():
-			if row[key] == "":
-				row[key] = self.default_data[key]
+		self.end_date = datetime.strptime(ini_end_date, Config.format_str).date()
 
+		self.project_period = Period(start=self.start_date, end=self.end_date)
+		self.start_month = to_ordinal(self.start_date)
+		self.end_month = to_ordinal(self.end_date)
 
-#globals
-months = dict() # date object / month object
-persons = list()
-# categories = {"income": set(), "expense": set()}
-categories = {}
-for event_type in Config.event_types:
-	categories[event_type] = set()
+		self.initial_saving = parser.getint('money','initail_saving')
 
+		# monte carlo, yearly rates
+		self.return_mean     = parser.getfloat('montecarlo', 'return_mean',     fallback=0.04)
+		self.return_std      = parser.getfloat('montecarlo', 'return_std',      fallback=0.10)
+		self.inflation_mean  = parser.getfloat('montecarlo', 'inflation_mean',  fallback=0.02)
+		self.inflation_std   = parser.getfloat('montecarlo', 'inflation_std',   fallback=0.01)
 
 
-def round_by_factor(num, factor):
-	return (num//factor)*factor
-
 class Person:
-	def __init__(self, row):
+	def __init__(self, row, birthday=None):
 		self.name = row['NAME']
 		self.type = row['TYPE']
-		self.birthday_actual_date = datetime.strptime(row['BIRTHDAY'], Config.format_str).date()
+		self.birthday_actual_date = birthday or datetime.strptime(row['BIRTHDAY'], Config.format_str).date()
 		self.birthday_billing_date = get_next_first_of_month(self.birthday_actual_date)
+		self.birthday_billing_month = next_first_of_month(self.birthday_actual_date)
+
+	def shifted(self, months):
+		""" copy of the person born months later (earlier when negative) """
+		person = copy.copy(self)
+		person.birthday_actual_date = self.birthday_actual_date + relativedelta(months=months)
+		person.birthday_billing_date = get_next_first_of_month(person.birthday_actual_date)
+		person.birthday_billing_month = next_first_of_month(person.birthday_actual_date)
+		person.key = (self.name, self.type, person.birthday_actual_date) + self.key[3:]
+		return person
 
 	def __lt__(self, other):
 		""" less than method """
@@ -190,73 +207,11 @@ class Person:
 	def __repr__(self):
 		return f"{self.name}, {self.birthday_actual_date}, {self.birthday_billing_date}"
 
-class MonthEvent:
-	def __init__(self, date_event):
-		self.type     = date_event.type
-		self.category = date_event.category
-		self.name     = date_event.name
-		self.sum      = date_event.sum
-		self.person_type = date_event.person_type
-
-	@staticmethod
-	def generate_header_row():
-		return ["TYPE","CATEGORY","NAME","SUM"]
-
-	def generate_row(self):
-		return [self.type, self.category, self.name, self.sum]
-
-
-
-class Month:
-	def __init__(self):
-		self.month_events = []
-		self.agg_categories = dict() # categ. name / aggrate sum
-		self.agg_sums = {}
-		for event_type in Config.event_types:
-			self.agg_sums[event_type] = 0
-
-	def add(self, date_event):
-		#update month
-		self.month_events.append(MonthEvent(date_event))
-		self.agg_sums[date_event.type] += date_event.sum
-
-		if date_event.category in self.agg_categories:
-			self.agg_categories[date_event.category] += date_event.sum
-		else:
-			self.agg_categories[date_event.category] = date_event.sum
-
-	def get_mom_salary(self):
-		
-		mom_salary = 0
-
-		for i in range(len(self.month_events)):
-			if self.month_events[i].category == "salary" and self.month_events[i].person_type == "mom":
-				mom_salary =  self.month_events[i].sum
-				break
-		
-		return mom_salary
-
-	def update_mom_salary(self, salary_percentage):
-
-		for i in range(len(self.month_events)):
-			if self.month_events[i].category == "salary" and self.month_events[i].person_type == "mom":
-
-				curr_salary = self.month_events[i].sum
-
-				new_salary = salary_percentage*curr_salary
-				new_salary = round_by_factor(new_salary, 500)
-
-				self.month_events[i].sum      = new_salary
-				self.agg_sums["income"]       = self.agg_sums["income"]       - curr_salary + new_salary
-				self.agg_categories["salary"] = self.agg_categories["salary"] - curr_salary + new_salary
-
-				break
-
-
-
 class DateEvent:
 
-	def __init__ (self, event_type="", category="", name="", event_sum=0, start=None, end=None, period=1, person_type=""):
+	__slots__ = ['type', 'category', 'name', 'sum', 'start', 'end', 'period', 'person_type', 'day', 'end_day']
+
+	def __init__ (self, event_type="", category="", name="", event_sum=0, start=None, end=None, period=1, person_type="", day=1, end_day=31):
 		self.type = event_type
 		self.category = category
 		self.name = name
@@ -265,89 +220,35 @@ class DateEvent:
 		self.end = end
 		self.period = period
 		self.person_type = person_type
+		self.day = day         # day of month of the occurrences
+		self.end_day = end_day # day of the end month after which there is none
 
-	def init_by_row(self, row):
-		self.type = row['TYPE']
-		self.category = row['CATEGORY']
-		self.name = row['NAME']
-		self.sum = int(row['SUM'])
+	def split(self, ledger):
+		""" add the event to a ledger, return its id, None if it is outside of the ledger """
+		return ledger.add(self)
 
-		if row['START'] == "today":
-			self.start = Config.start_date
-		else:
-			self.start = datetime.strptime(row['START'], Config.format_str).date()
+	def segments(self):
+		"""
+		the event as events of its runs of occurrences on the same day: a
+		29th to 31st is clipped to the end of a shorter month and stays
+		clipped, see occurrence_days
+		"""
 
-		if row['END'] == "never":
-			self.end = Config.end_date
-		else:
-			self.end = datetime.strptime(row['END'], Config.format_str).date()
-			self.end = min(self.end, Config.end_date)
-
-		y,m = parse_period(row['PERIOD'])
-		self.period = y*12 + m
-
-	def init_by_age_event(self, age_event, person):
-		self.type = age_event.type
-		self.category = age_event.category
-		self.name = person.name + ": " + age_event.name
-		self.sum = age_event.sum
-		
-		self.start = person.birthday_billing_date
-		while self.start.month != age_event.month_start:
-			self.start += relativedelta(months=1)
-		self.start += relativedelta(years=age_event.from_age)
+		if self.period < 1:
+			return [self]
 
-		self.end = person.birthday_billing_date + relativedelta(years=age_event.until_age, months=-1)
+		count = max((self.end - self.start) // self.period + 1, 1)
+		days = occurrence_days(self.start, self.day, self.period, count)
+		firsts = [0] + (np.flatnonzero(np.diff(days)) + 1).tolist()
 
-		self.period = age_event.period
-		self.person_type = person.type
-
-	def validate(self):
-		if self.type not in Config.event_types:
-			print("Type is not in ",Config.event_types)
-			return False
-		if self.name == "":
-			print ("Name is empty")
-			return False
-		if self.sum < 0:
-			print ("Sum is negative")
-			return False
-		# if self.end < self.start:
-		# 	print ("End date is smaller than Start date")
-		# 	print (f"start: {self.start}")
-		# 	print (f"end: {self.end}")
-		# 	return False
-		# if self.period < 1:
-		# 	print ("Period is less than 1")
-		# 	return False
-		return True
-
-
-	def split(self):
-
-		global months
-		global categories
-		
-		if self.end < Config.start_date or self.start > Config.end_date:
-			return
-
-		categories[self.type].add(self.category)
-
-		curr_date = self.start
-
-		while curr_date <= self.end:
-
-			if Config.project_period.inside(curr_date):
-			
-				if months.get(curr_date) is None:
-					months[curr_date] = Month()
-				
-				months[curr_date].add(self)
-
-			curr_date = curr_date + relativedelta(months=self.period) #loop ++
+		segments = list()
+		for first, after in zip(firsts, firsts[1:] + [count]):
+			end, end_day = (self.start + after*self.period - 1, 31) if after < count else (self.end, self.end_day)
+			segments.append(DateEvent(self.type, self.category, self.name, self.sum, self.start + first*self.period, end, self.period, self.person_type, int(days[first]), end_day))
+		return segments
 
 	def __repr__(self):
-		return f"{self.name}, {self.sum}, {self.start}, {self.end}"
+		return f"{self.name}, {self.sum}, {to_date(self.start)}, {to_date(self.end)}"
 
 	def __lt__(self, other):
 		""" less than method """
@@ -355,100 +256,62 @@ class DateEvent:
 		return self.start < other.start
 
 
-def load_date_events(csv_file_name):
-	""" Load items from csv and populate months """
-	row_filler = RowFiller()
-	row_filler.default_data['PERIOD']  = '1m'
-	row_filler.default_data['IGNORE']  = 'no'
-	row_filler.prev_data['TYPE']     = ''
-	row_filler.prev_data['CATEGORY'] = ''
-	row_filler.prev_data['NAME']     = ''
-
-	with open(csv_file_name) as csv_file:
-		reader = csv.DictReader(csv_file)
-		for row in reader:
-			if row['IGNORE'] == 'yes':
-				continue
-			row_filler.update(row)
-			date_event = DateEvent()
-			date_event.init_by_row(row)
-			
-			if date_event.validate():
-				date_event.split()
-			else:
-				print (date_event.name)
-				print("Invalid event data")
-				exit()
-
-
+class AgeTemplate:
+	"""
+	The age events of a person type, the rows of <type>.csv, as months from
+	the birthday billing month of a person. An event starts FROM years after
+	it, in MONTH_START (or in the month of the birthday), and ends the month
+	before UNTIL years after it, so the months of all the persons of a type
+	are a shift of the same offsets. Iterates as its (key, filled row) pairs
+	"""
 
+	BIRTHDAY_MONTH = 0 # MONTH_START of the events that start in the month of the birthday
 
-class AgeEvent:
-	BIRTHDAY_MONTH = 0
-	def __init__(self, row, person):
-		self.type = row['TYPE']
-		self.category = row['CATEGORY']
-		self.name = row['NAME']
-		self.sum = int(row['SUM'])
-		self.from_age = int(row['FROM'])
-		self.until_age = int(row['UNTIL'])
+	def __init__(self, keyed, types, categories, names, sums, from_ages, until_ages, periods, month_starts):
+		self.keyed = keyed
+		self.types = types
+		self.categories = categories
+		self.names = names
+		self.sums = sums
+		self.periods = periods
+		self.start_offsets = 12*np.asarray(from_ages, dtype=np.int64)
+		self.end_offsets = 12*np.asarray(until_ages, dtype=np.int64) - 1
+		self.month_starts = np.asarray(month_starts, dtype=np.int64)
 
-		y,m = parse_period(row['PERIOD'])
-		self.period = y*12 + m
+	def __iter__(self):
+		return iter(self.keyed)
 
-		self.month_start = int(row['MONTH_START'])
-		if self.month_start == self.BIRTHDAY_MONTH:
-			self.month_start = person.birthday_billing_date.month
+	def __len__(self):
+		return len(self.keyed)
 
+	def months(self, billing_months):
+		""" (first months, last months) of the events (columns) of persons with the birthday billing months (rows) """
+		billing_months = np.asarray(billing_months, dtype=np.int64).reshape(-1, 1)
+		shifts = np.where(self.month_starts == AgeTemplate.BIRTHDAY_MONTH, 0, (self.month_starts - month_of(billing_months)) % 12)
+		return billing_months + shifts + self.start_offsets, billing_months + self.end_offsets
 
-def load_persons(csv_file_name):
-	
-	global persons
+	def date_events(self, persons):
+		""" [(source, date event), ...] of every person """
+		firsts, lasts = self.months([person.birthday_billing_month for person in persons])
+		rows = list(zip([key for key, __ in self.keyed], self.types, self.categories, self.names, self.sums, self.periods))
+		return [[(('person', person.key, key), DateEvent(event_type, category, person.name + ": " + name, event_sum, start, end, period, person.type))
+		         for (key, event_type, category, name, event_sum, period), start, end in zip(rows, person_firsts, person_lasts)]
+		        for person, person_firsts, person_lasts in zip(persons, firsts.tolist(), lasts.tolist())]
 
-	with open(csv_file_name) as csv_file:
-		reader = csv.DictReader(csv_file)
-		for row in reader:
-			if row['IGNORE'] == 'yes':
-				continue
-			persons.append(Person(row))
 
-	for person in persons:
-		build_person_payout(person)
+def age_events_of_persons(persons, templates):
+	""" (source, date event) of the age events of persons in their order, every type expanded at once """
+	indices = dict() # person type / indices of its persons
+	for i, person in enumerate(persons):
+		indices.setdefault(person.type, []).append(i)
 
+	expanded = [None] * len(persons)
+	for person_type, type_indices in indices.items():
+		for i, events in zip(type_indices, templates[person_type].date_events([persons[i] for i in type_indices])):
+			expanded[i] = events
 
+	return [event for events in expanded for event in events]
 
-def build_person_payout(person):
-	
-	row_filler = RowFiller()
-	row_filler.default_data['PERIOD']      = '1m'
-	row_filler.default_data['MONTH_START'] = '0'
-	row_filler.default_data['IGNORE']      = 'no'
-	row_filler.prev_data['TYPE']     = ''
-	row_filler.prev_data['CATEGORY'] = ''
-	row_filler.prev_data['NAME']     = ''
-
-	with open(Config.proj_dir + "/input_files/" + person.type+".csv") as csv_file:
-		reader = csv.DictReader(csv_file)
-		for row in reader:
-			if row['IGNORE'] == 'yes':
-				continue
-			row_filler.update(row)
-			age_event = AgeEvent(row, person)
-			date_event = DateEvent()
-			date_event.init_by_age_event(age_event, person)
-			date_event.split()
-
-def load_mortgage(csv_file_name):
-	
-	mortgage_date = Config.start_date
-
-	with open(csv_file_name) as csv_file:
-		reader = csv.DictReader(csv_file)
-		for row in reader:
-			pay_sum = float(row['SUM'])
-			date_event = DateEvent(event_type="expense", category="דיור", name="משכנתא", event_sum=pay_sum, start=mortgage_date, end=mortgage_date)
-			date_event.split()
-			mortgage_date += relativedelta(months=1) #loop++
 
 """
 
@@ -518,197 +381,68 @@ def calc_child():
 
 
 
-def get_child_allowance(child_order):
-	
-	CHILD_SAVING = 50
-	allowance = 0
-
-	if child_order == 1 or child_order >= 5:
-		allowance = 152
-	else:
-		allowance = 192
-
-	return allowance - CHILD_SAVING
-
-def get_maternity_grant(child_order):
-	if child_order == 1:
-		return 1783
-	elif child_order == 2:
-		return 802
-	else:
-		return 535
-
-def update_incomces_after_births():
-
-	global months
-
-	children = [person for person in persons if person.type == "child"]
-
-	WEEKS_AT_HOME = 26
-	WEEKS_BIRTH_SALARY = 15
-
-	child_order = 0
-
-	for child in sorted(children):
-
-		child_order += 1
-
-
-		### update mom salary from work to zero or partial durring maternity leave
-
-		# update first month salary
-		start_date = child.birthday_actual_date
-		__, days_in_month = monthrange(start_date.year, start_date.month)
-		fraction = start_date.day / days_in_month
-		start_pay_date = child.birthday_billing_date
-		if months.get(start_pay_date):
-			months[start_pay_date].update_mom_salary(fraction)
-		
-		# update last month salary
-		end_date = start_date + relativedelta(weeks=WEEKS_AT_HOME)
-		__, days_in_month = monthrange(end_date.year, end_date.month)
-		fraction = (days_in_month-end_date.day)/days_in_month
-		end_pay_date = get_next_first_of_month(end_date)
-		if months.get(end_pay_date):
-			months[end_pay_date].update_mom_salary(fraction)
-
-		curr_pay_date = start_pay_date + relativedelta(months=1)
-		while curr_pay_date < end_pay_date:
-			if months.get(curr_pay_date):
-				months[curr_pay_date].update_mom_salary(0)
-			curr_pay_date = curr_pay_date + relativedelta(months=1) #loop ++
-
-
-
-		### update maternity pay from bituh-leumi
-
-		# claculate last 3 and 6 months avg salary
-		sum_salary = 0
-		sum_days = 0
-		avg_day_salary_3_month = 0
-		avg_day_salary_6_month = 0
-		curr_pay_date = child.birthday_billing_date - relativedelta(months=1)
-		for i in range(6):
-			if months.get(curr_pay_date) is not None:
-				sum_salary = sum_salary + 1.2*months[curr_pay_date].get_mom_salary() # 1.2 to simulate bruto salary
-			__, days_in_month = monthrange(curr_pay_date.year, curr_pay_date.month)
-			sum_days = sum_days + days_in_month
-
-			if i == 2:
-				avg_day_salary_3_month = sum_salary / sum_days
-
-			if i == 5:
-				avg_day_salary_6_month = sum_salary / sum_days
-
-			curr_pay_date = curr_pay_date - relativedelta(months=1) # loop --
-
-		avg_day_salary = max(avg_day_salary_3_month, avg_day_salary_6_month)
-		maternity_pay = avg_day_salary * WEEKS_BIRTH_SALARY * 7
-		maternity_pay = round_by_factor(maternity_pay, 500)
-
-		maternity_pay_event = DateEvent(event_type="income", 
-			                   category="MATERNITY_PAYS", 
-			                   name="maternity pay "+ child.name, 
-			                   event_sum=maternity_pay,
-			                   start=child.birthday_billing_date,
-			                   end=child.birthday_billing_date,
-			                   person_type = child.type)
-
-		maternity_pay_event.split()
-
-
-		### update birth grant
-
-		maternity_grant_event = DateEvent(event_type="income", 
-			                   category="MATERNITY_PAYS", 
-			                   name="maternity grant "+ child.name, 
-			                   event_sum=get_maternity_grant(child_order),
-			                   start=child.birthday_billing_date,
-			                   end=child.birthday_billing_date,
-			                   person_type = child.type)
-
-		maternity_grant_event.split()
-
-		### update child allowance
-
-		child_allowance_event = DateEvent(event_type="income", 
-			                   category="MATERNITY_PAYS", 
-			                   name="child allowance "+ child.name, 
-			                   event_sum=get_child_allowance(child_order),
-			                   start=child.birthday_billing_date,
-			                   end=child.birthday_billing_date + relativedelta(years=18),
-			                   period=1,
-			                   person_type=child.type)
-
-		child_allowance_event.split()
-
-
-
-# Write the csv output file
-def write_cash_flow(csv_file_name):
-	with open(csv_file_name, 'w', newline='') as csvfile:
-		writer = csv.writer(csvfile)
-
-		header_row = ['DATE', 'INCOMES', 'EXPENSES', 'BALANCE', 'BANK']
-
-		# incomes first, then expenses
-
-		for event_type in Config.event_types:
-			for category in categories[event_type]:
-				header_row.append(category)
-
-		writer.writerow(header_row)
-
-		dates = sorted(months.keys()) # key is date object 
-
-		bank_acc = Config.initial_saving
-		expenses = 0
-		incomes = 0
-
-		for date_obj in dates:
-
-			curr_month = months[date_obj]
-
-			
-			if write_detailed_month and date_obj == detailed_month:
-				write_detailed_month_csv(date_obj, curr_month)
-
-			incomes  =  curr_month.agg_sums["income"]
-			expenses =  curr_month.agg_sums["expense"]
-
-			bank_acc = bank_acc + incomes - expenses
-
-			row = [date_obj,incomes,expenses, (incomes-expenses), bank_acc]
-
-			for event_type in Config.event_types:
-				for category in categories[event_type]:
-					category_sum = curr_month.agg_categories.get(category)
-					if category_sum is not None:
-						row.append(category_sum)
-					else:
-						row.append(0)
-
-			writer.writerow(row)
-
-
-def write_detailed_month_csv(date_obj, month):
-	print (date_obj)
-	with open(str(date_obj) + ".csv", 'w', newline='') as csvfile:
-		writer = csv.writer(csvfile)
-		writer.writerow(MonthEvent.generate_header_row())		
-		for event in month.month_events:
-			writer.writerow(event.generate_row())
-
-
-	
-
+def average_day_salaries(salaries, month_days):
+	"""
+	3 and 6 months average day salary before every month from the 7th on,
+	out of per month salaries and days. The sums run back from the month
+	before, as cumulative sums over rolling windows
+	"""
+	salary_windows = sliding_window_view(1.2*np.asarray(salaries, dtype=float), 6)[:, ::-1].cumsum(axis=1) # 1.2 to simulate bruto salary
+	day_windows = sliding_window_view(np.asarray(month_days), 6)[:, ::-1].cumsum(axis=1)
+	return salary_windows[:, 2] / day_windows[:, 2], salary_windows[:, 5] / day_windows[:, 5]
 
+def read_csv_rows(csv_file_name):
+	with open(csv_file_name) as csv_file:
+		return list(csv.DictReader(csv_file))
+
+@contextlib.contextmanager
+def replacing_file(file_name, mode='w', **kwargs):
+	""" a temporary file that is renamed over file_name when it is done, readers never see a part of it """
+	temp_file_name = f'{file_name}.{os.getpid()}.tmp'
+	try:
+		with open(temp_file_name, mode, **kwargs) as temp_file:
+			yield temp_file
+		os.replace(temp_file_name, file_name)
+	finally:
+		if os.path.exists(temp_file_name):
+			os.remove(temp_file_name)
+
+def check_columns(table, names, file_name):
+	""" a table without rows, of an empty file too, gets the columns it has not """
+	if not len(table):
+		table.add_empty(names)
+	missing = table.missing(names)
+	if missing:
+		raise PlanError(f"{file_name} has no column {', '.join(missing)}")
+
+def keyed_rows(kind, rows):
+	""" (key, row) pairs, the key is the row content and its occurrence number """
+	seen = dict()
+	keyed = list()
+	for row in rows:
+		content = tuple(row.values()) if isinstance(row, dict) else tuple(row)
+		occurrence = seen.get(content, 0)
+		seen[content] = occurrence + 1
+		keyed.append(((kind,) + content + (occurrence,), row))
+	return keyed
+
+def is_mom_salary(date_event):
+	return date_event.category == "salary" and date_event.person_type == "mom"
+
+def maternity_window(child):
+	""" first and last month of mom salary the maternity events of a child read or change """
+	start_pay_month, weights = Period(start=child.birthday_actual_date, weeks=LEAVE_WEEKS).pay_month_weights()
+	return child.birthday_billing_month - 6, start_pay_month + len(weights) - 1
+
+def is_overlap(window, other):
+	return other[1] >= window[0] and other[0] <= window[1]
 
 # TESTERS
 
 def test_persons_load():
-	load_persons('persons.csv')	
-	for person in persons:
+	plan = Plan(sys.argv[1])
+	plan.load_persons('persons.csv')	
+	for person in plan.persons:
 		print (person)
 
 def dates_tester():
@@ -727,289 +461,880 @@ def dates_tester():
 
 
 
-class ChildcareType:
-	DAYCARE=1
-	KINDERGARDEN_ZAHARON=2
-	SCHOOL_ZAHARON=3
-	POST_CHILDCARE=4
+def calc_childcare_cost(birthday):
 
-childcare_costs = {
-	ChildcareType.DAYCARE: 3000,
-	ChildcareType.KINDERGARDEN_ZAHARON: 1000,
-	ChildcareType.SCHOOL_ZAHARON: 800,
-	ChildcareType.POST_CHILDCARE: 0}
 
-class EducationAges:
-	GAN_HOVA=3
-	KITA_ALEF=6
-	KITA_DALET=9
+	# MATERNITY_LEAVE_WEEKS = 26
+	MATERNITY_LEAVE_WEEKS = 15
+	SMALL_PAY = 2192
+	BIG_PAY = 2857
 
+	# SMALL_PAY=913
+	# BIG_PAY=1133
 
-def get_childcare_type(child, school_year):
 
-	end_of_civil_year = school_year.replace(month=12, day=31)
-	child_age_at_end_of_year = relativedelta(end_of_civil_year, child.birthday_actual_date)
+	maternity_leave = Period(start=birthday, weeks=MATERNITY_LEAVE_WEEKS) 
 
-	if child_age_at_end_of_year.years >= EducationAges.KITA_DALET:
-		return ChildcareType.POST_CHILDCARE
+	childcare_start_pay = to_ordinal(maternity_leave.end)
 
-	if child_age_at_end_of_year.years >= EducationAges.KITA_ALEF:
-		return ChildcareType.SCHOOL_ZAHARON
+	# the reduced pay from the first school year the child is 15 months old at its start
+	childcare_start_reduced_pay = school_year_start(childcare_start_pay)
+	if age_in_months(birthday, childcare_start_reduced_pay) < 15:
+		childcare_start_reduced_pay += 12
 
-	if child_age_at_end_of_year.years >= EducationAges.GAN_HOVA:
-		return ChildcareType.KINDERGARDEN_ZAHARON
+	# until the end of the first kindergarden year
+	childcare_end_pay = int(stage_calendar().stage_starts(to_ordinal(birthday))[0, 0]) + 12 - 1
 
-	return ChildcareType.DAYCARE
+	#cost calculation
 
+	big_pay_cost = (childcare_start_reduced_pay - childcare_start_pay)*BIG_PAY
+	small_pay_cost = (childcare_end_pay - childcare_start_reduced_pay)*SMALL_PAY
 
-def create_childcare_events():
+	return big_pay_cost + small_pay_cost
 
-	MATERNITY_LEAVE_WEEKS = 26
+def calc_child_cost(config):
+
+	mom_salary = 11000
+	from_age = 0
+	upto_age = 18
+
+	child_file = config.proj_dir + '/input_files/child.csv'
 
-	children = [person for person in persons if person.type == "child"]
 
-	for child in children:
 
-		daycare_period = Period()
-		kindergarden_zaharon_period = Period()
-		school_zaharon_period = Period()
 
-		maternity_leave_end = child.birthday_actual_date + relativedelta(weeks=MATERNITY_LEAVE_WEEKS)
 
-		# daycare
+class Plan:
+	"""
+	a single project: its config, persons and ledger
 
-		daycare_period.start = maternity_leave_end.replace(day=1)
-		curr_school_year = get_next_school_year_start(maternity_leave_end)
-		curr_childcare_type = get_childcare_type(child, curr_school_year)
+	Every event in the ledger is kept under the source it came from: an input
+	row (date event, mortgage payment, person x age event row) or a child for
+	the auto generated events. update() uses them to apply only what changed.
+	"""
 
-		while curr_childcare_type == ChildcareType.DAYCARE:
-			daycare_period.end = curr_school_year + relativedelta(years=1, months=-1) # 01.08.XXXX
-			curr_school_year += relativedelta(years=1)
-			curr_childcare_type = get_childcare_type(child, curr_school_year) 
+	state_file_name = '.plan_state.pickle'
+	result_attributes = ['ledger', 'persons', 'sources', 'child_orders', 'child_overrides', 'child_rules']
+	childcare_costs = dict() # monthly cost by childcare category over the child rules, set on a plan to vary it
 
-		# garden zaharon
+	def __init__(self, proj_dir, expansion="difference", cache=None, profiler=None):
+		self.expansion = expansion
+		self.cache = cache
+		self.profiler = profiler
+		self.write_detailed_month = write_detailed_month
+		self.detailed_month = detailed_month
+		self.detailed_month_dir = '' # current dir
+		self.reset(Config(proj_dir))
+
+	def reset(self, config):
+		self.config = config
+		self.ledger = Ledger(config.start_month, config.end_month, Config.event_types, self.expansion, config.start_date.day, config.end_date.day)
+		self.persons = list()
+		self.sources = dict()         # source key / ids of its events in the ledger
+		self.child_orders = dict()    # child key / order of birth it was derived with
+		self.child_overrides = dict() # child key / mom salary changes, in the order they were made
+		self.child_rules = None       # read by build
+		self.bank_rows = list()       # touched rows and BANK after each of them
+		self.bank = list()
+
+	@staticmethod
+	def load_state(proj_dir):
+		""" plan saved by save_state, None if there is none or the engine sources changed since """
+		try:
+			with open(os.path.join(proj_dir, Plan.state_file_name), 'rb') as state_file:
+				engine, plan = pickle.load(state_file)
+		except (OSError, pickle.UnpicklingError, AttributeError, EOFError, TypeError, ValueError):
+			return None
+		return plan if engine == engine_version() else None
+
+	def save_state(self):
+		cache, profiler = self.cache, self.profiler
+		self.cache = self.profiler = None
+		try:
+			with open(os.path.join(self.config.proj_dir, Plan.state_file_name), 'wb') as state_file:
+				pickle.dump((engine_version(), self), state_file, pickle.HIGHEST_PROTOCOL)
+		finally:
+			self.cache, self.profiler = cache, profiler
+
+	def input_file(self, file_name):
+		return self.config.proj_dir + '/input_files/' + file_name
+
+	def phase(self, name):
+		""" context of a profiled phase, does nothing without a profiler """
+		if self.profiler is None:
+			return null_phase
+		return self.profiler.phase(name, self.ledger)
+
+	def count(self, counter, n):
+		if self.profiler is not None:
+			self.profiler.count(counter, n)
+
+	def run(self):
+		if not self.load_cached_result():
+			self.build()
+			self.save_cached_result()
+
+		# wirte ouptup to file
+		with self.phase('write_cash_flow'):
+			return self.write_cash_flow(self.config.proj_dir + '/cash_flow.csv')
+
+	def build(self):
+
+		# load data and create events
+		with self.phase('load_date_events'):
+			self.load_date_events(self.input_file('date_events.csv'))
+		with self.phase('load_persons'):
+			self.load_persons(self.input_file('persons.csv'))
+		with self.phase('load_mortgage'):
+			self.load_mortgage()
+
+		# auto generate events for children
+		with self.phase('maternity_leaves'):
+			maternity_pays = self.apply_maternity_leaves()
+		with self.phase('child_rules'):
+			self.child_rules = self.read_child_rules()
+			self.create_child_events(maternity_pays)
+
+	def result_key(self):
+		""" cache key of the built plan: all the input files and the project window """
+		input_files = sorted(glob.glob(self.input_file('*')))
+		return self.cache.key('result', self.expansion, self.config.start_date, self.config.end_date,
+		                      [(os.path.basename(file_name), file_digest(file_name)) for file_name in input_files])
+
+	def load_cached_result(self):
+		""" take the built plan from the cache, False on a miss """
+		if self.cache is None:
+			return False
+		with self.phase('cached_result'):
+			result = self.cache.get(self.result_key())
+		if result is None:
+			return False
+		for name, value in zip(Plan.result_attributes, result):
+			setattr(self, name, value)
+		return True
 
-		kindergarden_zaharon_period.start = curr_school_year
+	def save_cached_result(self):
+		if self.cache is not None:
+			self.cache.put(self.result_key(), [getattr(self, name) for name in Plan.result_attributes])
+
+	def read_table(self, read, csv_file_name):
+		""" read(csv_file_name), through the cache of parsed tables if there is one """
+		if self.cache is None:
+			return read(csv_file_name)
+		return self.cache.table(read.__name__, csv_file_name, self.config, lambda: read(csv_file_name))
+
+	def add_event(self, date_event, source):
+		""" add an event to the ledger under its source """
+		event_ids = self.sources.setdefault(source, [])
+		event_id = date_event.split(self.ledger)
+		if event_id is not None:
+			event_ids.append(event_id)
+
+	def add_events(self, date_events, sources):
+		""" add events to the ledger at once, each under its source """
+		event_ids = self.ledger.add_events([date_event.start for date_event in date_events], [date_event.end for date_event in date_events],
+		                                   [date_event.period for date_event in date_events], [date_event.type for date_event in date_events],
+		                                   [date_event.category for date_event in date_events], [date_event.name for date_event in date_events],
+		                                   [date_event.sum for date_event in date_events], [date_event.person_type for date_event in date_events],
+		                                   [date_event.day for date_event in date_events], [date_event.end_day for date_event in date_events])
+		for source, event_id in zip(sources, event_ids):
+			source_ids = self.sources.setdefault(source, [])
+			if event_id is not None:
+				source_ids.append(event_id)
+
+	def read_date_events(self, csv_file_name):
+		""" (source, filled row) of every date event row that is not ignored """
+		return keyed_rows('date_events', self.date_events_table(Table.read(csv_file_name)).rows())
+
+	def date_events_of_rows(self, csv_rows):
+		""" (source, filled row) of the csv rows that are not ignored """
+		return keyed_rows('date_events', self.date_events_table(Table.of_rows(csv_rows)).rows())
+
+	def date_events_table(self, table, file_name='date_events.csv'):
+		""" the rows that are not ignored, empty TYPE, CATEGORY and NAME filled from the row above """
+
+		check_columns(table, ['TYPE', 'CATEGORY', 'NAME', 'SUM', 'START', 'END', 'PERIOD', 'IGNORE'], file_name)
+
+		table = table.select(table['IGNORE'] != 'yes')
+		for name in ('TYPE', 'CATEGORY', 'NAME'):
+			table.fill_forward(name)
+		table.fill_default('PERIOD', '1m')
+		table.fill_default('IGNORE', 'no')
+
+		self.count('rows_parsed', len(table))
+		return table
+
+	def date_events_of_table(self, table, file_name='date_events.csv'):
+		"""
+		date events of every row of a filled table, a list per row (see
+		DateEvent.segments). The bad cells of all the rows are reported together
+		"""
+
+		config = self.config
+		errors = TableErrors(file_name)
+
+		types = table['TYPE']
+		errors.add_cells(table, ~np.isin(types.astype(str), Config.event_types), 'TYPE', f"TYPE is not in {Config.event_types}:")
+		errors.add(table, table['NAME'] == '', "NAME is empty")
+
+		sums, bad = parse_ints(table['SUM'])
+		errors.add_cells(table, bad, 'SUM', "SUM is not a whole number:")
+		errors.add_cells(table, ~bad & (sums < 0), 'SUM', "SUM is negative:")
+
+		today = table['START'] == 'today'
+		years, months, days, bad = parse_dates(table['START'], Config.format_str)
+		errors.add_cells(table, bad & ~today, 'START', "START is not today or a dd/mm/yyyy date:")
+		starts = np.where(today, config.start_month, years*12 + months)
+		start_days = np.where(today, config.start_date.day, days)
+
+		never = table['END'] == 'never'
+		years, months, days, bad = parse_dates(table['END'], Config.format_str)
+		errors.add_cells(table, bad & ~never, 'END', "END is not never or a dd/mm/yyyy date:")
+		ends = np.where(never, config.end_month, np.minimum(years*12 + months, config.end_month))
+		end_days = np.where(never | (years*12 + months > config.end_month), 31, days) # the end of the window is clipped by the ledger
+
+		periods, bad = parse_distinct(table['PERIOD'], period_months, (PlanError,))
+		errors.add_cells(table, bad, 'PERIOD', "PERIOD is not like 1y 6m:")
+
+		if errors:
+			raise PlanError(str(errors))
+
+		date_events = [DateEvent(event_type, category, name, event_sum, start, end, period, "", day, end_day)
+		               for event_type, category, name, event_sum, start, end, period, day, end_day
+		               in zip(types.tolist(), table['CATEGORY'].tolist(), table['NAME'].tolist(), sums.tolist(), starts.tolist(), ends.tolist(), periods.tolist(),
+		                      start_days.tolist(), end_days.tolist())]
+		return [date_event.segments() if date_event.day > 28 else [date_event] for date_event in date_events]
+
+	def parse_date_events(self, csv_file_name):
+		""" (source, date event) of every date event row that is not ignored """
+		file_name = os.path.basename(csv_file_name)
+		table = self.date_events_table(Table.read(csv_file_name), file_name)
+		date_events = self.date_events_of_table(table, file_name)
+		return [(source, date_event) for (source, __), row_events in zip(keyed_rows('date_events', table.rows()), date_events) for date_event in row_events]
+
+	def load_date_events(self, csv_file_name):
+		""" Load items from csv and populate the ledger """
+		for source, date_event in self.read_table(self.parse_date_events, csv_file_name):
+			self.add_event(date_event, source)
+
+	def read_persons(self, csv_file_name):
+		return self.persons_of_table(Table.read(csv_file_name), os.path.basename(csv_file_name))
+
+	def persons_of_rows(self, csv_rows):
+		return self.persons_of_table(Table.of_rows(csv_rows))
+
+	def persons_of_table(self, table, file_name='persons.csv'):
+
+		check_columns(table, ['NAME', 'TYPE', 'BIRTHDAY', 'IGNORE'], file_name)
+		table = table.select(table['IGNORE'] != 'yes')
+
+		years, months, days, bad = parse_dates(table['BIRTHDAY'], Config.format_str)
+		if bad.any():
+			errors = TableErrors(file_name)
+			errors.add_cells(table, bad, 'BIRTHDAY', "BIRTHDAY is not a dd/mm/yyyy date:")
+			raise PlanError(str(errors))
+
+		persons = [Person(row, date(*birthday)) for row, birthday in zip(table.rows(), zip(years.tolist(), months.tolist(), days.tolist()))]
 
-		while curr_childcare_type == ChildcareType.KINDERGARDEN_ZAHARON:
-			kindergarden_zaharon_period.end = curr_school_year + relativedelta(years=1, months=-1) # 01.08.XXXX
-			curr_school_year += relativedelta(years=1)
-			curr_childcare_type = get_childcare_type(child, curr_school_year)
+		self.count('rows_parsed', len(persons))
 
-		# school zaharon
+		# same name, type and birthday twice are two persons
+		keys = keyed_rows('person', [(person.name, person.type, person.birthday_actual_date) for person in persons])
+		for person, (key, __) in zip(persons, keys):
+			person.key = key[1:]
 
-		school_zaharon_period.start = curr_school_year
+		return persons
 
-		while curr_childcare_type == ChildcareType.SCHOOL_ZAHARON:
-			school_zaharon_period.end = curr_school_year + relativedelta(years=1, months=-1) # 01.08.XXXX
-			curr_school_year += relativedelta(years=1)
-			curr_childcare_type = get_childcare_type(child, curr_school_year)
+	def load_persons(self, csv_file_name):
+	
+		self.persons.extend(self.read_table(self.read_persons, csv_file_name))
+
+		self.build_person_payouts(self.persons)
+
+	def read_age_events(self, csv_file_name):
+		""" age template of a person type, its (key, filled row) of every row that is not ignored """
+		person_type = os.path.splitext(os.path.basename(csv_file_name))[0]
+		return self.age_events_of_table(person_type, Table.read(csv_file_name))
+
+	def age_events_of_rows(self, person_type, csv_rows):
+		""" age template of the csv rows of a person type that are not ignored """
+		return self.age_events_of_table(person_type, Table.of_rows(csv_rows))
+
+	def age_events_of_table(self, person_type, table):
+		""" age template of the rows that are not ignored, the bad cells of all the rows are reported together """
+
+		file_name = person_type + '.csv'
+		check_columns(table, ['TYPE', 'CATEGORY', 'NAME', 'SUM', 'FROM', 'UNTIL', 'PERIOD', 'MONTH_START', 'IGNORE'], file_name)
+
+		table = table.select(table['IGNORE'] != 'yes')
+		for name in ('TYPE', 'CATEGORY', 'NAME'):
+			table.fill_forward(name)
+		table.fill_default('PERIOD', '1m')
+		table.fill_default('MONTH_START', '0')
+		table.fill_default('IGNORE', 'no')
+
+		errors = TableErrors(file_name)
+		errors.add_cells(table, ~np.isin(table['TYPE'].astype(str), Config.event_types), 'TYPE', f"TYPE is not in {Config.event_types}:")
+		numbers = dict()
+		for name in ('SUM', 'FROM', 'UNTIL', 'MONTH_START'):
+			numbers[name], bad = parse_ints(table[name])
+			errors.add_cells(table, bad, name, f"{name} is not a whole number:")
+		periods, bad = parse_distinct(table['PERIOD'], period_months, (PlanError,))
+		errors.add_cells(table, bad, 'PERIOD', "PERIOD is not like 1y 6m:")
+		if errors:
+			raise PlanError(str(errors))
+
+		self.count('rows_parsed', len(table))
+		return AgeTemplate(keyed_rows(person_type, table.rows()), table['TYPE'].tolist(), table['CATEGORY'].tolist(), table['NAME'].tolist(),
+		                   numbers['SUM'].tolist(), numbers['FROM'], numbers['UNTIL'], periods.tolist(), numbers['MONTH_START'])
+
+	def build_person_payouts(self, persons):
+		""" add the age events of persons, the age events of a type are read once """
+		templates = {person_type: self.read_table(self.read_age_events, self.input_file(person_type + ".csv")) for person_type in {person.type for person in persons}}
+		for source, date_event in age_events_of_persons(persons, templates):
+			self.add_event(date_event, source)
+
+	def read_mortgage(self, csv_file_name):
+		""" (source, sum) of every monthly payment """
+		file_name = os.path.basename(csv_file_name)
+		table = Table.read(csv_file_name)
+		check_columns(table, ['SUM'], file_name)
+
+		bad = parse_floats(table['SUM'])[1]
+		if bad.any():
+			errors = TableErrors(file_name)
+			errors.add_cells(table, bad, 'SUM', "SUM is not a number:")
+			raise PlanError(str(errors))
+
+		rows = [(('mortgage', i, pay_sum), pay_sum) for i, pay_sum in enumerate(table['SUM'].tolist())]
+
+		self.count('rows_parsed', len(rows))
+		return rows
+
+	def read_mortgage_tracks(self):
+		""" (tracks, changes by track name) of mortgage_tracks.csv and mortgage_changes.csv, no tracks without them """
+
+		csv_file_name = self.input_file('mortgage_tracks.csv')
+		if not os.path.exists(csv_file_name):
+			return [], dict()
+		tracks = self.mortgage_tracks_of_table(Table.read(csv_file_name))
+
+		changes = dict()
+		csv_file_name = self.input_file('mortgage_changes.csv')
+		if os.path.exists(csv_file_name):
+			for name, change in self.mortgage_changes_of_table(Table.read(csv_file_name), {track.name for track in tracks}):
+				changes.setdefault(name, []).append(change)
+
+		return tracks, changes
+
+	def mortgage_tracks_of_table(self, table, file_name='mortgage_tracks.csv'):
+		""" track of every row that is not ignored, RATE and CPI are yearly percents, CPI defaults to the mean inflation """
+
+		check_columns(table, ['NAME', 'PRINCIPAL', 'RATE', 'TERM', 'START', 'METHOD', 'INDEX', 'CPI', 'IGNORE'], file_name)
+
+		table = table.select(table['IGNORE'] != 'yes')
+		table.fill_default('METHOD', METHODS[0])
+		table.fill_default('INDEX', INDEXES[0])
+		table.fill_default('CPI', str(self.config.inflation_mean*100))
+
+		errors = TableErrors(file_name)
+		names = table['NAME']
+		errors.add(table, names == '', "NAME is empty")
+		__, first, counts = np.unique(names.astype(str), return_index=True, return_counts=True)
+		errors.add_cells(table, np.isin(np.arange(len(table)), first[counts > 1]), 'NAME', "NAME is repeated:")
+
+		numbers = dict()
+		for name in ('PRINCIPAL', 'RATE', 'CPI'):
+			numbers[name], bad = parse_floats(table[name])
+			errors.add_cells(table, bad, name, f"{name} is not a number:")
+		errors.add_cells(table, numbers['PRINCIPAL'] < 0, 'PRINCIPAL', "PRINCIPAL is negative:")
+
+		terms, bad = parse_distinct(table['TERM'], period_months, (PlanError,))
+		errors.add_cells(table, bad, 'TERM', "TERM is not like 30y:")
+
+		today = table['START'] == 'today'
+		years, months, __, bad = parse_dates(table['START'], Config.format_str)
+		errors.add_cells(table, bad & ~today, 'START', "START is not today or a dd/mm/yyyy date:")
+		starts = np.where(today, self.config.start_month, years*12 + months)
+
+		errors.add_cells(table, ~np.isin(table['METHOD'].astype(str), METHODS), 'METHOD', f"METHOD is not in {list(METHODS)}:")
+		errors.add_cells(table, ~np.isin(table['INDEX'].astype(str), INDEXES), 'INDEX', f"INDEX is not in {list(INDEXES)}:")
+		if errors:
+			raise PlanError(str(errors))
+
+		cpis = np.where(table['INDEX'] == 'cpi', numbers['CPI']/100, 0.0)
+		self.count('rows_parsed', len(table))
+		return [Track(name, principal, rate/100, term, start, method, cpi)
+		        for name, principal, rate, term, start, method, cpi
+		        in zip(names.tolist(), numbers['PRINCIPAL'].tolist(), numbers['RATE'].tolist(), terms.tolist(), starts.tolist(), table['METHOD'].tolist(), cpis.tolist())]
+
+	def mortgage_changes_of_table(self, table, track_names, file_name='mortgage_changes.csv'):
+		""" (track name, change) of every row that is not ignored: a repay of SUM (all of it when empty) or a refinance to RATE and/or TERM """
+
+		check_columns(table, ['NAME', 'DATE', 'KIND', 'SUM', 'RATE', 'TERM', 'IGNORE'], file_name)
+		table = table.select(table['IGNORE'] != 'yes')
+
+		errors = TableErrors(file_name)
+		errors.add_cells(table, ~np.isin(table['NAME'].astype(str), list(track_names)), 'NAME', "NAME is not a track of mortgage_tracks.csv:")
+
+		years, months, __, bad = parse_dates(table['DATE'], Config.format_str)
+		errors.add_cells(table, bad, 'DATE', "DATE is not a dd/mm/yyyy date:")
+
+		kinds = table['KIND']
+		errors.add_cells(table, ~np.isin(kinds.astype(str), [REPAY, REFINANCE]), 'KIND', f"KIND is not in {[REPAY, REFINANCE]}:")
+
+		# empty SUM, RATE and TERM are None: all of the balance, the same rate, the same end
+		values = dict()
+		for name, parse, message in (('SUM', float, "is not a number:"), ('RATE', float, "is not a number:"), ('TERM', period_months, "is not like 20y:")):
+			parsed, bad = parse_distinct(table[name], parse, (ValueError, PlanError))
+			empty = table[name] == ''
+			errors.add_cells(table, bad & ~empty, name, f"{name} {message}")
+			values[name] = np.where(empty, None, parsed).tolist()
+		errors.add(table, (kinds == REFINANCE) & (table['RATE'] == '') & (table['TERM'] == ''), "A refinance needs a RATE or a TERM")
+		if errors:
+			raise PlanError(str(errors))
+
+		self.count('rows_parsed', len(table))
+		changes = list()
+		for name, kind, month, amount, rate, term in zip(table['NAME'].tolist(), kinds.tolist(), (years*12 + months).tolist(), values['SUM'], values['RATE'], values['TERM']):
+			if kind == REPAY:
+				changes.append((name, Change(month, REPAY, amount=amount)))
+			else:
+				changes.append((name, Change(month, REFINANCE, rate=None if rate is None else rate/100, term=term)))
+		return changes
+
+	def read_mortgage_runs(self):
+		""" (source, sum) of every run of the same payment of the mortgage tracks, see mortgage.py """
+		tracks, changes = self.read_mortgage_tracks()
+		rows = list()
+		for track in tracks:
+			for run in Schedule(track, changes.get(track.name, [])).runs():
+				rows.append((('mortgage_run', track.name) + run, run[-1]))
+		return rows
+
+	def read_mortgage_inputs(self):
+		""" (source, sum) of the payments of mortgage.csv, which is optional with mortgage_tracks.csv, and of the tracks """
+		csv_file_name = self.input_file('mortgage.csv')
+		rows = list()
+		if os.path.exists(csv_file_name) or not os.path.exists(self.input_file('mortgage_tracks.csv')):
+			rows = self.read_table(self.read_mortgage, csv_file_name)
+		return rows + self.read_mortgage_runs()
+
+	def mortgage_event(self, source):
+		if source[0] == 'mortgage_run':
+			__, track_name, kind, first, last, pay_sum = source
+			name = f"פירעון מוקדם: {track_name}" if kind == "repayment" else f"משכנתא: {track_name}"
+			return DateEvent(event_type="expense", category="דיור", name=name, event_sum=pay_sum, start=first, end=last)
+
+		# paid on the day of the start date, clipped as the months are added one by one
+		__, i, pay_sum = source
+		mortgage_month = self.config.start_month + i
+		day = self.config.start_date.day
+		if day > 28:
+			day = int(occurrence_days(self.config.start_month, day, 1, i + 1)[-1])
+		return DateEvent(event_type="expense", category="דיור", name="משכנתא", event_sum=float(pay_sum), start=mortgage_month, end=mortgage_month, day=day)
+
+	def load_mortgage(self):
+		sources = [source for source, __ in self.read_mortgage_inputs()]
+		date_events = [self.mortgage_event(source) for source in sources]
+		self.add_events(date_events, sources)
+
+	def children(self):
+		return [person for person in self.persons if person.type == "child"]
+
+	def read_child_rules(self):
+		""" rules of the events derived for every child, input_files/child_rules.csv or the default ones """
+		csv_file_name = self.input_file('child_rules.csv')
+		if os.path.exists(csv_file_name):
+			return self.child_rules_of_table(Table.read(csv_file_name))
+		return self.child_rules_of_table(Table.of_rows(list(csv.DictReader(DEFAULT_RULES.splitlines()))))
+
+	def child_rules_of_table(self, table, file_name='child_rules.csv'):
+		""" rules of the rows that are not ignored, the bad cells of all the rows are reported together """
+
+		check_columns(table, ['PASS', 'TYPE', 'CATEGORY', 'NAME', 'SUM', 'FROM', 'UNTIL', 'IGNORE'], file_name)
+		table = table.select(table['IGNORE'] != 'yes')
+
+		errors = TableErrors(file_name)
+		errors.add_cells(table, ~np.isin(table['PASS'].astype(str), PASSES), 'PASS', f"PASS is not in {list(PASSES)}:")
+		errors.add_cells(table, ~np.isin(table['TYPE'].astype(str), Config.event_types), 'TYPE', f"TYPE is not in {Config.event_types}:")
+		errors.add(table, table['CATEGORY'] == '', "CATEGORY is empty")
+		errors.add_cells(table, parse_distinct(table['NAME'], lambda name: name.format(name=''), (KeyError, IndexError, ValueError))[1], 'NAME', "NAME has other fields than {name}:")
+
+		sums, bad = parse_distinct(table['SUM'], parse_sum)
+		errors.add_cells(table, bad, 'SUM', "SUM is not a number, 1|2|3, N*birth_month or maternity_pay:")
+		anchors = dict()
+		for name in ('FROM', 'UNTIL'):
+			anchors[name], bad = parse_distinct(table[name], lambda cell: parse_anchor(cell, period_months), (ValueError, PlanError))
+			errors.add_cells(table, bad, name, f"{name} is not an anchor and an offset like january:6-1m:")
+		if errors:
+			raise PlanError(str(errors))
+
+		self.count('rows_parsed', len(table))
+		return ChildRules(table['PASS'].tolist(), table['TYPE'].tolist(), table['CATEGORY'].tolist(), table['NAME'].tolist(),
+		                  sums.tolist(), anchors['FROM'].tolist(), anchors['UNTIL'].tolist())
+
+	def update(self):
+		"""
+		Re-read the inputs and apply only what changed since the last build.
+
+		Events of input rows that are gone are taken out of the ledger, events
+		of new rows are added, and the children whose auto generated events
+		depend on what changed (their row, their order of birth or the mom
+		salary around their birth) are derived again. The BANK running total
+		is recomputed from the first changed month on when it is next written.
+		Return the number of changed sources.
+		"""
+
+		config = Config(self.config.proj_dir)
+
+		if (config.start_date, config.end_date) != (self.config.start_date, self.config.end_date):
+			self.reset(config)
+			self.build()
+			return len(self.sources)
+
+		date_rows = self.read_date_events(self.input_file('date_events.csv'))
+		mortgage_rows = self.read_mortgage_inputs()
+		persons = self.read_persons(self.input_file('persons.csv'))
+		age_event_rows = {person_type: self.read_age_events(self.input_file(person_type + ".csv")) for person_type in {person.type for person in persons}}
+
+		return self.apply_inputs(config, date_rows, mortgage_rows, persons, age_event_rows, child_rules=self.read_child_rules())
+
+	def apply_inputs(self, config, date_rows, mortgage_rows, persons, age_event_rows, rederive_all=False, child_rules=None):
+		"""
+		Apply read inputs (of the same window) to the built plan, see update.
+		rederive_all derives all the children again, as after a change of
+		childcare_costs, and so do child rules that differ from the plan's.
+		Return the number of changed sources
+		"""
+
+		# parse everything first, bad input leaves the plan as it was
+
+		old_config = self.config
+		self.config = config
+		try:
+			date_rows = dict(date_rows)
+			mortgage_rows = dict(mortgage_rows)
+
+			person_events = dict(age_events_of_persons(persons, age_event_rows))
+
+			stale = [source for source in self.sources if source[0] != 'child' and source not in date_rows and source not in mortgage_rows and source not in person_events]
+			# the new date event rows are parsed together, as in a full build
+			new_events = list()
+			new_sources = [source for source in date_rows if source not in self.sources]
+			if new_sources:
+				new_date_events = self.date_events_of_table(Table.of_rows([date_rows[source] for source in new_sources]))
+				new_events = [(source, date_event) for source, row_events in zip(new_sources, new_date_events) for date_event in row_events]
+			for source, date_event in person_events.items():
+				if source not in self.sources:
+					new_events.append((source, date_event))
+			for source in mortgage_rows:
+				if source not in self.sources:
+					new_events.append((source, self.mortgage_event(source)))
+		except Exception:
+			self.config = old_config
+			raise
+
+		if config.initial_saving != old_config.initial_saving:
+			self.ledger.mark_dirty(0)
+
+		if child_rules is not None and child_rules != self.child_rules:
+			self.child_rules = child_rules
+			rederive_all = True
+
+		# children to derive again
+
+		new_children = sorted(person for person in persons if person.type == "child")
+		new_orders = {child.key: order for order, child in enumerate(new_children, 1)}
+
+		changed_windows = list() # months of mom salary that changed
+		for source in stale:
+			for event_id in self.sources[source]:
+				if self.ledger.is_event_of(event_id, "salary", "mom"):
+					changed_windows.append(self.ledger.event_months(event_id))
+		for source, event in new_events:
+			if is_mom_salary(event):
+				changed_windows.append((event.start, event.end))
+		for child in sorted(self.children()):
+			if child.key not in new_orders:
+				changed_windows.append(maternity_window(child))
+
+		rederive = list()
+		for child in new_children:
+			window = maternity_window(child)
+			if rederive_all or self.child_orders.get(child.key) != new_orders[child.key] or any(is_overlap(window, changed) for changed in changed_windows):
+				rederive.append(child)
+				changed_windows.append(window)
+
+		# undo the children in reverse order, the mom salary changes stack
+		rederive_keys = {child.key for child in rederive}
+		undo = sorted([key for key in self.child_orders if key not in new_orders or key in rederive_keys], key=self.child_orders.get, reverse=True)
+		self.ledger.restore_event_sums([change for key in undo for change in reversed(self.child_overrides.pop(key, []))])
+		removed = [event_id for key in undo for event_id in self.sources.pop(('child', key), [])]
+		for key in undo:
+			del self.child_orders[key]
+
+		# replace the stale input rows, taken out with the children at once
+
+		self.ledger.remove(removed + [event_id for source in stale for event_id in self.sources.pop(source)])
+		for source, date_event in new_events:
+			self.add_event(date_event, source)
+
+		self.persons = persons
+
+		# auto generate events for the children that changed
+		self.create_child_events(self.apply_maternity_leaves(rederive), rederive)
+
+		return len(stale) + len(new_events) + len(rederive)
+
+	def bank_series(self):
+		"""
+		touched rows and BANK after each of them, the running total is
+		recomputed only from the first row that changed since the last call
+		"""
+
+		rows = self.ledger.touched_rows().tolist()
+		keep = bisect.bisect_left(rows, self.ledger.dirty_from)
+		keep = min(keep, len(self.bank))
+
+		bank = self.bank[:keep]
+		bank_acc = bank[-1] if bank else self.config.initial_saving
+
+		for row in rows[keep:]:
+			incomes  =  self.ledger.type_sum(row, "income")
+			expenses =  self.ledger.type_sum(row, "expense")
+			bank_acc = bank_acc + incomes - expenses
+			bank.append(bank_acc)
 
-	 
-		daycare_event = DateEvent(event_type="expense", 
-		                   category="DAYCARE", 
-		                   name="childcare pay"+ child.name, 
-		                   event_sum=childcare_costs[ChildcareType.DAYCARE],
-		                   start=daycare_period.start,
-		                   end=daycare_period.end,
-		                   period=1,
-		                   person_type = child.type)
-		daycare_event.split()
+		self.bank_rows = rows
+		self.bank = bank
+		self.ledger.mark_clean()
 
-		daycare_event = DateEvent(event_type="expense", 
-		                   category="KINDERGARDEN_ZAHARON", 
-		                   name="childcare pay"+ child.name, 
-		                   event_sum=childcare_costs[ChildcareType.KINDERGARDEN_ZAHARON],
-		                   start=kindergarden_zaharon_period.start,
-		                   end=kindergarden_zaharon_period.end,
-		                   period=1,
-		                   person_type = child.type)
+		return rows, bank
 
-		daycare_event.split()
+	def apply_maternity_leaves(self, children=None):
+		"""
+		mom salary during the maternity leave of the children, all of them by
+		default, in order of birth. Return the maternity pay of every child key.
+		The averages read the salaries and not the month sums, so the exact
+		months are summed again once at the end
+		"""
 
-		daycare_event = DateEvent(event_type="expense", 
-		                   category="SCHOOL_ZAHARON", 
-		                   name="childcare pay"+ child.name, 
-		                   event_sum=childcare_costs[ChildcareType.SCHOOL_ZAHARON],
-		                   start=school_zaharon_period.start,
-		                   end=school_zaharon_period.end,
-		                   period=1,
-		                   person_type = child.type)
+		WEEKS_BIRTH_SALARY = 15
 
-		daycare_event.split()
+		maternity_pays = dict()
+		scaled_rows = list()
+		for child_order, child in enumerate(sorted(self.children()), 1):
 
-def create_children_tax_points_events():
-	
-	TAX_POINT_VALUE = 220
-
-	children = [person for person in persons if person.type == "child"]
-
-	print (children)
-
-	for child in children:
-
-		birth_year = child.birthday_actual_date.year
-		birth_month = child.birthday_actual_date.month
-
-		# one-time tax reduce calculated for January
-		curr_event = DateEvent(event_type="income", 
-                   category="TAX_POINTS", 
-                   name="tax point "+ child.name, 
-                   event_sum=birth_month*TAX_POINT_VALUE,
-                   start=datetime(day=1, month=birth_month, year=birth_year).date(),
-                   end=datetime(day=1, month=birth_month, year=birth_year).date(),
-                   period=1,
-                   person_type = child.type)
-		curr_event.split()
-
-
-		if birth_month <= 11:
-			curr_event = DateEvent(event_type="income", 
-	                   category="TAX_POINTS", 
-	                   name="tax point "+ child.name, 
-	                   event_sum=3*TAX_POINT_VALUE,
-	                   start=datetime(day=1, month=birth_month+1, year=birth_year).date(),
-	                   end=datetime(day=1, month=12, year=birth_year).date(),
-	                   period=1,
-	                   person_type = child.type)
-			curr_event.split()
-
-		curr_event = DateEvent(event_type="income", 
-                   category="TAX_POINTS", 
-                   name="tax point "+ child.name, 
-                   event_sum=5*TAX_POINT_VALUE,
-                   start=datetime(day=1, month=1, year=birth_year+1).date(),
-                   end=datetime(day=1, month=12, year=birth_year+5).date(),
-                   period=1,
-                   person_type = child.type)
-		curr_event.split()
-
-		curr_event = DateEvent(event_type="income", 
-                   category="TAX_POINTS", 
-                   name="tax point "+ child.name, 
-                   event_sum=1*TAX_POINT_VALUE,
-                   start=datetime(day=1, month=1, year=birth_year+6).date(),
-                   end=datetime(day=1, month=12, year=birth_year+17).date(),
-                   period=1,
-                   person_type = child.type)
-		curr_event.split()
-
-		curr_event = DateEvent(event_type="income", 
-                   category="TAX_POINTS", 
-                   name="tax point "+ child.name, 
-                   event_sum=0.5*TAX_POINT_VALUE,
-                   start=datetime(day=1, month=1, year=birth_year+18).date(),
-                   end=datetime(day=1, month=12, year=birth_year+18).date(),
-                   period=1,
-                   person_type = child.type)
-		curr_event.split()
+			if children is not None and child not in children:
+				continue
 
+			self.child_orders[child.key] = child_order
+			overrides = self.child_overrides.setdefault(child.key, [])
 
 
-def calc_childcare_cost(birthday):
+			### update mom salary from work to zero or partial durring maternity leave
 
+			# the leave pay months weighted by the days paid, one multiplication
+			maternity_leave = Period(start=child.birthday_actual_date, weeks=LEAVE_WEEKS)
+			start_pay_month, weights = maternity_leave.pay_month_weights()
+			overrides.extend(self.ledger.scale_events("salary", "mom", start_pay_month, start_pay_month + len(weights), weights, 500, sum_exact=False))
+			scaled_rows.extend(row for __, row, __ in overrides)
 
-	# MATERNITY_LEAVE_WEEKS = 26
-	MATERNITY_LEAVE_WEEKS = 15
-	SMALL_PAY = 2192
-	BIG_PAY = 2857
 
-	# SMALL_PAY=913
-	# BIG_PAY=1133
 
-	PRIVATE_CHILDCARE_DAY_PAY = 200
+			### maternity pay from bituh-leumi
 
+			# claculate last 3 and 6 months avg salary
+			first_month = child.birthday_billing_month - 6
+			mom_salaries = self.ledger.first_event_sums("salary", "mom", first_month, child.birthday_billing_month)
+			month_days = [days_in_month(month) for month in range(first_month, child.birthday_billing_month)]
+			avg_day_salary_3_month, avg_day_salary_6_month = average_day_salaries(mom_salaries, month_days)
 
-	maternity_leave           = Period(start=birthday, weeks=MATERNITY_LEAVE_WEEKS) 
+			avg_day_salary = max(float(avg_day_salary_3_month[0]), float(avg_day_salary_6_month[0]))
+			maternity_pay = avg_day_salary * WEEKS_BIRTH_SALARY * 7
+			maternity_pays[child.key] = round_by_factor(maternity_pay, 500)
 
-	childcare_summer_vacation_start = datetime(day=8, month=8, year=maternity_leave.end.year).date()
-	childcare_summer_vacation_end = childcare_summer_vacation_start.replace(day=30)
+		self.ledger.sum_exact(scaled_rows)
+		return maternity_pays
 
+	def create_child_events(self, maternity_pays, children=None):
+		""" events of the child rules for the children, all of them by default, in a single pass over the rule table """
 
-	childcare_summer_vacation = Period(start=childcare_summer_vacation_start, end=childcare_summer_vacation_end)
+		if children is None:
+			children = self.children()
 
-	# number of days of maternity_leave in childcare_summer_vacation
-	# private_day_care_cost = PRIVATE_CHILDCARE_DAY_PAY*childcare_summer_vacation.days()
-	# if childcare_summer_vacation.is_overlap(maternity_leave):
+		print (children)
 
-	# 	childcare_summer_vacation_maternity_leave_overlap = childcare_summer_vacation.get_overlap(maternity_leave)
+		rules = self.child_rules
+		child_indices, rule_indices, firsts, lasts, sums = rules.events([child.birthday_actual_date for child in children],
+		                                                                [self.child_orders[child.key] for child in children],
+		                                                                [maternity_pays.get(child.key, 0.0) for child in children], self.childcare_costs)
+		child_indices, rule_indices = child_indices.tolist(), rule_indices.tolist()
 
-	# 	private_day_care_days = childcare_summer_vacation.days() - childcare_summer_vacation_maternity_leave_overlap.days()
+		event_ids = self.ledger.add_events(firsts, lasts, np.ones(len(firsts), dtype=int), [rules.types[i] for i in rule_indices], [rules.categories[i] for i in rule_indices],
+		                                   [rules.names[i].format(name=children[c].name) for i, c in zip(rule_indices, child_indices)], sums,
+		                                   [children[c].type for c in child_indices])
 
-	# 	private_day_care_cost = private_day_care_days * PRIVATE_CHILDCARE_DAY_PAY
+		for child in children:
+			self.sources.setdefault(('child', child.key), [])
+		for c, event_id in zip(child_indices, event_ids):
+			if event_id is not None:
+				self.sources[('child', children[c].key)].append(event_id)
 
+	# Write the csv output file
+	def write_cash_flow(self, csv_file_name):
+		with replacing_file(csv_file_name, newline='') as csvfile:
+			writer = csv.writer(csvfile)
 
-	childcare_start_pay = maternity_leave.end.replace(day=1)
+			header_row = ['DATE', 'INCOMES', 'EXPENSES', 'BALANCE', 'BANK']
 
-	curr_childcare_year_start = get_next_school_year_start(maternity_leave.end)
-	
+			# incomes first, then expenses
 
+			columns = list()
+			for event_type in Config.event_types:
+				for category in self.ledger.categories[event_type]:
+					header_row.append(category)
+					columns.append(self.ledger.category_columns[category])
 
-	childcare_start_reduced_pay = copy.deepcopy(curr_childcare_year_start)
+			writer.writerow(header_row)
 
-	# check if the child is older than 1 year at the start of the school year
-	curr_child_age = relativedelta(curr_childcare_year_start,birthday)
-	if (curr_child_age.years*12 + curr_child_age.months) < 15:
-		childcare_start_reduced_pay += relativedelta(years=1)
+			# only dates with events, a month is split by day when it has events on other days than the 1st
+			rows, days, category_sums, category_floats, type_sums, type_floats = self.ledger.date_rows()
+			category_sums = category_sums[:, columns]
+			category_cells = as_numbers(category_sums, category_floats[:, columns])
+			bank = self.bank_series()[1] if (days == 1).all() else None
 
-	curr_childcare_year_start = copy.deepcopy(childcare_start_reduced_pay)
+			income_column, expense_column = self.ledger.type_columns["income"], self.ledger.type_columns["expense"]
+			bank_acc = self.config.initial_saving
+			expenses = 0
+			incomes = 0
+			totals = list() # INCOMES, EXPENSES, BALANCE, BANK per row
 
-	while True:
+			for i, (row, day) in enumerate(zip(rows.tolist(), days.tolist())):
 
-		end_of_calendar_curr_year = curr_childcare_year_start.replace(day=31,month=12)
+				curr_month = self.ledger.first_month + row
+				date_obj = to_date(curr_month, day) # dates only in the output
 
-		curr_child_age = relativedelta(end_of_calendar_curr_year, birthday)
-		if curr_child_age.years > 3:
-			break
+				if self.write_detailed_month and curr_month == self.detailed_month and day == 1:
+					self.write_detailed_month_csv(date_obj, self.ledger.month(curr_month))
 
-		final_childcare_year_start = curr_childcare_year_start
-		curr_childcare_year_start += relativedelta(years=1)
+				incomes  =  as_number(type_sums[i, income_column], type_floats[i, income_column])
+				expenses =  as_number(type_sums[i, expense_column], type_floats[i, expense_column])
 
-	childcare_end_pay = final_childcare_year_start + relativedelta(years=1,months=-1)
+				bank_acc = bank_acc + incomes - expenses if bank is None else bank[i]
 
+				out_row = [date_obj,incomes,expenses, (incomes-expenses), bank_acc]
+				totals.append(out_row[1:])
+				out_row.extend(category_cells[i])
 
-	#cost calculation
+				writer.writerow(out_row)
 
-	big_pay_duration = relativedelta(childcare_start_reduced_pay, childcare_start_pay)
-	big_pay_cost = (big_pay_duration.years*12 + big_pay_duration.months)*BIG_PAY
+		# same columns for graph.py, without the csv parsing
+		months = self.ledger.first_month + np.array(rows, dtype=int)
+		values = np.hstack([np.array(totals, dtype=float).reshape(len(rows), 4), category_sums])
+		write_columns(os.path.splitext(csv_file_name)[0] + '.bin', months, header_row[1:], values.T)
 
+		return bank_acc
 
-	small_pay_duration = relativedelta(childcare_end_pay, childcare_start_reduced_pay)
-	small_pay_cost = (small_pay_duration.years*12 + small_pay_duration.months)*SMALL_PAY
 
-	# return private_day_care_cost + big_pay_cost + small_pay_cost
-	return big_pay_cost + small_pay_cost
+	def write_detailed_month_csv(self, date_obj, month):
+		print (date_obj)
+		with replacing_file(os.path.join(self.detailed_month_dir, str(date_obj) + ".csv"), newline='') as csvfile:
+			writer = csv.writer(csvfile)
+			writer.writerow(MonthEvent.generate_header_row())		
+			month_events = month.month_events
+			self.count('month_events', len(month_events))
+			for event in month_events:
+				writer.writerow(event.generate_row())
 
-def calc_child_cost():
 
-	mom_salary = 11000
-	from_age = 0
-	upto_age = 18
 
-	child_file = Config.proj_dir + '/input_files/child.csv'
+def expand_proj_dirs(patterns):
+	""" project dirs from paths and glob patterns, in the given order """
 
+	proj_dirs = list()
 
+	for pattern in patterns:
+		if glob.has_magic(pattern):
+			proj_dirs.extend(path for path in sorted(glob.glob(pattern)) if os.path.isdir(path))
+		else:
+			proj_dirs.append(pattern)
 
+	return proj_dirs
 
 
 def run():
 
-	# load config
-	Config.proj_dir = sys.argv[1]
-	Config.read_file()
-	
-	# load data and create events
-	load_date_events(Config.proj_dir +'/input_files/date_events.csv')
-	load_persons(Config.proj_dir + '/input_files/persons.csv')
-	load_mortgage(Config.proj_dir + '/input_files/mortgage.csv')
-	
-	# auto generate events for children
-	update_incomces_after_births()
-	create_childcare_events()
-	create_children_tax_points_events()
-
-	# wirte ouptup to file
-	write_cash_flow(Config.proj_dir + '/cash_flow.csv')
+	parser = argparse.ArgumentParser(description="Family financial planner")
+	parser.add_argument('proj_dirs', nargs='+', help="project dirs or glob patterns of project dirs")
+	parser.add_argument('--jobs', type=int, default=None, help="worker processes for a batch (default: all cores)")
+	parser.add_argument('--manifest', default='batch_manifest.csv', help="summary file of a batch")
+	parser.add_argument('--montecarlo', type=int, metavar='PATHS', help="also simulate BANK under random returns and inflation")
+	parser.add_argument('--seed', type=int, default=None, help="random seed of the monte carlo")
+	parser.add_argument('--cache', metavar='DIR', help="cache parsed inputs and built plans in DIR")
+	parser.add_argument('--cache-size', type=int, default=512, metavar='MB', help="size limit of the cache (default: 512)")
+	parser.add_argument('--incremental', action='store_true', help="keep the plan in the project dir and apply only the input changes on the next run")
+	parser.add_argument('--profile', metavar='FILE', help="time every phase and write a json report to FILE")
+	parser.add_argument('--trace', metavar='FILE', help="time every phase and write a chrome trace to FILE")
+	parser.add_argument('--watch', action='store_true', help="run again on every change of the input files, until interrupted")
+	args = parser.parse_args()
+
+	proj_dirs = expand_proj_dirs(args.proj_dirs)
+
+	if not proj_dirs:
+		print ("No project dirs")
+		exit(1)
+
+	cache = Cache(args.cache, args.cache_size*1024*1024) if args.cache else None
+
+	if len(proj_dirs) > 1:
+		if args.watch:
+			print ("--watch runs a single project")
+			exit(1)
+		from batch import run_batch
+		if run_batch(proj_dirs, args.manifest, args.jobs, cache):
+			exit(1)
+		return
+
+	profiler = None
+	if args.profile or args.trace:
+		profiler = Profiler(proj_dirs[0])
+		profiler.start()
+
+	try:
+		plan = Plan.load_state(proj_dirs[0]) if args.incremental else None
+		if plan is None:
+			plan = Plan(proj_dirs[0], cache=cache, profiler=profiler)
+			plan.run()
+		else:
+			plan.profiler = profiler
+			with plan.phase('update'):
+				print (f"{plan.update()} sources changed")
+			with plan.phase('write_cash_flow'):
+				plan.write_cash_flow(plan.config.proj_dir + '/cash_flow.csv')
+	except PlanError as error:
+		print (error)
+		exit(1)
+
+	if profiler:
+		profiler.stop()
+		profiler.print_summary()
+		if args.profile:
+			profiler.write_json(args.profile)
+		if args.trace:
+			profiler.write_chrome_trace(args.trace)
+
+	if args.incremental:
+		plan.save_state()
+
+	if args.montecarlo:
+		from montecarlo import run_montecarlo
+		run_montecarlo(plan, args.montecarlo, args.seed)
+
+	if args.watch:
+		from watch import watch_plan
+		watch_plan(plan, args.incremental)
 
 
 
@@ -0,0 +1,220 @@
+import io
+import csv
+import time
+import argparse
+import contextlib
+import numpy as np
+from datetime import datetime
+from run import Plan, PlanError, Config
+from month_calendar import to_ordinal, to_date
+
+
+
+# Linear sensitivity of BANK to every source of events.
+#
+# BANK of a month is initial saving + the signed sums of every occurrence up
+# to that month, so the contribution of an event to BANK at row t is its
+# signed sum times its occurrences up to t: a column of the (months x events)
+# matrix that is encoded by the event's first row, last row and period alone.
+# Occurrences changed after the event was added (the maternity rules) are
+# kept as (row, delta) corrections. A row of the matrix is computed for all
+# events at once and summed per source (an input row, or a child for the
+# derived events); a what if is BANK plus x times the unit column of a source.
+
+
+class Sensitivity:
+
+	def __init__(self, plan):
+		ledger = plan.ledger
+		log = ledger.log
+		self.ledger = ledger
+		self.initial_saving = plan.config.initial_saving
+
+		self.sources = [source for source, event_ids in plan.sources.items() if event_ids]
+		self.labels = source_labels(plan, self.sources)
+		self.source_index = {label: i for i, label in enumerate(self.labels)}
+
+		event_ids = list()
+		event_sources = list()
+		for i, source in enumerate(self.sources):
+			event_ids.extend(plan.sources[source])
+			event_sources.extend([i] * len(plan.sources[source]))
+		self.event_ids = np.array(event_ids, dtype=int)
+		self.event_sources = np.array(event_sources, dtype=int)
+
+		periods = log.periods[self.event_ids]
+		firsts = log.firsts[self.event_ids]
+		self.firsts = np.where(firsts < 0, firsts % periods, firsts) # first row inside
+		self.lasts = np.minimum(log.lasts[self.event_ids], ledger.n_months - 1)
+		self.periods = periods
+		income = ledger.type_columns["income"]
+		self.signs = np.where(log.types[self.event_ids] == income, 1.0, -1.0)
+		self.signed_sums = self.signs * log.sums[self.event_ids]
+
+		# (row, position of the event, its override) of every overridden occurrence, by row
+		positions = {event_id: i for i, event_id in enumerate(event_ids)}
+		corrections = sorted((row, positions[event_id], event_sum)
+		                     for row, row_overrides in ledger.overrides.items() for event_id, event_sum in row_overrides.items() if event_id in positions)
+		rows, corrected, override_sums = (np.array(column) for column in zip(*corrections)) if corrections else (np.zeros(0, dtype=int),) * 3
+		self.correction_rows = rows.astype(int)
+		self.corrected = corrected.astype(int)
+		self.correction_sources = self.event_sources[self.corrected]
+		self.correction_deltas = self.signs[self.corrected] * override_sums - self.signed_sums[self.corrected]
+
+	@property
+	def n_sources(self):
+		return len(self.sources)
+
+	def counts_until(self, row):
+		""" occurrences of every event in rows [0, row] """
+		counts = (np.minimum(row, self.lasts) - self.firsts) // self.periods + 1
+		return np.maximum(counts, 0)
+
+	def bank_contributions(self, row):
+		""" contribution of every source to BANK at a row, a row of the matrix """
+		contributions = np.bincount(self.event_sources, self.signed_sums * self.counts_until(row), minlength=self.n_sources)
+		n_corrections = np.searchsorted(self.correction_rows, row, side='right')
+		contributions += np.bincount(self.correction_sources[:n_corrections], self.correction_deltas[:n_corrections], minlength=self.n_sources)
+		return contributions
+
+	def balance_contributions(self, row):
+		""" contribution of every source to the balance of a row """
+		hits = (self.firsts <= row) & (row <= self.lasts) & ((row - self.firsts) % self.periods == 0)
+		contributions = np.bincount(self.event_sources[hits], self.signed_sums[hits], minlength=self.n_sources)
+		at_row = slice(*np.searchsorted(self.correction_rows, [row, row + 1]))
+		contributions += np.bincount(self.correction_sources[at_row], self.correction_deltas[at_row], minlength=self.n_sources)
+		return contributions
+
+	def drivers(self, row, top=5):
+		""" (label, contribution) of the sources with the largest contribution to BANK at a row """
+		contributions = self.bank_contributions(row)
+		order = np.argsort(-np.abs(contributions), kind='stable')[:top]
+		return [(self.labels[i], float(contributions[i])) for i in order if contributions[i]]
+
+	def unit(self, label):
+		"""
+		BANK change of every month per 1 added to the sum of every event of
+		a source (for an input row, its SUM). Overridden occurrences keep
+		their sum
+		"""
+		source = self.source_index.get(label)
+		if source is None:
+			raise PlanError(f"No source {label}")
+
+		balance = np.zeros(self.ledger.n_months)
+		for i in np.flatnonzero(self.event_sources == source):
+			balance[self.firsts[i]:self.lasts[i] + 1:self.periods[i]] += self.signs[i]
+		for row, i in zip(self.correction_rows, self.corrected):
+			if self.event_sources[i] == source:
+				balance[row] -= self.signs[i]
+		return np.cumsum(balance)
+
+	def bank(self):
+		balance = self.ledger.type_series("income") - self.ledger.type_series("expense")
+		return self.initial_saving + np.cumsum(balance)
+
+	def what_if(self, changes, bank=None):
+		""" BANK of every month after adding x to the sums of the sources in changes {label: x} """
+		bank = self.bank() if bank is None else bank.copy()
+		for label, x in changes.items():
+			bank += x * self.unit(label)
+		return bank
+
+
+def source_labels(plan, sources):
+	""" readable and unique name of every source """
+
+	ledger = plan.ledger
+	labels = list()
+	seen = dict()
+	for source in sources:
+		kind = source[0]
+		if kind == 'child':
+			label = f"child: {source[1][0]}"
+		elif kind == 'mortgage':
+			label = f"mortgage: {source[1] + 1}"
+		elif kind == 'mortgage_run':
+			label = f"mortgage {source[1]}: {source[2]} from {to_date(source[3]).strftime(Config.format_str)}"
+		else: # date and age events, the name of an age event starts with the person
+			label = ledger.names.strings[ledger.log.names[plan.sources[source][0]]]
+		seen[label] = seen.get(label, 0) + 1
+		if seen[label] > 1:
+			label = f"{label} ({seen[label]})"
+		labels.append(label)
+	return labels
+
+
+def write_drivers(sensitivity, csv_file_name, top):
+	""" the top sources of BANK in every touched month """
+	ledger = sensitivity.ledger
+	with open(csv_file_name, 'w', newline='') as csv_file:
+		writer = csv.writer(csv_file)
+		writer.writerow(['DATE', 'RANK', 'SOURCE', 'BANK_CONTRIBUTION'])
+		for row in ledger.touched_rows():
+			date = to_date(ledger.first_month + int(row)).strftime(Config.format_str)
+			for rank, (label, contribution) in enumerate(sensitivity.drivers(int(row), top), 1):
+				writer.writerow([date, rank, label, round(contribution, 2)])
+
+
+def parse_month(date_str):
+	try:
+		return to_ordinal(datetime.strptime(date_str, Config.format_str))
+	except ValueError:
+		raise PlanError(f"{date_str} is not a dd/mm/yyyy date")
+
+
+def parse_change(change):
+	label, __, x = change.rpartition('=')
+	if not label:
+		raise PlanError(f"A what if is SOURCE=X, not {change}")
+	try:
+		return label, float(x)
+	except ValueError:
+		raise PlanError(f"A what if is SOURCE=X, not {change}")
+
+
+def run():
+
+	parser = argparse.ArgumentParser(description="Sensitivity of BANK to every input row")
+	parser.add_argument('proj_dir')
+	parser.add_argument('--month', help="print the sources that drive BANK at this month (dd/mm/yyyy, default the end date)")
+	parser.add_argument('--top', type=int, default=5, help="sources per month")
+	parser.add_argument('--out', help="csv of the top sources of every month (default <proj_dir>/sensitivity.csv)")
+	parser.add_argument('--what-if', nargs='*', default=[], metavar='SOURCE=X', help="add X to the sum of a source, e.g. 'rent=500'")
+	args = parser.parse_args()
+
+	try:
+		with contextlib.redirect_stdout(io.StringIO()):
+			plan = Plan(args.proj_dir)
+			plan.build()
+
+		start_time = time.perf_counter()
+		sensitivity = Sensitivity(plan)
+		ledger = plan.ledger
+		bank = sensitivity.bank()
+		month = parse_month(args.month) if args.month else ledger.first_month + ledger.n_months - 1
+		row = min(max(month - ledger.first_month, 0), ledger.n_months - 1)
+
+		print (f"BANK at {to_date(ledger.first_month + row)}: {bank[row]:.2f} (initial saving {sensitivity.initial_saving})")
+		for label, contribution in sensitivity.drivers(row, args.top):
+			print (f"    {contribution:16.2f}  {label}")
+
+		write_drivers(sensitivity, args.out or args.proj_dir + '/sensitivity.csv', args.top)
+
+		if args.what_if:
+			changes = dict(parse_change(change) for change in args.what_if)
+			what_if_time = time.perf_counter()
+			new_bank = sensitivity.what_if(changes, bank)
+			what_if_time = time.perf_counter() - what_if_time
+			print (f"what if {', '.join(args.what_if)}: BANK at {to_date(ledger.first_month + row)} {new_bank[row]:.2f}, "
+			       f"lowest {new_bank.min():.2f} ({what_if_time*1000:.2f} ms)")
+	except PlanError as error:
+		print (error)
+		exit(1)
+
+	print (f"{sensitivity.n_sources} sources, {time.perf_counter() - start_time:.2f} s")
+
+
+
+if __name__ == '__main__':
+	run()
@@ -0,0 +1,325 @@
+import io
+import os
+import json
+import time
+import pickle
+import asyncio
+import argparse
+import contextlib
+import collections
+import numpy as np
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from run import Plan, PlanError, Config, read_csv_rows
+from columnar import columns_bytes
+from month_calendar import to_date
+
+
+
+# Local query service that keeps built plans in memory.
+#
+# A minimal HTTP/1.1 server on asyncio streams (tcp or a unix socket, keep
+# alive) in front of an LRU store of resident plans, limited by their pickled
+# size. A query applies changes to the csv rows of a plan with
+# Plan.apply_inputs, so only the changed rows and the children they affect
+# are computed again, and returns the monthly series. The changed rows stay
+# applied until the next query, which applies its own rows over them (the
+# original rows when it has no changes), so a query costs a single pass.
+# The plans are used from a single worker thread, one request at a time,
+# and the event loop only does the io.
+#
+#   POST /query   {"proj_dir": ..., "changes": [change, ...], "format": "json" | "binary"}
+#   POST /reload  {"proj_dir": ...}     apply the input files again (Plan.update)
+#   GET  /stats
+#
+# A change is {"file": "date_events.csv", "name": "rent", "set": {"SUM": "5000"}},
+# "row": <csv row number, from 0> instead of "name" when names repeat, e.g.
+# {"file": "persons.csv", "name": "kid0", "set": {"BIRTHDAY": "01/05/2027"}} or
+# {"file": "date_events.csv", "row": 4, "set": {"IGNORE": "yes"}}.
+
+SERIES_COLUMNS = ['INCOMES', 'EXPENSES', 'BALANCE', 'BANK']
+DEFAULT_MAX_BYTES = 1024*1024*1024
+LATENCIES = 1000 # queries kept for the latency percentiles
+
+
+class QueryError(Exception):
+	pass
+
+
+class Resident:
+	""" a built plan and the csv rows of its inputs """
+
+	def __init__(self, proj_dir):
+		self.plan = Plan(proj_dir)
+		self.plan.build()
+		self.read_inputs()
+		self.changed = False # the plan holds the changes of the last query
+
+	def read_inputs(self):
+		plan = self.plan
+		file_names = ['date_events.csv', 'persons.csv']
+		self.csv_rows = {file_name: read_csv_rows(plan.input_file(file_name)) for file_name in file_names}
+		file_names += [person_type + '.csv' for person_type in {row['TYPE'] for row in self.csv_rows['persons.csv']}]
+		self.csv_rows.update({file_name: read_csv_rows(plan.input_file(file_name)) for file_name in file_names[2:]})
+
+		self.parsed = {file_name: self.parse(file_name, self.csv_rows[file_name]) for file_name in file_names}
+		self.mortgage_rows = dict(plan.read_mortgage_inputs())
+		self.base_inputs = self.inputs()
+		self.size = len(pickle.dumps(plan, pickle.HIGHEST_PROTOCOL))
+
+	def parse(self, file_name, csv_rows):
+		""" parsed csv rows of an input file """
+		if file_name == 'date_events.csv':
+			return self.plan.date_events_of_rows(csv_rows)
+		if file_name == 'persons.csv':
+			return self.plan.persons_of_rows(csv_rows)
+		return self.plan.age_events_of_rows(file_name[:-len('.csv')], csv_rows)
+
+	def inputs(self, changes=()):
+		""" arguments of Plan.apply_inputs with the changes, only the changed files are parsed again """
+
+		changed_rows = dict() # file name / csv rows with the changes
+		for change in changes:
+			check_change(change)
+			file_name = change.get('file', 'date_events.csv')
+			if file_name not in self.csv_rows:
+				raise QueryError(f"Can not change {file_name}")
+			if file_name not in changed_rows:
+				changed_rows[file_name] = [dict(row) for row in self.csv_rows[file_name]]
+			apply_change(changed_rows[file_name], file_name, change)
+
+		parsed = dict(self.parsed)
+		for file_name, csv_rows in changed_rows.items():
+			parsed[file_name] = self.parse(file_name, csv_rows)
+
+		persons = parsed['persons.csv']
+		age_event_rows = {person.type: parsed[person.type + '.csv'] for person in persons}
+		return self.plan.config, parsed['date_events.csv'], self.mortgage_rows, persons, age_event_rows
+
+	def query(self, changes):
+		""" months and series of the plan with the changes, which the plan keeps until the next query """
+
+		plan = self.plan
+		if not changes and not self.changed:
+			return self.series()
+
+		inputs = self.inputs(changes) if changes else self.base_inputs
+		try:
+			plan.apply_inputs(*inputs)
+		except Exception:
+			plan.apply_inputs(*self.base_inputs)
+			self.changed = False
+			raise
+		self.changed = bool(changes)
+		return self.series()
+
+	def series(self):
+		rows, bank = self.plan.bank_series()
+		ledger = self.plan.ledger
+		incomes = ledger.type_series("income")[rows]
+		expenses = ledger.type_series("expense")[rows]
+		return ledger.first_month + np.array(rows, dtype=int), [incomes, expenses, incomes - expenses, np.array(bank, dtype=float)]
+
+	def reload(self):
+		self.plan.update()
+		self.read_inputs()
+		self.changed = False
+
+
+def check_change(change):
+	""" the types of the fields of a change, as json gives them """
+	if not isinstance(change, dict):
+		raise QueryError(f"A change is an object, not {change!r}")
+	if not isinstance(change.get('file', ''), str):
+		raise QueryError(f"file is not a string: {change['file']!r}")
+	if 'row' in change and (not isinstance(change['row'], int) or isinstance(change['row'], bool)):
+		raise QueryError(f"row is not a whole number: {change['row']!r}")
+	if not isinstance(change.get('name', ''), str):
+		raise QueryError(f"name is not a string: {change['name']!r}")
+	if not isinstance(change.get('set', {}), dict):
+		raise QueryError(f"set is not an object: {change['set']!r}")
+
+
+def apply_change(rows, file_name, change):
+	if 'row' in change:
+		if not 0 <= change['row'] < len(rows):
+			raise QueryError(f"No row {change['row']} in {file_name}")
+		changed = [rows[change['row']]]
+	else:
+		changed = [row for row in rows if row.get('NAME') == change.get('name')]
+		if len(changed) != 1:
+			raise QueryError(f"{len(changed)} rows of {file_name} are named {change.get('name')}, give its row")
+
+	for column, value in change.get('set', {}).items():
+		if column not in changed[0]:
+			raise QueryError(f"No column {column} in {file_name}")
+		changed[0][column] = str(value)
+
+
+class PlanStore:
+	""" resident plans by project dir, least recently used evicted above max_bytes """
+
+	def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+		self.max_bytes = max_bytes
+		self.residents = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, proj_dir):
+		key = os.path.realpath(proj_dir)
+		resident = self.residents.get(key)
+		if resident is not None:
+			self.residents.move_to_end(key)
+			self.hits += 1
+			return resident
+
+		if not os.path.isdir(os.path.join(key, 'input_files')):
+			raise QueryError(f"No project in {proj_dir}")
+		self.misses += 1
+		resident = self.residents[key] = Resident(key)
+		self.evict()
+		return resident
+
+	def evict(self):
+		while len(self.residents) > 1 and self.total_bytes() > self.max_bytes:
+			self.residents.popitem(last=False)
+
+	def total_bytes(self):
+		return sum(resident.size for resident in self.residents.values())
+
+
+class Service:
+
+	def __init__(self, store):
+		self.store = store
+		self.worker = ThreadPoolExecutor(max_workers=1) # the plans are not shared between threads
+		self.latencies = collections.deque(maxlen=LATENCIES)
+
+	def query(self, request):
+		if not isinstance(request.get('changes', []), list):
+			raise QueryError("changes is not a list")
+		resident = self.store.get(request['proj_dir'])
+		months, columns = resident.query(request.get('changes', []))
+
+		if request.get('format') == 'binary':
+			return 'application/octet-stream', columns_bytes(months, SERIES_COLUMNS, columns)
+
+		series = {"DATE": [to_date(month).strftime(Config.format_str) for month in months.tolist()]}
+		for name, column in zip(SERIES_COLUMNS, columns):
+			series[name] = column.tolist()
+		return 'application/json', json.dumps(series).encode()
+
+	def reload(self, request):
+		resident = self.store.get(request['proj_dir'])
+		resident.reload()
+		return 'application/json', json.dumps({"proj_dir": request['proj_dir'], "events": resident.plan.ledger.n_events}).encode()
+
+	def stats(self):
+		latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+		return 'application/json', json.dumps({
+			"plans": list(self.store.residents),
+			"bytes": self.store.total_bytes(),
+			"max_bytes": self.store.max_bytes,
+			"hits": self.store.hits,
+			"misses": self.store.misses,
+			"queries": len(self.latencies),
+			"p50_ms": float(np.percentile(latencies, 50)),
+			"p99_ms": float(np.percentile(latencies, 99)),
+		}).encode()
+
+	def respond(self, method, path, body):
+		""" (status, content type, payload) of a request, runs on the worker thread """
+
+		start_time = time.perf_counter()
+		try:
+			with contextlib.redirect_stdout(io.StringIO()):
+				if method == 'GET' and path == '/stats':
+					return 200, *self.stats()
+				if method == 'POST' and path in ('/query', '/reload'):
+					request = json.loads(body or b'{}')
+					if not isinstance(request, dict):
+						raise QueryError(f"A request is an object, not {request!r}")
+					if 'proj_dir' not in request:
+						raise QueryError("proj_dir is missing")
+					if not isinstance(request['proj_dir'], str):
+						raise QueryError(f"proj_dir is not a string: {request['proj_dir']!r}")
+					if path == '/reload':
+						return 200, *self.reload(request)
+					response = 200, *self.query(request)
+					self.latencies.append((time.perf_counter() - start_time)*1000)
+					return response
+			return 404, 'application/json', json.dumps({"error": f"No {method} {path}"}).encode()
+		except (QueryError, PlanError, ValueError, KeyError, OSError) as error:
+			return 400, 'application/json', json.dumps({"error": f"{type(error).__name__}: {error}"}).encode()
+
+	async def handle(self, reader, writer):
+		""" the requests of a connection, kept alive until the client closes it """
+
+		loop = asyncio.get_running_loop()
+		try:
+			while True:
+				request_line = await reader.readline()
+				if not request_line.strip():
+					break
+				method, target, version = request_line.decode('latin-1').split()
+
+				headers = dict()
+				while True:
+					line = await reader.readline()
+					if not line.strip():
+						break
+					name, __, value = line.decode('latin-1').partition(':')
+					headers[name.strip().lower()] = value.strip()
+				body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+				status, content_type, payload = await loop.run_in_executor(self.worker, self.respond, method, urlsplit(target).path, body)
+
+				keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+				writer.write((f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+				              f"Content-Type: {content_type}\r\n"
+				              f"Content-Length: {len(payload)}\r\n"
+				              f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode() + payload)
+				await writer.drain()
+				if not keep_alive:
+					break
+		except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+			pass
+		finally:
+			writer.close()
+
+
+async def serve(service, host, port, socket_path=None):
+	if socket_path:
+		server = await asyncio.start_unix_server(service.handle, path=socket_path)
+		print (f"serving on {socket_path}")
+	else:
+		server = await asyncio.start_server(service.handle, host, port)
+		print (f"serving on http://{host}:{port}")
+	async with server:
+		await server.serve_forever()
+
+
+def run():
+
+	parser = argparse.ArgumentParser(description="Local query service of resident plans")
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--socket', help="serve on a unix socket instead of tcp")
+	parser.add_argument('--max-mb', type=int, default=DEFAULT_MAX_BYTES // 2**20, help="memory limit of the resident plans")
+	parser.add_argument('--preload', nargs='*', default=[], metavar='PROJ_DIR', help="project dirs to load before serving")
+	args = parser.parse_args()
+
+	store = PlanStore(args.max_mb * 2**20)
+	with contextlib.redirect_stdout(io.StringIO()):
+		for proj_dir in args.preload:
+			store.get(proj_dir)
+
+	try:
+		asyncio.run(serve(Service(store), args.host, args.port, args.socket))
+	except KeyboardInterrupt:
+		pass
+
+
+
+if __name__ == '__main__':
+	run()
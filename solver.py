@@ -0,0 +1,370 @@
+import io
+import time
+import argparse
+import contextlib
+import numpy as np
+from datetime import datetime
+from run import Plan, PlanError, Config
+from month_calendar import to_ordinal, to_date
+
+
+
+# Goal seek over a single plan parameter.
+#
+# The plan is built once. BANK is initial saving + the cumulative sum of the
+# monthly balance, and a variable changes only its own contribution to that
+# balance, so every evaluation is the base balance (the plan without the
+# variable) plus the contribution of the tried value and one cumulative sum.
+# Variables take whole values, shekels or month ordinals.
+# The constraints are assumed monotonic in the variable: the values that
+# satisfy them are everything below (or above) a single boundary, which is
+# found by expanding a bracket from the current value and bisecting it.
+
+MAX_EVALUATIONS = 200
+MAX_DOUBLINGS = 40 # of the first step, further is unbounded
+
+
+def occurrence_vector(ledger, first, last, period, weight=1):
+	""" weight on every ledger row an interval hits """
+	vector = np.zeros(ledger.n_months)
+	vector[ledger.occurrences(first, last, period)] = weight
+	return vector
+
+
+def events_vector(ledger, event_ids):
+	""" signed occurrences of events, +1 per income and -1 per expense """
+	vector = np.zeros(ledger.n_months)
+	log = ledger.log
+	for event_id in event_ids:
+		sign = 1 if ledger.event_types[log.types[event_id]] == "income" else -1
+		vector += occurrence_vector(ledger, int(log.firsts[event_id]), int(log.lasts[event_id]), int(log.periods[event_id]), sign)
+	return vector
+
+
+def check_not_overridden(ledger, event_ids, name):
+	overridden = {event_id for row_overrides in ledger.overrides.values() for event_id in row_overrides}
+	if overridden.intersection(event_ids):
+		raise PlanError(f"{name} is changed by the maternity rules, it can not be solved for")
+
+
+class EventSum:
+	""" the sum of the date events of a row of date_events.csv """
+
+	def __init__(self, plan, name):
+		self.name = name
+		self.event_ids = find_date_event_ids(plan, name)
+		check_not_overridden(plan.ledger, self.event_ids, name)
+		self.unit = events_vector(plan.ledger, self.event_ids)
+		self.value = plan.ledger.log.sum(self.event_ids[0])
+		self.lower, self.upper = 0, None # sums are not negative
+		self.step = max(abs(self.value), 1000)
+
+	def contribution(self, value):
+		return value * self.unit
+
+	def initial_saving(self, value, initial_saving):
+		return initial_saving
+
+	def format(self, value):
+		return str(value)
+
+
+class EventMonth:
+	""" the start or the end month of a row of date_events.csv """
+
+	def __init__(self, plan, name, edge):
+		ledger = plan.ledger
+		self.name = name
+		self.edge = edge
+		self.event_ids = find_date_event_ids(plan, name)
+		check_not_overridden(ledger, self.event_ids, name)
+
+		event_id = self.event_ids[0]
+		log = ledger.log
+		self.ledger = ledger
+		self.first, self.last, self.period = int(log.firsts[event_id]), int(log.lasts[event_id]), int(log.periods[event_id])
+		sign = 1 if ledger.event_types[log.types[event_id]] == "income" else -1
+		self.signed_sum = sign * log.sum(event_id)
+
+		month = self.first if edge == "start" else self.last
+		self.value = ledger.first_month + month
+		self.lower = ledger.first_month - 1
+		self.upper = ledger.first_month + ledger.n_months - 1
+		self.step = 12
+
+	def contribution(self, value):
+		row = value - self.ledger.first_month
+		if self.edge == "start":
+			return occurrence_vector(self.ledger, row, self.last, self.period, self.signed_sum)
+		return occurrence_vector(self.ledger, self.first, row, self.period, self.signed_sum)
+
+	def initial_saving(self, value, initial_saving):
+		return initial_saving
+
+	def format(self, value):
+		return str(to_date(value))
+
+
+class InitialSaving:
+
+	def __init__(self, plan):
+		self.value = plan.config.initial_saving
+		self.lower, self.upper = None, None
+		self.step = max(abs(self.value), 1000)
+		self.zeros = np.zeros(plan.ledger.n_months)
+
+	def contribution(self, value):
+		return self.zeros
+
+	def initial_saving(self, value, initial_saving):
+		return value
+
+	def format(self, value):
+		return str(value)
+
+
+class ChildcareCost:
+	""" the monthly cost of a childcare rule, paid for every child """
+
+	def __init__(self, plan, childcare_name):
+		if childcare_name not in plan.child_rules.categories_of("childcare"):
+			raise PlanError(f"No childcare rule {childcare_name}")
+		self.value = plan.childcare_costs.get(childcare_name, plan.child_rules.category_sum(childcare_name))
+		self.event_ids = plan.ledger.indexed_events(childcare_name, "child").tolist()
+		self.unit = events_vector(plan.ledger, self.event_ids)
+		self.lower, self.upper = 0, None
+		self.step = max(self.value, 1000)
+
+	def contribution(self, value):
+		return value * self.unit
+
+	def initial_saving(self, value, initial_saving):
+		return initial_saving
+
+	def format(self, value):
+		return str(value)
+
+
+class NewEvent:
+	""" a monthly event that is not in the plan yet, from start to end """
+
+	def __init__(self, plan, event_type, start, end):
+		ledger = plan.ledger
+		sign = 1 if event_type == "income" else -1
+		self.unit = occurrence_vector(ledger, start - ledger.first_month, end - ledger.first_month, 1, sign)
+		self.value = 0
+		self.lower, self.upper = 0, None
+		self.step = 1000
+
+	def contribution(self, value):
+		return value * self.unit
+
+	def initial_saving(self, value, initial_saving):
+		return initial_saving
+
+	def format(self, value):
+		return str(value)
+
+
+def find_date_event_ids(plan, name):
+	""" ledger ids of the events of the single date_events.csv row with a name """
+	sources = [source for source, row in plan.read_date_events(plan.input_file('date_events.csv')) if row['NAME'] == name]
+	if len(sources) > 1:
+		raise PlanError(f"{len(sources)} date events are named {name}")
+	event_ids = plan.sources.get(sources[0], []) if sources else []
+	if not event_ids:
+		raise PlanError(f"No date event named {name} inside the plan")
+	return list(event_ids)
+
+
+class Kernel:
+	""" BANK of every month as a function of a variable """
+
+	def __init__(self, plan, variable):
+		ledger = plan.ledger
+		self.variable = variable
+		self.initial = plan.config.initial_saving
+		balance = ledger.type_series("income") - ledger.type_series("expense")
+		self.base = balance - variable.contribution(variable.value)
+		self.evaluations = 0
+
+	def bank(self, value):
+		self.evaluations += 1
+		return self.variable.initial_saving(value, self.initial) + np.cumsum(self.base + self.variable.contribution(value))
+
+
+class Constraints:
+	""" minimum BANK in a range of months and a target BANK at the end """
+
+	def __init__(self, ledger, min_balance=None, first_month=None, last_month=None, final=None):
+		self.min_balance = min_balance
+		self.final = final
+		first_row = 0 if first_month is None else max(first_month - ledger.first_month, 0)
+		last_row = ledger.n_months - 1 if last_month is None else min(last_month - ledger.first_month, ledger.n_months - 1)
+		self.rows = slice(first_row, last_row + 1)
+
+	def ok(self, bank):
+		if self.min_balance is not None and len(bank[self.rows]) and bank[self.rows].min() < self.min_balance:
+			return False
+		if self.final is not None and len(bank) and bank[-1] < self.final:
+			return False
+		return True
+
+
+def solve(kernel, constraints, goal="max", tolerance=1):
+	"""
+	largest (goal max) or smallest (goal min) value of the variable that
+	meets the constraints. Return (value, status), status is "ok", "bound"
+	(the variable bound meets them), "unbounded" (still met after
+	MAX_EVALUATIONS) or "infeasible"
+	"""
+
+	variable = kernel.variable
+	direction = 1 if goal == "max" else -1
+
+	def clamp(value):
+		if variable.lower is not None:
+			value = max(value, variable.lower)
+		if variable.upper is not None:
+			value = min(value, variable.upper)
+		return value
+
+	def feasible(value):
+		return constraints.ok(kernel.bank(value))
+
+	first_step = variable.step
+
+	# a value that meets the constraints, looked for on both sides
+	good = bad = None
+	if feasible(variable.value):
+		good = variable.value
+	else:
+		step = first_step
+		sides = {1: variable.value, -1: variable.value} # side / last value that fails
+		while good is None and sides and kernel.evaluations < MAX_EVALUATIONS:
+			for side, failed in list(sides.items()):
+				candidate = clamp(failed + side*step)
+				if candidate == failed:
+					del sides[side]
+				elif feasible(candidate):
+					good = candidate
+					if side == -direction: # the boundary is behind it
+						bad = failed
+					break
+				else:
+					sides[side] = candidate
+			step *= 2
+		if good is None:
+			return None, "infeasible"
+
+	# bracket: good meets the constraints, bad does not
+	step = first_step
+	while bad is None:
+		if step > first_step * 2**MAX_DOUBLINGS or kernel.evaluations >= MAX_EVALUATIONS:
+			return good, "unbounded"
+		candidate = clamp(good + direction*step)
+		if candidate == good:
+			return good, "bound"
+		if feasible(candidate):
+			good = candidate
+			step *= 2
+		else:
+			bad = candidate
+
+	# bisection
+	while abs(bad - good) > tolerance and kernel.evaluations < MAX_EVALUATIONS:
+		middle = (good + bad) // 2
+		if middle in (good, bad):
+			break
+		if feasible(middle):
+			good = middle
+		else:
+			bad = middle
+
+	return good, "ok"
+
+
+def parse_month(date_str):
+	try:
+		return to_ordinal(datetime.strptime(date_str, Config.format_str))
+	except ValueError:
+		raise PlanError(f"{date_str} is not a dd/mm/yyyy date")
+
+
+def make_variable(plan, spec):
+	"""
+	sum:NAME, start:NAME, end:NAME (a date_events.csv row), initial_saving,
+	childcare:DAYCARE|KINDERGARDEN_ZAHARON|SCHOOL_ZAHARON or
+	new:income|expense:START[:END] (dates dd/mm/yyyy)
+	"""
+
+	kind, __, rest = spec.partition(':')
+
+	if kind == "sum":
+		return EventSum(plan, rest)
+	if kind in ("start", "end"):
+		return EventMonth(plan, rest, kind)
+	if kind == "initial_saving":
+		return InitialSaving(plan)
+	if kind == "childcare":
+		return ChildcareCost(plan, rest)
+	if kind == "new":
+		parts = rest.split(':')
+		if not 2 <= len(parts) <= 3 or parts[0] not in ("income", "expense"):
+			raise PlanError(f"A new event variable is new:income|expense:START[:END], not {spec}")
+		end = parse_month(parts[2]) if len(parts) > 2 else plan.config.end_month
+		return NewEvent(plan, parts[0], parse_month(parts[1]), end)
+
+	raise PlanError(f"Unknown variable: {spec}")
+
+
+def run():
+
+	parser = argparse.ArgumentParser(description="Goal seek a plan parameter against BANK constraints")
+	parser.add_argument('proj_dir')
+	parser.add_argument('--variable', required=True, help=make_variable.__doc__.strip().replace('\t', ''))
+	parser.add_argument('--goal', choices=['max', 'min'], default='max')
+	parser.add_argument('--min-balance', type=float, default=None, help="BANK must stay at or above this")
+	parser.add_argument('--from', dest='from_date', default=None, help="first month of the minimum balance constraint (dd/mm/yyyy)")
+	parser.add_argument('--until', default=None, help="last month of the minimum balance constraint (dd/mm/yyyy)")
+	parser.add_argument('--final', type=float, default=None, help="BANK at the end date must be at least this")
+	parser.add_argument('--tolerance', type=int, default=1, help="in shekels, or months for start and end")
+	args = parser.parse_args()
+
+	if args.min_balance is None and args.final is None:
+		args.min_balance = 0
+
+	try:
+		with contextlib.redirect_stdout(io.StringIO()):
+			plan = Plan(args.proj_dir)
+			plan.build()
+
+		start_time = time.perf_counter()
+		variable = make_variable(plan, args.variable)
+		kernel = Kernel(plan, variable)
+		constraints = Constraints(plan.ledger, args.min_balance,
+		                          parse_month(args.from_date) if args.from_date else None,
+		                          parse_month(args.until) if args.until else None,
+		                          args.final)
+		value, status = solve(kernel, constraints, args.goal, args.tolerance)
+		solve_time = time.perf_counter() - start_time
+	except PlanError as error:
+		print (error)
+		exit(1)
+
+	print (f"{args.variable}: was {variable.format(variable.value)}")
+	if value is None:
+		print (f"{status}: no value meets the constraints")
+		exit(1)
+	if status == "unbounded":
+		print (f"{status}: every {'larger' if args.goal == 'max' else 'smaller'} value tried meets the constraints, up to {variable.format(value)}")
+		exit(0)
+
+	bank = kernel.bank(value)
+	print (f"{status}: {args.goal} {variable.format(value)}, lowest BANK {bank.min():.2f}, final BANK {bank[-1]:.2f}")
+	print (f"{kernel.evaluations} evaluations, {solve_time*1000:.1f} ms")
+
+
+
+if __name__ == '__main__':
+	run()
@@ -0,0 +1,201 @@
+import io
+import os
+import csv
+import copy
+import json
+import time
+import pickle
+import argparse
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from run import Plan, PlanError, Config
+from month_calendar import to_date
+
+
+
+# Parameter sweep over a base project.
+#
+# The grid is a json file, every key is optional:
+#
+#   {
+#     "birth_shifts":    {"<child name>": [-12, 0, 12]},       months
+#     "childcare_costs": {"<table name>": {"DAYCARE": 2500}},  over the child rules
+#     "mortgage":        ["mortgage.csv", "mortgage_20y.csv"], files of input_files/, the tracks are kept
+#     "initial_saving":  [50000, 150000]
+#   }
+#
+# The base project is read and built once. A worker walks its share of the
+# grid in order and applies every scenario to the plan of the previous one
+# with Plan.apply_inputs: only the events of the rows that differ are
+# replaced, only the children they affect are derived again, and BANK is
+# accumulated again from the first month that changed. The grid is ordered
+# so that the parameters that are slow to apply (a childcare table derives
+# every child again) change the least often.
+
+
+class Sweep:
+	""" the base plan, its parsed inputs and the dimensions of the grid """
+
+	def __init__(self, proj_dir, grid):
+		self.plan = Plan(proj_dir)
+		self.plan.build()
+
+		plan = self.plan
+		self.config = plan.config
+		self.date_rows = dict(plan.read_date_events(plan.input_file('date_events.csv')))
+		self.mortgage_rows = dict(plan.read_mortgage_inputs())
+		self.persons = plan.read_persons(plan.input_file('persons.csv'))
+		self.age_event_rows = {person_type: plan.read_age_events(plan.input_file(person_type + ".csv")) for person_type in {person.type for person in self.persons}}
+		self.dimensions = self.read_grid(grid)
+
+	def read_grid(self, grid):
+		""" [(column name, [(label, value), ...]), ...], slowest to apply first """
+
+		plan = self.plan
+		dimensions = list()
+
+		tables = grid.get('childcare_costs', {})
+		if tables:
+			values = list()
+			for table_name, costs in tables.items():
+				table = dict(costs)
+				for childcare_name in costs:
+					if childcare_name not in plan.child_rules.categories_of("childcare"):
+						raise PlanError(f"Unknown childcare type {childcare_name} in table {table_name}")
+				values.append((table_name, table))
+			dimensions.append(('CHILDCARE_COSTS', values))
+
+		child_names = {person.name for person in self.persons if person.type == "child"}
+		for child_name, shifts in grid.get('birth_shifts', {}).items():
+			if child_name not in child_names:
+				raise PlanError(f"No child named {child_name} in persons.csv")
+			dimensions.append((f"BIRTH_SHIFT {child_name}", [(shift, shift) for shift in shifts]))
+
+		schedules = grid.get('mortgage', [])
+		if schedules:
+			track_rows = plan.read_mortgage_runs()
+			dimensions.append(('MORTGAGE', [(file_name, dict(plan.read_mortgage(plan.input_file(file_name)) + track_rows)) for file_name in schedules]))
+
+		savings = grid.get('initial_saving', [])
+		if savings:
+			dimensions.append(('INITIAL_SAVING', [(saving, saving) for saving in savings]))
+
+		return dimensions
+
+	def scenarios(self):
+		""" (labels, values) of every scenario, the last dimension changes the fastest """
+		for combination in itertools.product(*[values for __, values in self.dimensions]):
+			yield tuple(label for label, __ in combination), tuple(value for __, value in combination)
+
+	def apply(self, plan, values):
+		""" apply a scenario to a plan built from the base, return the number of changed sources """
+
+		config = copy.copy(self.config)
+		persons = self.persons
+		mortgage_rows = self.mortgage_rows
+		table = Plan.childcare_costs
+
+		for (name, __), value in zip(self.dimensions, values):
+			if name == 'CHILDCARE_COSTS':
+				table = value
+			elif name == 'MORTGAGE':
+				mortgage_rows = value
+			elif name == 'INITIAL_SAVING':
+				config.initial_saving = value
+			else:
+				child_name = name.split(' ', 1)[1]
+				persons = [person.shifted(value) if person.type == "child" and person.name == child_name else person for person in persons]
+
+		rederive_all = table != plan.childcare_costs
+		plan.childcare_costs = table
+
+		return plan.apply_inputs(config, self.date_rows, mortgage_rows, persons, self.age_event_rows, rederive_all)
+
+
+def scenario_result(plan, labels, changed, wall_time):
+	""" result row of the scenario the plan was last updated to """
+
+	rows, bank = plan.bank_series()
+	if not bank:
+		return list(labels) + ["", "", "", changed, round(wall_time*1000, 3)]
+
+	lowest = min(range(len(bank)), key=bank.__getitem__)
+	lowest_date = to_date(plan.ledger.first_month + rows[lowest])
+
+	return list(labels) + [round(bank[-1], 2), round(bank[lowest], 2), lowest_date.strftime(Config.format_str), changed, round(wall_time*1000, 3)]
+
+
+# the sweep a worker process was started with, its plan follows the scenarios of the worker
+worker_sweep = None
+
+def init_worker(sweep_bytes):
+	global worker_sweep
+	worker_sweep = pickle.loads(sweep_bytes)
+
+
+def run_scenarios(scenarios, sweep=None):
+	""" result rows of consecutive scenarios, every one applied to the plan of the one before """
+
+	sweep = sweep or worker_sweep
+	results = list()
+	with contextlib.redirect_stdout(io.StringIO()):
+		for labels, values in scenarios:
+			start_time = time.perf_counter()
+			changed = sweep.apply(sweep.plan, values)
+			results.append(scenario_result(sweep.plan, labels, changed, time.perf_counter() - start_time))
+	return results
+
+
+def run_sweep(sweep, jobs=1):
+	""" result rows of every scenario, in grid order """
+
+	scenarios = list(sweep.scenarios())
+	if jobs <= 1 or len(scenarios) <= 1:
+		return run_scenarios(scenarios, sweep)
+
+	chunk_size = -(-len(scenarios) // jobs)
+	chunks = [scenarios[i:i + chunk_size] for i in range(0, len(scenarios), chunk_size)]
+
+	sweep_bytes = pickle.dumps(sweep, pickle.HIGHEST_PROTOCOL)
+	with ProcessPoolExecutor(max_workers=len(chunks), initializer=init_worker, initargs=(sweep_bytes,)) as executor:
+		return [result for results in executor.map(run_scenarios, chunks) for result in results]
+
+
+def write_results(csv_file_name, sweep, results):
+	with open(csv_file_name, 'w', newline='') as csvfile:
+		writer = csv.writer(csvfile)
+		writer.writerow([name for name, __ in sweep.dimensions] + ['FINAL_BANK', 'MIN_BANK', 'MIN_BANK_DATE', 'CHANGED_SOURCES', 'WALL_MS'])
+		for result in results:
+			writer.writerow(result)
+
+
+def run():
+
+	parser = argparse.ArgumentParser(description="Run a grid of scenarios over a base project")
+	parser.add_argument('proj_dir')
+	parser.add_argument('grid', help="json file of the parameter grid")
+	parser.add_argument('--jobs', type=int, default=1, help="worker processes")
+	parser.add_argument('--out', help="result table (default <proj_dir>/sweep.csv)")
+	args = parser.parse_args()
+
+	start_time = time.perf_counter()
+
+	try:
+		with open(args.grid) as grid_file:
+			grid = json.load(grid_file)
+		with contextlib.redirect_stdout(io.StringIO()):
+			sweep = Sweep(args.proj_dir, grid)
+		build_time = time.perf_counter() - start_time
+		results = run_sweep(sweep, args.jobs)
+	except PlanError as error:
+		print (error)
+		exit(1)
+
+	write_results(args.out or os.path.join(args.proj_dir, 'sweep.csv'), sweep, results)
+	print (f"{len(results)} scenarios, base built in {build_time:.3f}s, {time.perf_counter() - start_time:.3f}s")
+
+
+
+if __name__ == '__main__':
+	run()
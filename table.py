@@ -0,0 +1,189 @@
+import csv
+import numpy as np
+from datetime import datetime
+
+
+
+# Input csv files as columns.
+#
+# A file is read in one pass into a column per header name (numpy object
+# arrays of str) and the line of every row in the file, for the errors.
+# Filling and parsing work on whole columns: the empty cells of a column take
+# the value above them with a running maximum of indices, and a column is
+# parsed once per distinct string. Dates in dd/mm/yyyy (the input format) are
+# parsed all at once from their characters, other strings with strptime.
+# The parsers return a mask of the bad cells instead of raising, so a file
+# reports all of its errors together.
+
+DATE_FORMAT = '%d/%m/%Y'
+MAX_ERRORS = 50 # reported of a file, the rest are counted
+
+
+class Table:
+	""" the columns of a csv file by header name, and the line in the file of every row """
+
+	def __init__(self, header, columns, lines):
+		self.header = list(header)
+		self.columns = dict(zip(self.header, columns))
+		self.lines = np.asarray(lines, dtype=int)
+
+	@classmethod
+	def read(cls, csv_file_name):
+		""" blank lines are skipped, short rows are padded with empty cells """
+		with open(csv_file_name) as csv_file:
+			reader = csv.reader(csv_file)
+			header = next(reader, [])
+			rows = list()
+			lines = list()
+			for row in reader:
+				if not row:
+					continue
+				if len(row) != len(header):
+					row = (row + [''] * len(header))[:len(header)]
+				rows.append(row)
+				lines.append(reader.line_num)
+		return cls(header, columns_of(rows, len(header)), lines)
+
+	@classmethod
+	def of_rows(cls, csv_rows):
+		""" table of csv.DictReader rows or Rows, the lines of Rows are kept, the others are numbered as if they were read from a file """
+		header = list(csv_rows[0]) if csv_rows else []
+		rows = [['' if row.get(name) is None else row[name] for name in header] for row in csv_rows]
+		return cls(header, columns_of(rows, len(header)), [getattr(row, 'line', line) for line, row in enumerate(csv_rows, 2)])
+
+	def __len__(self):
+		return len(self.lines)
+
+	def __getitem__(self, name):
+		return self.columns[name]
+
+	def missing(self, names):
+		return [name for name in names if name not in self.columns]
+
+	def add_empty(self, names):
+		""" empty columns of the names it has not, for a table without rows """
+		for name in self.missing(names):
+			self.header.append(name)
+			self.columns[name] = np.empty(len(self), dtype=object)
+
+	def select(self, mask):
+		return Table(self.header, [self.columns[name][mask] for name in self.header], self.lines[mask])
+
+	def fill_forward(self, name):
+		""" empty cells take the last value above them, the first ones stay empty """
+		column = self.columns[name]
+		filled = np.flatnonzero(column != '')
+		if len(filled) and len(filled) < len(column):
+			above = np.full(len(column), -1)
+			above[filled] = filled
+			above = np.maximum.accumulate(above)
+			self.columns[name] = np.where(above >= 0, column[np.maximum(above, 0)], '')
+
+	def fill_default(self, name, value):
+		column = self.columns[name]
+		self.columns[name] = np.where(column == '', value, column)
+
+	def rows(self):
+		""" the rows as dicts, like csv.DictReader, that know their lines """
+		columns = [self.columns[name].tolist() for name in self.header]
+		return [Row(zip(self.header, row), line) for row, line in zip(zip(*columns), self.lines.tolist())]
+
+
+class Row(dict):
+	""" a row of a table and its line in the file, for the errors of a row parsed again on its own """
+
+	def __init__(self, items, line):
+		super().__init__(items)
+		self.line = line
+
+
+def columns_of(rows, n_columns):
+	columns = [np.empty(len(rows), dtype=object) for __ in range(n_columns)]
+	for column, values in zip(columns, zip(*rows)):
+		column[:] = values
+	return columns
+
+
+def parse_distinct(column, parse, errors=(ValueError,)):
+	""" parse(value) of every distinct value of a column, (values, bad mask), a value is 0 where parse raised one of errors """
+	distinct, inverse = np.unique(column.astype(str), return_inverse=True)
+	values = np.zeros(len(distinct), dtype=object)
+	bad = np.zeros(len(distinct), dtype=bool)
+	for i, value in enumerate(distinct.tolist()):
+		try:
+			values[i] = parse(value)
+		except errors:
+			bad[i] = True
+	return values[inverse], bad[inverse]
+
+
+def parse_ints(column):
+	values, bad = parse_distinct(column, int)
+	return values.astype(np.int64), bad
+
+
+def parse_floats(column):
+	values, bad = parse_distinct(column, float)
+	return values.astype(float), bad
+
+
+def parse_dates(column, format_str=DATE_FORMAT):
+	""" (years, months, days) int arrays of a column of dates and the bad mask, 0 on bad dates """
+
+	distinct, inverse = np.unique(column.astype(str), return_inverse=True)
+	dates = np.zeros((len(distinct), 3), dtype=np.int64)
+	bad = np.ones(len(distinct), dtype=bool)
+
+	# dd/mm/yyyy from the characters of the strings
+	fixed = np.zeros(len(distinct), dtype=bool)
+	if format_str == DATE_FORMAT and len(distinct):
+		fixed = np.char.str_len(distinct) == 10
+		chars = np.frombuffer(distinct[fixed].astype('U10').tobytes(), dtype=np.uint32).reshape(-1, 10).astype(np.int64)
+		digits = chars - ord('0')
+		shape_ok = (chars[:, 2] == ord('/')) & (chars[:, 5] == ord('/')) & ((digits[:, [0, 1, 3, 4, 6, 7, 8, 9]] >= 0) & (digits[:, [0, 1, 3, 4, 6, 7, 8, 9]] <= 9)).all(axis=1)
+		days = digits[:, 0]*10 + digits[:, 1]
+		months = digits[:, 3]*10 + digits[:, 4]
+		years = digits[:, 6]*1000 + digits[:, 7]*100 + digits[:, 8]*10 + digits[:, 9]
+		month_ok = shape_ok & (months >= 1) & (months <= 12) & (years >= 1)
+		first_days = ((years - 1970)*12 + np.where(month_ok, months, 1) - 1).astype('datetime64[M]')
+		month_days = ((first_days + 1).astype('datetime64[D]') - first_days.astype('datetime64[D]')).astype(np.int64)
+		ok = month_ok & (days >= 1) & (days <= month_days)
+		dates[fixed] = np.where(ok[:, None], np.column_stack([years, months, days]), 0)
+		bad[fixed] = ~ok
+		fixed[fixed] = ok # the rest goes through strptime for its message
+
+	for i in np.flatnonzero(~fixed):
+		try:
+			date_obj = datetime.strptime(distinct[i], format_str)
+		except ValueError:
+			continue
+		dates[i] = date_obj.year, date_obj.month, date_obj.day
+		bad[i] = False
+
+	dates = dates[inverse]
+	return dates[:, 0], dates[:, 1], dates[:, 2], bad[inverse]
+
+
+class TableErrors:
+	""" the bad cells of a file, by line """
+
+	def __init__(self, file_name):
+		self.file_name = file_name
+		self.errors = list()
+
+	def add(self, table, mask, message):
+		""" message on every row of a mask """
+		self.errors.extend((line, message) for line in table.lines[mask].tolist())
+
+	def add_cells(self, table, mask, column, message):
+		self.errors.extend((line, f"{message} {value!r}") for line, value in zip(table.lines[mask].tolist(), table[column][mask].tolist()))
+
+	def __bool__(self):
+		return bool(self.errors)
+
+	def __str__(self):
+		errors = sorted(self.errors, key=lambda error: error[0])
+		lines = [f"{self.file_name} line {line}: {message}" for line, message in errors[:MAX_ERRORS]]
+		if len(errors) > MAX_ERRORS:
+			lines.append(f"... and {len(errors) - MAX_ERRORS} more")
+		return '\n'.join(lines)
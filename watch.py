@@ -0,0 +1,116 @@
+import os
+import time
+import configparser
+from run import Config
+from errors import PlanError
+
+
+
+# Watch mode of run.py.
+#
+# The input files (input_files/*.csv and config.ini) are polled with a stat
+# of each, no dependencies and no inotify, a few files cost microseconds. A
+# burst of saves is applied once, after the files stay the same for DEBOUNCE
+# seconds. Only the changed files are parsed again, the parsed rows of the
+# others are kept, and Plan.apply_inputs replaces only the events of the rows
+# that differ and derives only the children they affect. The outputs are
+# written to temporary files and renamed over the old ones, so graph.py
+# --follow and editors never read a half written cash_flow.
+
+POLL_INTERVAL = 0.2 # seconds between two polls
+DEBOUNCE = 0.3      # seconds the files stay the same after a change
+MORTGAGE_FILES = ('mortgage.csv', 'mortgage_tracks.csv', 'mortgage_changes.csv') # parsed together as mortgage.csv
+
+
+def input_stamps(proj_dir):
+	""" file name / (modification time, size) of every input file """
+	stamps = dict()
+	for entry in os.scandir(os.path.join(proj_dir, 'input_files')):
+		if entry.name.endswith('.csv') or entry.name == 'config.ini':
+			stat = entry.stat()
+			stamps[entry.name] = (stat.st_mtime_ns, stat.st_size)
+	return stamps
+
+
+class Watcher:
+	""" a built plan and the parsed rows of the input files it was built from """
+
+	def __init__(self, plan):
+		self.plan = plan
+		self.stamps = input_stamps(plan.config.proj_dir)
+		self.parsed = dict() # file name / parsed rows, read on first use
+
+	def parse(self, file_name):
+		if file_name not in self.parsed:
+			plan = self.plan
+			csv_file_name = plan.input_file(file_name)
+			if file_name == 'date_events.csv':
+				self.parsed[file_name] = plan.read_date_events(csv_file_name)
+			elif file_name == 'persons.csv':
+				self.parsed[file_name] = plan.read_persons(csv_file_name)
+			elif file_name == 'mortgage.csv':
+				self.parsed[file_name] = plan.read_mortgage_inputs()
+			else:
+				self.parsed[file_name] = plan.read_age_events(csv_file_name)
+		return self.parsed[file_name]
+
+	def wait(self):
+		""" stamps of the input files after the next burst of changes """
+		proj_dir = self.plan.config.proj_dir
+
+		stamps = self.stamps
+		while stamps == self.stamps:
+			time.sleep(POLL_INTERVAL)
+			stamps = input_stamps(proj_dir)
+
+		while True:
+			time.sleep(DEBOUNCE)
+			settled = input_stamps(proj_dir)
+			if settled == stamps:
+				return stamps
+			stamps = settled
+
+	def apply(self, stamps):
+		""" apply the files that changed since the last stamps, return the changed file names and sources """
+
+		changed = sorted(file_name for file_name in stamps.keys() | self.stamps.keys() if stamps.get(file_name) != self.stamps.get(file_name))
+		for file_name in changed:
+			self.parsed.pop('mortgage.csv' if file_name in MORTGAGE_FILES else file_name, None)
+		self.stamps = stamps # bad input is reported once, and parsed again on its next save
+
+		plan = self.plan
+		config = Config(plan.config.proj_dir) if 'config.ini' in changed else plan.config
+
+		if (config.start_date, config.end_date) != (plan.config.start_date, plan.config.end_date):
+			self.parsed.clear()
+			plan.reset(config)
+			plan.build()
+			return changed, len(plan.sources)
+
+		persons = self.parse('persons.csv')
+		age_event_rows = {person_type: self.parse(person_type + '.csv') for person_type in {person.type for person in persons}}
+		child_rules = plan.read_child_rules() if 'child_rules.csv' in changed else None
+		return changed, plan.apply_inputs(config, self.parse('date_events.csv'), self.parse('mortgage.csv'), persons, age_event_rows, child_rules=child_rules)
+
+
+def watch_plan(plan, save_state=False):
+	""" apply every change of the input files to a built plan and write it, until interrupted """
+
+	watcher = Watcher(plan)
+	print (f"watching {plan.input_file('')}")
+
+	try:
+		while True:
+			stamps = watcher.wait()
+			start_time = time.perf_counter()
+			try:
+				changed, n_sources = watcher.apply(stamps)
+				plan.write_cash_flow(plan.config.proj_dir + '/cash_flow.csv')
+			except (PlanError, ValueError, TypeError, KeyError, OSError, configparser.Error) as error:
+				print (f"{type(error).__name__}: {error}")
+				continue
+			if save_state:
+				plan.save_state()
+			print (f"{', '.join(changed)}: {n_sources} sources changed, {(time.perf_counter() - start_time)*1000:.1f} ms")
+	except KeyboardInterrupt:
+		pass